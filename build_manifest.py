@@ -0,0 +1,139 @@
+# 内容寻址的构建清单（make 式增量重建）：
+# 1. 每个产物在同目录的 .build/<产物文件名>.json 中记录：各输入文件的 sha256、影响产物的参数、构建时间
+# 2. 输入内容或参数变化时产物过期；只修改时间变化（touch、复制）但内容未变时仍视为最新
+# 3. 输入的 sha256 按 (大小, mtime) 缓存在记录中，未变化的大文件（视频）不会重复计算哈希
+# 4. 产物本身只检查是否存在：手工修改产物（例如校对后的译文）不会触发重建，而会让下游产物过期
+# 5. 没有记录但已存在的产物（引入清单之前生成的）若比所有输入都新，则按 make 规则直接采用并补写记录
+# 6. 每个产物一个记录文件，不同进程并行构建不同产物时互不影响；输入路径相对产物目录保存，共享目录挂载到不同路径时仍有效
+#
+# srt_translator.py、srt_tts.py、video_blender.py 与 video_pipeline.py 通过 stale_reason()/record_build() 判断并记录产物
+
+import os
+import json
+import shutil
+import hashlib
+import datetime
+
+BUILD_DIR = ".build"
+
+def record_path(output):
+    directory, name = os.path.split(os.path.abspath(output))
+    return os.path.join(directory, BUILD_DIR, f"{name}.json")
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+def _stamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime]
+
+def _normalize(params):
+    """参数转换为 JSON 可比较的形式（元组变为列表，字典键排序）"""
+    return json.loads(json.dumps(params or {}, sort_keys=True, ensure_ascii=False, default=str))
+
+def _input_key(output, path):
+    return os.path.relpath(os.path.abspath(path), os.path.dirname(os.path.abspath(output)))
+
+def load_record(output):
+    try:
+        with open(record_path(output), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _save_record(output, record):
+    path = record_path(output)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
+
+def _input_entries(output, inputs, previous=None):
+    """计算输入哈希；大小与 mtime 未变的输入复用上次记录的哈希"""
+    previous = previous or {}
+    entries = {}
+    for path in inputs:
+        key = _input_key(output, path)
+        stamp = _stamp(path)
+        cached = previous.get(key)
+        digest = cached["sha256"] if cached and cached.get("stamp") == stamp else file_hash(path)
+        entries[key] = {"sha256": digest, "stamp": stamp}
+    return entries
+
+def stale_reason(output, inputs, params=None):
+    """产物为最新时返回 None，否则返回需要重建的原因"""
+    inputs = [path for path in inputs if path]
+    if not os.path.exists(output):
+        return "产物不存在"
+    missing = [path for path in inputs if not os.path.exists(path)]
+    if missing:
+        return f"缺少输入 {os.path.basename(missing[0])}"
+
+    record = load_record(output)
+    if record is None:
+        # 清单引入之前生成的产物：比所有输入都新时直接采用
+        output_mtime = os.path.getmtime(output)
+        if all(os.path.getmtime(path) <= output_mtime for path in inputs):
+            record_build(output, inputs, params)
+            return None
+        return "没有构建记录且输入比产物新"
+    if record.get("invalid"):
+        return "已标记为需要重建"
+
+    if record.get("params") != _normalize(params):
+        changed = sorted(key for key in set(record.get("params", {})) | set(_normalize(params))
+                         if record.get("params", {}).get(key) != _normalize(params).get(key))
+        return f"参数变化 {', '.join(changed)}"
+    previous = record.get("inputs", {})
+    if set(previous) != {_input_key(output, path) for path in inputs}:
+        return "输入文件列表变化"
+    current = _input_entries(output, inputs, previous)
+    for key, entry in current.items():
+        if entry["sha256"] != previous[key]["sha256"]:
+            return f"输入内容变化 {os.path.basename(key)}"
+    if any(entry["stamp"] != previous[key].get("stamp") for key, entry in current.items()):
+        # 内容未变但 mtime 变化：更新记录，下次不再重新计算哈希
+        record["inputs"] = current
+        _save_record(output, record)
+    return None
+
+def is_current(output, inputs, params=None):
+    return stale_reason(output, inputs, params) is None
+
+def record_build(output, inputs, params=None):
+    """产物构建成功后记录输入哈希与参数"""
+    inputs = [path for path in inputs if path]
+    previous = (load_record(output) or {}).get("inputs")
+    _save_record(output, {
+        "built": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "inputs": _input_entries(output, inputs, previous),
+        "params": _normalize(params),
+    })
+
+def copy_artifact(source, output):
+    """把 output 作为 source 的副本产物维护（如原文字幕备份 _en.srt）：
+    不存在或 source 内容变化时重新复制并记录，返回原因；已是最新时返回 None"""
+    reason = stale_reason(output, [source])
+    if reason is None:
+        return None
+    temp_path = f"{output}.{os.getpid()}.tmp"
+    shutil.copy2(source, temp_path)
+    os.replace(temp_path, output)
+    record_build(output, [source])
+    return reason
+
+def invalidate(output):
+    """标记产物需要重建（--force），下次构建成功后由 record_build() 覆盖"""
+    _save_record(output, {"invalid": True})
+
+def forget(output):
+    """删除产物的构建记录（产物被移走或改名时）"""
+    try:
+        os.remove(record_path(output))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,104 @@
+# 分段并行编码：
+# 1. 读取关键帧时间（只读包信息，不解码），将视频按关键帧切成 N 个时间段
+# 2. 每个时间段由独立的 ffmpeg 进程完成滤镜+编码（只处理视频，不含音频）
+# 3. 各段用 concat 分离器无损拼接，音频在拼接时对整个文件只处理一次
+# 4. 输出先写入临时文件，成功后原子替换为目标文件
+#
+# video_blender.py 与 video_resize.py 通过 encode_in_chunks() 使用
+
+import os
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from ffmpeg_runner import run_ffmpeg
+
+def probe_duration(video_path):
+    result = subprocess.run([
+        "ffprobe", "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "csv=p=0",
+        video_path
+    ], stdout=subprocess.PIPE, text=True)
+    try:
+        return float(result.stdout.strip())
+    except ValueError:
+        return None
+
+def probe_keyframes(video_path):
+    """返回第一个视频流所有关键帧的时间（秒）"""
+    result = subprocess.run([
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        video_path
+    ], check=True, stdout=subprocess.PIPE, text=True)
+    times = []
+    for line in result.stdout.splitlines():
+        parts = line.strip().split(",")
+        if len(parts) >= 2 and "K" in parts[1] and parts[0] not in ("", "N/A"):
+            times.append(float(parts[0]))
+    return sorted(times)
+
+def plan_chunks(video_path, count, min_seconds=10):
+    """按关键帧把视频切成约 count 个等长时间段，返回 [(start, end), ...]，最后一段 end 为 None"""
+    duration = probe_duration(video_path)
+    if not duration or count <= 1:
+        return [(0.0, None)]
+    count = max(1, min(count, int(duration // min_seconds)))
+    keyframes = probe_keyframes(video_path)
+    cuts = []
+    for i in range(1, count):
+        target = duration * i / count
+        # 取目标时间之后最近的关键帧，分段从关键帧开始解码，不需要回溯
+        later = [t for t in keyframes if t >= target and (not cuts or t > cuts[-1])]
+        if later and later[0] < duration:
+            cuts.append(later[0])
+    bounds = [0.0] + cuts
+    return [(start, bounds[i + 1] if i + 1 < len(bounds) else None) for i, start in enumerate(bounds)]
+
+def concat_input(list_path):
+    """concat 分离器输入参数（列表中为绝对路径）"""
+    return ["-f", "concat", "-safe", "0", "-i", list_path]
+
+def chunk_workers(workers=None):
+    return workers or os.cpu_count() or 1
+
+def encode_in_chunks(source, output, chunks, build_chunk_command, build_concat_command, workers=None, verbose=True):
+    """并行编码各时间段并拼接
+
+    build_chunk_command(start, end, chunk_path) 返回编码单个时间段（仅视频）的命令；
+    build_concat_command(list_path, output_path) 返回读取 concat 列表、复制视频流并处理音频的命令。
+    """
+    output_dir = os.path.dirname(os.path.abspath(output))
+    work_dir = tempfile.mkdtemp(prefix=".chunks_", dir=output_dir)
+    try:
+        ext = os.path.splitext(output)[1] or ".mp4"
+        chunk_paths = [os.path.join(work_dir, f"chunk_{i:04d}{ext}") for i in range(len(chunks))]
+        commands = [build_chunk_command(start, end, path) for (start, end), path in zip(chunks, chunk_paths)]
+        if verbose:
+            print(f"分段并行编码: {len(chunks)} 段，{min(len(chunks), chunk_workers(workers))} 个进程 -> {output}")
+
+        total = probe_duration(source)
+
+        def run(index):
+            start, end = chunks[index]
+            end = end if end is not None else total
+            return run_ffmpeg(commands[index], step="chunk", source=source, duration=end - start if end else None)
+
+        with ThreadPoolExecutor(max_workers=min(len(chunks), chunk_workers(workers))) as executor:
+            list(executor.map(run, range(len(commands))))
+
+        list_path = os.path.join(work_dir, "concat.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for path in chunk_paths:
+                escaped = path.replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+
+        temp_output = os.path.join(work_dir, f"output{ext}")
+        run_ffmpeg(build_concat_command(list_path, temp_output), step="concat", source=source, output=output)
+        os.replace(temp_output, output)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
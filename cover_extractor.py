@@ -1,17 +1,29 @@
 import subprocess
 import sys
 import os
+import json
+import time
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import ffmpeg_runner
+from job_queue import enqueue_invocation
+
+MANIFEST_FILENAME = ".cover_manifest.json"
+# 可直接复制原始字节并由 PIL 解码的封面编码；未探测编码的流（如 -m 指定的视频流）仍转为PNG
+STREAM_COPY_CODECS = ("mjpeg", "png", "bmp", "webp")
 
 def extract_cover(video_path, output_path, map_param=None, detect_map=False, resize=False, min_size=(1280, 720), verbose=False):
     """
     提取视频封面（优先用户指定流，否则尝试附件流 -> 第一帧回退）
     """
     # 如果启用了 detect_map，则忽略 map_param 并探测 map
+    cover_codec = None
     if detect_map:
-        detected_map = detect_cover_map(video_path, verbose)
-        if detected_map:
-            map_param = detected_map
+        cover = probe_cover_stream(video_path, verbose)
+        if cover:
+            map_param = cover["map"]
+            cover_codec = cover["codec"]
 
     # 优先使用用户指定的流
     if map_param:
@@ -25,44 +37,36 @@ def extract_cover(video_path, output_path, map_param=None, detect_map=False, res
             "-vframes", "1",
         ]
         if resize:
-            cmd += ["-f", "image2pipe", "-vcodec", "png", "-"]  # 输出到stdout
+            if cover_codec in STREAM_COPY_CODECS:
+                cmd += ["-c", "copy", "-f", "image2pipe", "-"]  # 原始封面字节直接输出到stdout
+            else:
+                cmd += ["-f", "image2pipe", "-vcodec", "png", "-"]  # PIL 无法直接解码的流才转为PNG
             try:
                 # 捕获FFmpeg输出到内存
-                result = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                
-                # 使用PIL处理图像
-                from PIL import Image
-                import io
-                
-                img = Image.open(io.BytesIO(result.stdout))
-                
-                # 计算缩放尺寸
-                width, height = img.size
-                target_width = max(width, min_size[0])
-                target_height = max(height, min_size[1])
-                
-                # 保持宽高比
-                ratio = min(target_width/width, target_height/height)
-                new_width = int(width * ratio)
-                new_height = int(height * ratio)
-                
-                # 使用LANCZOS重采样
-                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                img.save(output_path, "JPEG", quality=95)
+                result = ffmpeg_runner.run_ffmpeg(cmd, step="cover", source=video_path, output=output_path,
+                                                  capture_stdout=True)
+                save_resized_cover(result.stdout, output_path, min_size)
                 return True
-            except subprocess.CalledProcessError as e:
+            except subprocess.SubprocessError as e:
+                if verbose:
+                    print(f"封面提取失败（指定流模式）: {e}")
+                return False
+            except OSError as e:
                 if verbose:
-                    print(f"封面提取失败（指定流模式）: {e.stderr.decode()}")
+                    print(f"封面解码失败（指定流模式）: {e}")
                 return False
         else:
-            cmd += ["-c", "copy"]
+            if cover_codec in (None, "mjpeg"):
+                cmd += ["-c", "copy"]
+            else:
+                cmd += ["-q:v", "2"]  # PNG 等非 JPEG 封面需转码为 JPEG
             cmd.append(output_path)
         try:
-            subprocess.run(cmd, check=True, stderr=subprocess.PIPE)
+            ffmpeg_runner.run_ffmpeg(cmd, step="cover")
             return True
-        except subprocess.CalledProcessError as e:
+        except subprocess.SubprocessError as e:
             if verbose:
-                print(f"封面提取失败（指定流模式）: {e.stderr.decode()}")
+                print(f"封面提取失败（指定流模式）: {e}")
             return False
 
     # 未指定流时：仅尝试附件流，不再回退到第一帧
@@ -80,63 +84,177 @@ def extract_cover(video_path, output_path, map_param=None, detect_map=False, res
             "-vframes", "1",
             output_path
         ]
-        subprocess.run(cmd_attach, check=True, stderr=subprocess.PIPE)
+        ffmpeg_runner.run_ffmpeg(cmd_attach, step="cover")
         return True
-    except subprocess.CalledProcessError as e:
+    except subprocess.SubprocessError as e:
         if verbose:
-            print(f"封面提取失败（附件流模式）: {e.stderr.decode()}")
+            print(f"封面提取失败（附件流模式）: {e}")
         return False
 
-def detect_cover_map(video_path, verbose=False):
+def save_resized_cover(data, output_path, min_size):
     """
-    探测视频封面所在的 map
+    在进程内解码封面并按最小尺寸等比放大；已满足尺寸的 JPEG 原样写出，不重新编码
     """
-    try:
-        # 获取附件流信息
-        info_cmd = [
-            "ffmpeg",
-            "-hide_banner",
-            "-i", video_path,
-            # "-map", "0:t",  # 所有附件流
-            "-c", "copy",
-            "-f", "null",
-            "-"
-        ]
-        # print("执行命令:", " ".join(info_cmd))  # 输出命令
-        result = subprocess.run(info_cmd, stderr=subprocess.PIPE, stdout=subprocess.PIPE, check=True)
-        attachment_streams = result.stderr.decode().splitlines()
-        # print(f"附件流信息：{attachment_streams}")
-
-        # 遍历附件流，寻找可用的封面流
-        for line in attachment_streams:
-            if "Stream #0:" in line and "Video" in line and "(attached pic)" in line and "Subtitle" not in line: # "(attached pic)" 可能是ytb特有的
-                stream_index = line.split("Stream #0:")[1].split(":")[0].split("[")[0]
-                # 检查流的编码格式是否为 mjpeg
-                if "mjpeg" in line.lower():
-                    return f"0:{stream_index}"
+    from PIL import Image
+    import io
+
+    # Image.open 只读取文件头，尺寸判断不需要解码像素
+    img = Image.open(io.BytesIO(data))
+
+    # 计算缩放尺寸
+    width, height = img.size
+    target_width = max(width, min_size[0])
+    target_height = max(height, min_size[1])
+
+    # 保持宽高比
+    ratio = min(target_width/width, target_height/height)
+    if ratio <= 1 and img.format == "JPEG":
+        with open(output_path, "wb") as f:
+            f.write(data)
+        return
+
+    img = img.convert("RGB")
+    if ratio > 1:
+        # 使用LANCZOS重采样
+        img = img.resize((int(width * ratio), int(height * ratio)), Image.Resampling.LANCZOS)
+    img.save(output_path, "JPEG", quality=95)
 
+def probe_cover_stream(video_path, verbose=False):
+    """
+    只读取容器头信息（ffprobe -show_streams），返回封面流的 index、codec、宽高；优先 mjpeg
+    """
+    try:
+        result = subprocess.run([
+            "ffprobe",
+            "-v", "error",
+            "-show_streams",
+            "-of", "json",
+            video_path
+        ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        streams = json.loads(result.stdout.decode("utf-8", errors="replace")).get("streams", [])
     except subprocess.CalledProcessError as e:
         if verbose:
             print(f"封面流探测失败: {e.stderr.decode()}")
-        else:
+        return None
+    except ValueError as e:
+        if verbose:
+            print(f"封面流探测失败: {e}")
+        return None
+
+    # "(attached pic)" 即 disposition.attached_pic，可能是ytb特有的
+    covers = [stream for stream in streams
+              if stream.get("codec_type") == "video" and stream.get("disposition", {}).get("attached_pic")]
+    if not covers:
+        if verbose:
             print("警告：未找到可用的封面流")
+        return None
+    cover = next((stream for stream in covers if stream.get("codec_name") == "mjpeg"), covers[0])
+    return {
+        "index": cover["index"],
+        "map": f"0:{cover['index']}",
+        "codec": cover.get("codec_name"),
+        "width": cover.get("width"),
+        "height": cover.get("height"),
+    }
 
-def process_directory(input_dir, output_dir, map_param=None, detect_map=False, resize=False, min_size=(1280, 720), verbose=False):
-    """处理目录中的所有 MP4 文件"""
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+def detect_cover_map(video_path, verbose=False):
+    """
+    探测视频封面所在的 map
+    """
+    cover = probe_cover_stream(video_path, verbose)
+    return cover["map"] if cover else None
+
+def load_manifest(manifest_path):
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest_path, manifest):
+    temp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, manifest_path)
 
+def _extract_task(video_path, output_path, map_param, detect_map, resize, min_size, verbose):
+    """进程池任务：提取单个封面并返回 (是否成功, 耗时)"""
+    start = time.monotonic()
+    success = extract_cover(video_path, output_path, map_param, detect_map, resize, min_size, verbose)
+    return success, time.monotonic() - start
+
+def find_videos(input_dir):
+    """递归列出目录中的所有 MP4 文件"""
     for root, _, files in os.walk(input_dir):
         for file in files:
             if file.lower().endswith(".mp4"):
-                video_path = os.path.join(root, file)
-                base_name = os.path.splitext(file)[0]
-                output_path = os.path.join(output_dir, f"{base_name}.jpg")
+                yield os.path.join(root, file)
+
+def process_directory(input_dir, output_dir, map_param=None, detect_map=False, resize=False, min_size=(1280, 720), verbose=False,
+                      workers=None, force=False, videos=None):
+    """处理目录中的所有 MP4 文件（videos 指定时只处理这些文件，队列任务使用）
+
+    并行提取（进程数由 workers 限制）；清单按视频路径记录大小、修改时间和提取参数，
+    未变化且封面已存在的视频直接跳过，不启动 ffmpeg。
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
 
-                # 提取封面
-                success = extract_cover(video_path, output_path, map_param, detect_map, resize, min_size, verbose)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+    manifest = {} if force else load_manifest(manifest_path)
+    params = {"map": map_param, "detect_map": detect_map, "resize": resize, "min_size": list(min_size)}
+
+    tasks = []
+    skipped = 0
+    for video_path in (videos if videos is not None else find_videos(input_dir)):
+        file = os.path.basename(video_path)
+        base_name = os.path.splitext(file)[0]
+        output_path = os.path.join(output_dir, f"{base_name}.jpg")
+        stat = os.stat(video_path)
+        key = os.path.abspath(video_path)
+        entry = {"size": stat.st_size, "mtime": stat.st_mtime, "params": params, "output": output_path}
+        previous = manifest.get(key)
+        if previous and previous.get("ok") and {k: previous.get(k) for k in entry} == entry and os.path.exists(output_path):
+            skipped += 1
+            if verbose:
+                print(f"[跳过] {file}（未变化）")
+            continue
+        tasks.append((key, entry, video_path, output_path))
+
+    extracted = failed = 0
+    busy_seconds = 0.0
+    updates = {}
+    start = time.monotonic()
+    try:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            futures = {executor.submit(_extract_task, video_path, output_path, map_param, detect_map,
+                                       resize, min_size, verbose): (key, entry, video_path, output_path)
+                       for key, entry, video_path, output_path in tasks}
+            for future in as_completed(futures):
+                key, entry, video_path, output_path = futures[future]
+                try:
+                    success, elapsed = future.result()
+                except Exception as e:
+                    success, elapsed = False, 0.0
+                    if verbose:
+                        print(f"封面提取异常: {e}")
+                busy_seconds += elapsed
+                updates[key] = {**entry, "ok": success}
+                if success:
+                    extracted += 1
+                else:
+                    failed += 1
                 status = "成功" if success else "失败"
-                print(f"[{status}] {file} -> {os.path.basename(output_path)}")
+                print(f"[{status}] {os.path.basename(video_path)} -> {os.path.basename(output_path)}")
+    finally:
+        if updates:
+            # 保存前重新读取清单：多个队列任务同时处理同一输出目录时，只合并本次处理的视频
+            save_manifest(manifest_path, {**load_manifest(manifest_path), **updates})
+
+    wall = time.monotonic() - start
+    average = busy_seconds / len(tasks) if tasks else 0.0
+    print(f"封面提取完成：提取 {extracted}，跳过 {skipped}，失败 {failed}；总耗时 {wall:.1f} 秒，平均每个 {average:.2f} 秒")
+    return {"extracted": extracted, "skipped": skipped, "failed": failed, "seconds": wall}
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="批量提取 MP4 文件封面")
@@ -148,7 +266,19 @@ if __name__ == "__main__":
     parser.add_argument("--resize", action="store_true", help="启用封面图自动缩放（默认关闭）")
     parser.add_argument("--min_size", default="1920x1080", 
                        help="最小输出尺寸（格式：宽x高，默认：1920x1080）")
+    parser.add_argument("--workers", type=int, default=None, help="并行提取进程数（默认：CPU核心数）")
+    parser.add_argument("--force", action="store_true", help="忽略增量清单，重新提取所有封面")
+    parser.add_argument("--metrics_log", default=None, help="ffmpeg 运行指标日志路径（JSON Lines，记录耗时、CPU、内存）")
+    parser.add_argument("--ffmpeg_timeout", type=float, default=None, help="单次 ffmpeg 调用超时（秒，默认：不限制）")
+    parser.add_argument("--video", default=None, help="只处理指定的视频文件（队列任务使用）")
+    parser.add_argument("--enqueue", default=None, help="只把任务写入指定的队列数据库，由 job_queue.py --worker 执行（按视频拆分）")
     args = parser.parse_args()
+    if args.enqueue:
+        # 只入队：每个视频一个任务，启动更多 worker 即可并行提取
+        for video_path in ([args.video] if args.video else sorted(find_videos(args.input))):
+            enqueue_invocation(args.enqueue, "cover", __file__, sys.argv[1:], extra=["--video", os.path.abspath(video_path)])
+        sys.exit(0)
+    ffmpeg_runner.configure(args.metrics_log, args.ffmpeg_timeout)
     
     # Fix: Set default output directory to input directory when not provided
     if args.output is None:
@@ -160,4 +290,5 @@ if __name__ == "__main__":
         print(f"错误：无效的尺寸格式 - {args.min_size}")
         sys.exit(1)
 
-    process_directory(args.input, args.output, args.map, args.detect_map, args.resize, min_size, args.verbose)
\ No newline at end of file
+    process_directory(args.input, args.output, args.map, args.detect_map, args.resize, min_size, args.verbose,
+                      args.workers, args.force, [args.video] if args.video else None)
\ No newline at end of file
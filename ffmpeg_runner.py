@@ -0,0 +1,333 @@
+# 统一的 ffmpeg 运行器：
+# 1. 自动加上 -progress pipe:1，解析进度输出，定期打印 fps、速度倍率、进度百分比和预计剩余时间
+# 2. 记录每次调用的墙钟时间、CPU 时间（用户态/内核态）和峰值内存（POSIX 下通过 wait4 获取子进程资源占用）
+# 3. 支持超时与取消（单次调用的 cancel_event，或 cancel_all() 终止所有正在运行的 ffmpeg）
+# 4. 失败时抛出 FfmpegError（CalledProcessError 子类），错误信息只保留 stderr 的最后几行
+# 5. 每次调用的结果以 JSON Lines 追加到指标日志，便于定位哪个步骤、哪个文件最慢
+#
+# video_blender.py、video_resize.py、chunked_encode.py、cover_extractor.py 与 srt_tts.py 通过 run_ffmpeg() 调用 ffmpeg；
+# 指标日志路径与默认超时保存在环境变量中，进程池中的子进程也会继承
+
+import os
+import sys
+import json
+import time
+import signal
+import datetime
+import threading
+import subprocess
+
+METRICS_LOG_ENV = "FFMPEG_METRICS_LOG"
+TIMEOUT_ENV = "FFMPEG_TIMEOUT"
+PROGRESS_INTERVAL = 10  # 进度打印间隔（秒），短任务不打印
+
+_running = {}  # 进程 -> 取消事件
+_running_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+class FfmpegError(subprocess.CalledProcessError):
+    """ffmpeg 返回非零退出码；str() 只包含 stderr 的最后几行"""
+    def __str__(self):
+        stderr = self.stderr.decode(errors="replace") if isinstance(self.stderr, bytes) else (self.stderr or "")
+        tail = [line for line in stderr.strip().splitlines() if line.strip()][-3:]
+        message = f"ffmpeg 退出码 {self.returncode}"
+        return f"{message}: {' | '.join(tail)}" if tail else message
+
+class FfmpegCancelled(subprocess.SubprocessError):
+    """ffmpeg 被取消"""
+
+def configure(metrics_log=None, timeout=None):
+    """设置指标日志路径与默认超时（秒）；写入环境变量，之后启动的子进程同样生效"""
+    if metrics_log:
+        os.environ[METRICS_LOG_ENV] = os.path.abspath(metrics_log)
+    if timeout:
+        os.environ[TIMEOUT_ENV] = str(timeout)
+
+def cancel_all():
+    """终止所有正在运行的 ffmpeg 进程（由各自的 run_ffmpeg() 发送信号并回收）"""
+    with _running_lock:
+        events = list(_running.values())
+    for event in events:
+        event.set()
+
+def _signal(process, kill=False):
+    """向尚未回收的进程发送终止信号
+
+    只由调用 run_ffmpeg() 的线程在确认进程未回收后调用，回收也只发生在该线程，pid 不会被复用。
+    POSIX 下直接 os.kill：Popen.terminate() 会先 poll()，抢先回收子进程而丢失 wait4 的资源占用。
+    """
+    if process.returncode is not None:
+        return
+    try:
+        if hasattr(os, "wait4"):
+            os.kill(process.pid, signal.SIGKILL if kill else signal.SIGTERM)
+        elif kill:
+            process.kill()
+        else:
+            process.terminate()
+    except OSError:
+        pass  # 进程已退出
+
+def _option_value(cmd, option):
+    for i, arg in enumerate(cmd[:-1]):
+        if arg == option:
+            return cmd[i + 1]
+    return None
+
+def _format_seconds(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+class _Progress:
+    """解析 -progress 输出的 key=value 块"""
+    def __init__(self, label, duration, callback):
+        self.label = label
+        self.duration = duration
+        self.callback = callback
+        self.values = {}
+        self.media_seconds = None
+        self.fps = None
+        self.speed = None
+        self.frames = None
+        self.last_report = time.monotonic()
+
+    def feed(self, line):
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return
+        self.values[key] = value
+        if key != "progress":
+            return
+        out_time = self.values.get("out_time_us") or self.values.get("out_time_ms")  # 两者单位都是微秒
+        try:
+            self.media_seconds = int(out_time) / 1_000_000
+        except (TypeError, ValueError):
+            pass
+        try:
+            self.fps = float(self.values.get("fps"))
+        except (TypeError, ValueError):
+            pass
+        try:
+            self.frames = int(self.values.get("frame"))
+        except (TypeError, ValueError):
+            pass
+        try:
+            self.speed = float(self.values.get("speed", "").rstrip("x"))
+        except ValueError:
+            pass
+        snapshot = self.snapshot()
+        if self.callback:
+            self.callback(snapshot)
+        elif value == "continue" and time.monotonic() - self.last_report >= PROGRESS_INTERVAL:
+            self.last_report = time.monotonic()
+            self.report(snapshot)
+
+    def snapshot(self):
+        percent = eta = None
+        if self.duration and self.media_seconds is not None:
+            percent = min(100.0, self.media_seconds / self.duration * 100)
+            if self.speed:
+                eta = max(0.0, (self.duration - self.media_seconds) / self.speed)
+        return {"label": self.label, "media_seconds": self.media_seconds, "frames": self.frames,
+                "fps": self.fps, "speed": self.speed, "percent": percent, "eta": eta}
+
+    def report(self, snapshot):
+        parts = []
+        if snapshot["percent"] is not None:
+            parts.append(f"{snapshot['percent']:.1f}%")
+        elif snapshot["media_seconds"] is not None:
+            parts.append(_format_seconds(snapshot["media_seconds"]))
+        if snapshot["fps"]:
+            parts.append(f"fps={snapshot['fps']:.1f}")
+        if snapshot["speed"]:
+            parts.append(f"速度={snapshot['speed']:.2f}x")
+        if snapshot["eta"] is not None:
+            parts.append(f"剩余 {_format_seconds(snapshot['eta'])}")
+        print(f"[ffmpeg] {self.label}: {' '.join(parts)}", flush=True)
+
+def _peak_rss_mb(usage):
+    # Linux 下 ru_maxrss 单位为 KB，macOS 下为字节
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+def write_metrics(record, path=None):
+    """把一条记录追加到 JSON Lines 指标日志（未配置时不写）"""
+    path = path or os.environ.get(METRICS_LOG_ENV)
+    if not path:
+        return
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with _log_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+def run_ffmpeg(cmd, step=None, source=None, output=None, duration=None, timeout=None, cancel_event=None,
+               capture_stdout=False, text=False, check=True, on_progress=None):
+    """运行 ffmpeg 并记录指标，返回 CompletedProcess（额外带 metrics 字典）
+
+    step/source/output 写入指标日志（source 默认取第一个 -i，output 默认取最后一个参数）；
+    duration 为输出的媒体时长（秒），用于计算进度百分比与剩余时间；
+    capture_stdout 时 stdout 作为结果返回（例如 image2pipe），此时不解析进度；
+    on_progress(snapshot) 替代默认的定期打印。
+    """
+    cmd = [str(arg) for arg in cmd]
+    source = source or _option_value(cmd, "-i")
+    output = output or cmd[-1]
+    step = step or "ffmpeg"
+    if timeout is None and os.environ.get(TIMEOUT_ENV):
+        timeout = float(os.environ[TIMEOUT_ENV])
+    label = f"{step} {os.path.basename(output) if output != '-' else os.path.basename(source or '')}"
+    progress = None if capture_stdout else _Progress(label, duration, on_progress)
+    if progress:
+        cmd = [cmd[0], "-progress", "pipe:1", "-nostats", *cmd[1:]]
+
+    start_time = datetime.datetime.now()
+    start = time.monotonic()
+    process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    cancelled = threading.Event()
+    with _running_lock:
+        _running[process] = cancelled
+
+    stdout_chunks = []
+    stderr_chunks = []
+
+    def read_stdout():
+        if progress:
+            for line in iter(process.stdout.readline, b""):
+                progress.feed(line.decode(errors="replace"))
+        else:
+            stdout_chunks.append(process.stdout.read())
+
+    def read_stderr():
+        stderr_chunks.append(process.stderr.read())
+
+    state = {"usage": None}
+
+    def reap(block=False):
+        """回收子进程（POSIX 下通过 wait4 同时取得资源占用）；进程仍在运行时返回 False"""
+        if process.returncode is not None:
+            return True
+        if not hasattr(os, "wait4"):
+            if block:
+                process.wait()
+            else:
+                process.poll()
+            return process.returncode is not None
+        pid, wait_status, usage = os.wait4(process.pid, 0 if block else os.WNOHANG)
+        if pid == 0:
+            return False
+        process.returncode = os.waitstatus_to_exitcode(wait_status)
+        state["usage"] = usage
+        return True
+
+    readers = [threading.Thread(target=read_stdout, daemon=True), threading.Thread(target=read_stderr, daemon=True)]
+    for thread in readers:
+        thread.start()
+
+    status = "ok"
+    kill_at = None
+    try:
+        # 本线程是唯一回收子进程、发送信号的地方
+        while not reap():
+            if kill_at is None:
+                if cancelled.is_set() or (cancel_event is not None and cancel_event.is_set()):
+                    status = "cancelled"
+                elif timeout and time.monotonic() - start > timeout:
+                    status = "timeout"
+                if status != "ok":
+                    _signal(process)
+                    kill_at = time.monotonic() + 5
+            elif time.monotonic() >= kill_at:
+                _signal(process, kill=True)
+                reap(block=True)
+                break
+            # ffmpeg 退出时关闭输出管道：等待读取线程结束，进程退出后无需等满一个轮询周期
+            if readers[0].is_alive():
+                readers[0].join(0.25)
+            else:
+                time.sleep(0.01)
+    except KeyboardInterrupt:
+        status = "cancelled"
+        _signal(process)
+        reap(block=True)
+        raise
+    finally:
+        for thread in readers:
+            thread.join()
+        process.stdout.close()
+        process.stderr.close()
+        with _running_lock:
+            _running.pop(process, None)
+
+        wall = time.monotonic() - start
+        usage = state["usage"]
+        stdout = b"".join(stdout_chunks)
+        stderr = b"".join(stderr_chunks)
+        returncode = process.returncode
+        if status == "ok" and returncode != 0:
+            status = "failed"
+        snapshot = progress.snapshot() if progress else {}
+        metrics = {
+            "time": start_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "step": step,
+            "source": source,
+            "output": output,
+            "status": status,
+            "returncode": returncode,
+            "wall_seconds": round(wall, 3),
+            "cpu_user_seconds": round(usage.ru_utime, 3) if usage else None,
+            "cpu_system_seconds": round(usage.ru_stime, 3) if usage else None,
+            "peak_rss_mb": round(_peak_rss_mb(usage), 1) if usage else None,
+            "media_seconds": snapshot.get("media_seconds"),
+            "frames": snapshot.get("frames"),
+            "fps": snapshot.get("fps"),
+            "speed": snapshot.get("speed"),
+            "error": str(FfmpegError(returncode, cmd, stderr=stderr)) if status == "failed" else None,
+            "cmd": " ".join(cmd),
+        }
+        write_metrics(metrics)
+
+    if text:
+        stdout = stdout.decode(errors="replace")
+        stderr = stderr.decode(errors="replace")
+    if status == "timeout":
+        raise subprocess.TimeoutExpired(cmd, timeout, output=stdout, stderr=stderr)
+    if status == "cancelled":
+        raise FfmpegCancelled(f"ffmpeg 已取消: {label}")
+    if check and returncode != 0:
+        raise FfmpegError(returncode, cmd, output=stdout, stderr=stderr)
+    result = subprocess.CompletedProcess(cmd, returncode, stdout, stderr)
+    result.metrics = metrics
+    return result
+
+def summarize_metrics(path):
+    """按步骤汇总指标日志：次数、失败数、总耗时、CPU 时间、最慢的文件"""
+    steps = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            stats = steps.setdefault(record.get("step"), {"count": 0, "failed": 0, "wall": 0.0, "cpu": 0.0,
+                                                           "slowest": None, "slowest_wall": 0.0})
+            stats["count"] += 1
+            stats["failed"] += 0 if record.get("status") == "ok" else 1
+            stats["wall"] += record.get("wall_seconds") or 0.0
+            stats["cpu"] += (record.get("cpu_user_seconds") or 0.0) + (record.get("cpu_system_seconds") or 0.0)
+            if (record.get("wall_seconds") or 0.0) > stats["slowest_wall"]:
+                stats["slowest_wall"] = record["wall_seconds"]
+                stats["slowest"] = record.get("source") or record.get("output")
+    return steps
+
+def print_summary(path):
+    steps = summarize_metrics(path)
+    print(f"{'步骤':<16}{'次数':>6}{'失败':>6}{'总耗时(秒)':>12}{'CPU(秒)':>10}  最慢")
+    for step, stats in sorted(steps.items(), key=lambda item: -item[1]["wall"]):
+        print(f"{str(step):<16}{stats['count']:>6}{stats['failed']:>6}{stats['wall']:>12.1f}{stats['cpu']:>10.1f}  "
+              f"{stats['slowest']} ({stats['slowest_wall']:.1f} 秒)")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="汇总 ffmpeg 指标日志（JSON Lines）")
+    parser.add_argument("metrics_log", help="指标日志路径")
+    print_summary(parser.parse_args().metrics_log)
@@ -0,0 +1,153 @@
+# 共享HTTP传输层：
+# 1. 按主机维护 requests.Session 连接池（keep-alive，避免每次请求重新握手），池大小可按并发数配置
+# 2. 统一的连接/读取超时，避免单个请求挂起阻塞整个任务
+# 3. 统一的重试分类：连接失败、超时、429 和 5xx 可重试，其余错误为致命错误
+# 4. 请求级计时钩子，可用于统计耗时或并发调优
+#
+# srt_translator.py 和 srt_tts.py 通过 get_transport() 共享同一个实例
+
+import time
+import threading
+import datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+class HttpTransport:
+    def __init__(self, connect_timeout=10, read_timeout=600, default_pool_size=4):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.default_pool_size = default_pool_size
+        self.sessions = {}  # host -> (session, pool_size)
+        self.pool_sizes = {}  # host -> 配置的连接池大小
+        self.hooks = []
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def host_of(url):
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def configure_host(self, url, pool_size):
+        """设置某个主机的连接池大小（取已配置值与新值中的较大者）"""
+        host = self.host_of(url)
+        with self.lock:
+            pool_size = max(pool_size, self.pool_sizes.get(host, 0))
+            self.pool_sizes[host] = pool_size
+            current = self.sessions.get(host)
+            if current and current[1] < pool_size:
+                # 连接池只能在创建时指定大小，扩容时替换为新的 Session
+                current[0].close()
+                del self.sessions[host]
+
+    def session_for(self, url):
+        host = self.host_of(url)
+        with self.lock:
+            current = self.sessions.get(host)
+            if current is None:
+                pool_size = self.pool_sizes.get(host, self.default_pool_size)
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                current = self.sessions[host] = (session, pool_size)
+            return current[0]
+
+    def add_hook(self, hook):
+        """注册计时钩子: hook(event)，event 包含 method/url/host/status/elapsed/error"""
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        if hook in self.hooks:
+            self.hooks.remove(hook)
+
+    def request(self, method, url, timeout=None, **kwargs):
+        """发送请求；timeout 可为秒数或 (连接超时, 读取超时)，默认使用传输层配置"""
+        if timeout is None:
+            timeout = (self.connect_timeout, self.read_timeout)
+        elif not isinstance(timeout, tuple):
+            timeout = (min(self.connect_timeout, timeout), timeout)
+        start = time.monotonic()
+        resp = None
+        error = None
+        try:
+            resp = self.session_for(url).request(method, url, timeout=timeout, **kwargs)
+            return resp
+        except requests.exceptions.RequestException as e:
+            error = e
+            raise
+        finally:
+            if self.hooks:
+                event = {
+                    'method': method,
+                    'url': url,
+                    'host': self.host_of(url),
+                    'status': resp.status_code if resp is not None else None,
+                    'elapsed': time.monotonic() - start,
+                    'error': error,
+                }
+                for hook in list(self.hooks):
+                    hook(event)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        with self.lock:
+            for session, _ in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+
+def is_retryable(error=None, response=None):
+    """判断一次失败是否值得重试：连接失败、超时、429 和 5xx 可重试；4xx 等为致命错误"""
+    if response is None and isinstance(error, requests.exceptions.HTTPError):
+        response = error.response
+    if response is not None:
+        return response.status_code in RETRYABLE_STATUS or response.status_code >= 500
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                          requests.exceptions.ChunkedEncodingError)):
+        return True
+    if isinstance(error, requests.exceptions.RequestException):
+        return False
+    # 非网络错误（如返回内容解析失败）由调用方决定，默认可重试
+    return True
+
+class RequestStats:
+    """计时钩子：按主机统计请求数、错误数和耗时"""
+    def __init__(self):
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, event):
+        ok = event['error'] is None and event['status'] is not None and event['status'] < 400
+        with self.lock:
+            stats = self.hosts.setdefault(event['host'], {'count': 0, 'errors': 0, 'elapsed': 0.0, 'max': 0.0})
+            stats['count'] += 1
+            stats['errors'] += 0 if ok else 1
+            stats['elapsed'] += event['elapsed']
+            stats['max'] = max(stats['max'], event['elapsed'])
+
+    def report(self, name):
+        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock:
+            for host, stats in self.hosts.items():
+                avg = stats['elapsed'] / stats['count'] if stats['count'] else 0.0
+                print(f"[{name}] [{current_time}] >> 请求统计 {host}: {stats['count']} 次，失败 {stats['errors']} 次，"
+                      f"平均 {avg:.2f} 秒，最长 {stats['max']:.2f} 秒")
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def get_transport():
+    """返回进程内共享的传输层实例"""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = HttpTransport()
+        return _transport
@@ -0,0 +1,357 @@
+# 本地多进程 / 多主机任务队列：
+# 1. 任务保存在 SQLite 数据库中（可放在多台机器共享的 NFS 目录，要求文件系统支持 POSIX 文件锁）
+# 2. 各命令行工具加 --enqueue <数据库> 时只把任务写入队列，不在本机执行；目录模式按文件拆成多个任务
+# 3. 任意主机上运行 python job_queue.py --db <数据库> --worker 领取任务（可用 --kinds 只领取 translate/tts/blend/cover 中的部分类型），
+#    启动更多 worker 即可增加处理能力
+# 4. 领取任务时获得租约，执行期间定期心跳续租；worker 崩溃或失联时租约过期，任务被其他 worker 重新领取
+# 5. 失败的任务按指数退避重试，超过最大次数后标记为 failed；依赖任务失败时后续任务一并失败
+# 6. 任务命令在提交时的工作目录下执行，输出写入数据库所在目录的 job_logs/<任务ID>.log
+#
+# 各主机需以相同路径挂载共享目录，且时钟大致同步（租约按各主机本地时间计算）
+
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import hashlib
+import argparse
+import datetime
+import threading
+import subprocess
+
+KINDS = ("translate", "tts", "blend", "cover")
+LEASE_SECONDS = 120
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 30  # 第 n 次失败后等待 RETRY_DELAY * 2^(n-1) 秒，最长 10 分钟
+ACTIVE = ("pending", "running")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    script TEXT NOT NULL,
+    args TEXT NOT NULL,
+    cwd TEXT NOT NULL,
+    depends_on TEXT NOT NULL DEFAULT '[]',
+    dedup_key TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    not_before REAL NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    returncode INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, kind);
+CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key, status);
+"""
+
+class JobQueue:
+    def __init__(self, db_path):
+        self.db_path = os.path.abspath(db_path)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # 每次操作使用独立连接，心跳线程与主线程互不干扰；NFS 上不能使用 WAL（依赖共享内存）
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _transaction(self, conn):
+        conn.execute("BEGIN IMMEDIATE")  # 立即获取写锁，避免多个 worker 同时领取同一任务
+        return conn
+
+    def enqueue(self, kind, script, args, cwd=None, depends_on=None, max_attempts=MAX_ATTEMPTS):
+        """写入任务并返回任务ID；相同命令的任务尚未完成时直接返回已有任务
+
+        depends_on 中的任务ID必须已存在，否则抛出 ValueError。
+        """
+        cwd = os.path.abspath(cwd or os.getcwd())
+        args = [str(arg) for arg in args]
+        depends_on = [int(job_id) for job_id in depends_on or []]
+        dedup_key = hashlib.sha256(json.dumps([script, args, cwd]).encode("utf-8")).hexdigest()
+        conn = self._transaction(self._connect())
+        try:
+            missing = self._missing_jobs(conn, depends_on)
+            if missing:
+                raise ValueError(f"依赖的任务不存在: {', '.join(f'#{job_id}' for job_id in missing)}")
+            existing = conn.execute("SELECT id FROM jobs WHERE dedup_key = ? AND status IN (?, ?)",
+                                    (dedup_key, *ACTIVE)).fetchone()
+            if existing:
+                conn.execute("COMMIT")
+                return existing["id"]
+            cursor = conn.execute(
+                "INSERT INTO jobs (kind, script, args, cwd, depends_on, dedup_key, max_attempts, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, script, json.dumps(args, ensure_ascii=False), cwd, json.dumps(depends_on),
+                 dedup_key, max_attempts, time.time()))
+            conn.execute("COMMIT")
+            return cursor.lastrowid
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _missing_jobs(conn, job_ids):
+        if not job_ids:
+            return []
+        existing = {row["id"] for row in conn.execute(
+            f"SELECT id FROM jobs WHERE id IN ({','.join('?' for _ in job_ids)})", job_ids)}
+        return [job_id for job_id in job_ids if job_id not in existing]
+
+    def claim(self, worker, kinds=KINDS, lease_seconds=LEASE_SECONDS):
+        """领取一个可执行的任务（等待中，或租约已过期的运行中任务）；没有任务时返回 None"""
+        now = time.time()
+        conn = self._transaction(self._connect())
+        try:
+            placeholders = ",".join("?" for _ in kinds)
+            # 租约过期的任务：还有重试次数则重新排队，否则标记失败
+            for row in conn.execute(f"SELECT id, attempts, max_attempts FROM jobs WHERE status = 'running' "
+                                    f"AND lease_until < ? AND kind IN ({placeholders})", (now, *kinds)).fetchall():
+                if row["attempts"] >= row["max_attempts"]:
+                    conn.execute("UPDATE jobs SET status = 'failed', finished = ?, error = ? WHERE id = ?",
+                                 (now, "租约过期（worker 失联）且已达到最大重试次数", row["id"]))
+                else:
+                    conn.execute("UPDATE jobs SET status = 'pending', worker = NULL, error = ? WHERE id = ?",
+                                 ("租约过期（worker 失联），重新排队", row["id"]))
+
+            candidates = conn.execute(f"SELECT * FROM jobs WHERE status = 'pending' AND not_before <= ? "
+                                      f"AND kind IN ({placeholders}) ORDER BY id", (now, *kinds)).fetchall()
+            claimed = None
+            for job in candidates:
+                depends_on = json.loads(job["depends_on"])
+                statuses = {row["id"]: row["status"] for row in conn.execute(
+                    f"SELECT id, status FROM jobs WHERE id IN ({','.join('?' for _ in depends_on)})", depends_on)} \
+                    if depends_on else {}
+                missing = [job_id for job_id in depends_on if job_id not in statuses]
+                if missing:
+                    # 依赖的任务已被删除（或数据库被手工修改），该任务永远无法满足依赖
+                    conn.execute("UPDATE jobs SET status = 'failed', finished = ?, error = ? WHERE id = ?",
+                                 (now, f"依赖的任务不存在: {', '.join(f'#{job_id}' for job_id in missing)}", job["id"]))
+                    continue
+                if "failed" in statuses.values():
+                    conn.execute("UPDATE jobs SET status = 'failed', finished = ?, error = ? WHERE id = ?",
+                                 (now, "依赖任务失败", job["id"]))
+                    continue
+                if any(status != "done" for status in statuses.values()):
+                    continue
+                conn.execute("UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, started = ?, "
+                             "attempts = attempts + 1 WHERE id = ?", (worker, now + lease_seconds, now, job["id"]))
+                claimed = dict(job, attempts=job["attempts"] + 1)
+                break
+            conn.execute("COMMIT")
+            return claimed
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id, worker, lease_seconds=LEASE_SECONDS):
+        """续租；返回 False 表示任务已不属于该 worker（租约过期后被重新领取）"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                                  (time.time() + lease_seconds, job_id, worker))
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def finish(self, job_id, worker, returncode, error=None):
+        """记录执行结果；失败且还有重试次数时按指数退避重新排队"""
+        now = time.time()
+        conn = self._transaction(self._connect())
+        try:
+            job = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ? AND worker = ? AND status = 'running'",
+                               (job_id, worker)).fetchone()
+            if job is None:
+                conn.execute("COMMIT")
+                return  # 租约已丢失，结果以接手的 worker 为准
+            if returncode == 0:
+                conn.execute("UPDATE jobs SET status = 'done', finished = ?, returncode = 0, error = NULL, "
+                             "lease_until = NULL WHERE id = ?", (now, job_id))
+            elif job["attempts"] < job["max_attempts"]:
+                delay = min(600, RETRY_DELAY * 2 ** (job["attempts"] - 1))
+                conn.execute("UPDATE jobs SET status = 'pending', worker = NULL, lease_until = NULL, not_before = ?, "
+                             "returncode = ?, error = ? WHERE id = ?", (now + delay, returncode, error, job_id))
+            else:
+                conn.execute("UPDATE jobs SET status = 'failed', finished = ?, lease_until = NULL, returncode = ?, "
+                             "error = ? WHERE id = ?", (now, returncode, error, job_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def release(self, job_id, worker):
+        """worker 主动退出时把任务放回队列（不计入重试次数）"""
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE jobs SET status = 'pending', worker = NULL, lease_until = NULL, "
+                         "attempts = MAX(0, attempts - 1) WHERE id = ? AND worker = ? AND status = 'running'",
+                         (job_id, worker))
+        finally:
+            conn.close()
+
+    def retry_failed(self):
+        """把所有失败任务重新排队（重置重试次数）"""
+        conn = self._connect()
+        try:
+            return conn.execute("UPDATE jobs SET status = 'pending', attempts = 0, not_before = 0, worker = NULL, "
+                                "error = NULL WHERE status = 'failed'").rowcount
+        finally:
+            conn.close()
+
+    def jobs(self, statuses=None):
+        conn = self._connect()
+        try:
+            if statuses:
+                return [dict(row) for row in conn.execute(
+                    f"SELECT * FROM jobs WHERE status IN ({','.join('?' for _ in statuses)}) ORDER BY id", statuses)]
+            return [dict(row) for row in conn.execute("SELECT * FROM jobs ORDER BY id")]
+        finally:
+            conn.close()
+
+    def log_path(self, job_id):
+        log_dir = os.path.join(os.path.dirname(self.db_path), "job_logs")
+        os.makedirs(log_dir, exist_ok=True)
+        return os.path.join(log_dir, f"{job_id}.log")
+
+def strip_enqueue(argv):
+    """去掉命令行中的 --enqueue <数据库>，得到 worker 执行的参数"""
+    args = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == "--enqueue":
+            skip = True
+        elif not arg.startswith("--enqueue="):
+            args.append(arg)
+    return args
+
+def enqueue_invocation(db_path, kind, script, argv, remove=(), extra=()):
+    """把当前命令行（去掉 --enqueue 与 remove 中的开关，追加 extra 参数）作为任务写入队列
+
+    argparse 对重复的选项取最后一次的值，追加的 extra 可覆盖原有的同名参数（例如按文件拆分时的 -i/-m）。
+    """
+    args = [arg for arg in strip_enqueue(argv) if arg not in remove] + list(extra)
+    job_id = JobQueue(db_path).enqueue(kind, os.path.abspath(script), args)
+    print(f"已加入队列 #{job_id} [{kind}] {os.path.basename(script)} {' '.join(args)}")
+    return job_id
+
+def _log_tail(path, lines=5):
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            tail = [line.rstrip() for line in f.readlines()[-lines:] if line.strip()]
+        return " | ".join(tail)
+    except OSError:
+        return None
+
+def run_job(queue, job, worker, lease_seconds=LEASE_SECONDS):
+    """执行一个任务：子进程运行工具命令，后台线程定期续租；租约丢失时终止子进程"""
+    log_path = queue.log_path(job["id"])
+    command = [sys.executable, job["script"], *json.loads(job["args"])]
+    stop = threading.Event()
+    lost = threading.Event()
+    with open(log_path, "a", encoding="utf-8") as log:
+        log.write(f"\n===== {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {worker} 第 {job['attempts']} 次执行 =====\n")
+        log.flush()
+        process = subprocess.Popen(command, cwd=job["cwd"], stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+
+        def keep_alive():
+            while not stop.wait(lease_seconds / 4):
+                if not queue.heartbeat(job["id"], worker, lease_seconds):
+                    lost.set()
+                    process.terminate()
+                    return
+
+        heart = threading.Thread(target=keep_alive, daemon=True)
+        heart.start()
+        try:
+            returncode = process.wait()
+        except KeyboardInterrupt:
+            process.terminate()
+            process.wait()
+            stop.set()
+            queue.release(job["id"], worker)
+            raise
+        finally:
+            stop.set()
+            heart.join()
+    if lost.is_set():
+        return None
+    queue.finish(job["id"], worker, returncode, None if returncode == 0 else f"退出码 {returncode}: {_log_tail(log_path)}")
+    return returncode
+
+def run_worker(db_path, kinds=KINDS, poll_seconds=10, exit_when_idle=False, lease_seconds=LEASE_SECONDS):
+    queue = JobQueue(db_path)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"[{__name__}] worker {worker} 开始领取任务: {', '.join(kinds)}")
+    while True:
+        job = queue.claim(worker, kinds, lease_seconds)
+        if job is None:
+            if exit_when_idle:
+                print(f"[{__name__}] 队列中没有可执行的任务，worker 退出")
+                return
+            time.sleep(poll_seconds)
+            continue
+        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"[{__name__}] [{current_time}] >> 开始任务 #{job['id']} [{job['kind']}] 第 {job['attempts']} 次")
+        start = time.monotonic()
+        returncode = run_job(queue, job, worker, lease_seconds)
+        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        result = "租约丢失，已放弃" if returncode is None else ("完成" if returncode == 0 else f"失败（退出码 {returncode}）")
+        print(f"[{__name__}] [{current_time}] >> 任务 #{job['id']} {result}，耗时 {time.monotonic() - start:.1f} 秒")
+
+def print_status(db_path):
+    jobs = JobQueue(db_path).jobs()
+    counts = {}
+    for job in jobs:
+        counts.setdefault(job["kind"], {}).setdefault(job["status"], 0)
+        counts[job["kind"]][job["status"]] += 1
+    print(f"{'类型':<12}{'pending':>9}{'running':>9}{'done':>9}{'failed':>9}")
+    for kind, statuses in sorted(counts.items()):
+        print(f"{kind:<12}" + "".join(f"{statuses.get(status, 0):>9}" for status in ("pending", "running", "done", "failed")))
+    now = time.time()
+    for job in jobs:
+        if job["status"] == "running":
+            print(f"运行中 #{job['id']} [{job['kind']}] {job['worker']}，租约剩余 {job['lease_until'] - now:.0f} 秒")
+        elif job["status"] == "failed":
+            print(f"失败 #{job['id']} [{job['kind']}] {job['error']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="基于 SQLite 的多进程/多主机任务队列")
+    parser.add_argument("--db", required=True, help="队列数据库路径（多台机器共享时放在 NFS 目录）")
+    parser.add_argument("--worker", action="store_true", help="以 worker 方式运行，循环领取并执行任务")
+    parser.add_argument("--kinds", default=",".join(KINDS), help=f"worker 领取的任务类型，逗号分隔（默认: {','.join(KINDS)}）")
+    parser.add_argument("--poll", type=float, default=10, help="队列为空时的轮询间隔（秒，默认: 10）")
+    parser.add_argument("--lease", type=float, default=LEASE_SECONDS, help=f"任务租约时长（秒，默认: {LEASE_SECONDS}）")
+    parser.add_argument("--exit-when-idle", action="store_true", help="没有可执行的任务时退出（默认持续等待）")
+    parser.add_argument("--status", action="store_true", help="显示队列状态")
+    parser.add_argument("--retry-failed", action="store_true", help="把失败的任务重新排队")
+    args = parser.parse_args()
+
+    if args.retry_failed:
+        print(f"已重新排队 {JobQueue(args.db).retry_failed()} 个失败任务")
+    if args.worker:
+        kinds = [kind.strip() for kind in args.kinds.split(",") if kind.strip()]
+        unknown = [kind for kind in kinds if kind not in KINDS]
+        if unknown:
+            parser.error(f"未知任务类型: {', '.join(unknown)}")
+        try:
+            run_worker(args.db, kinds, args.poll, args.exit_when_idle, args.lease)
+        except KeyboardInterrupt:
+            print("\nworker 已停止，正在执行的任务已放回队列")
+    elif args.status or not args.retry_failed:
+        print_status(args.db)
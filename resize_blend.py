@@ -0,0 +1,99 @@
+# 缩放与字幕合成一次完成：
+# 先运行 video_resize.py 再运行 video_blender.py --size 会把每个视频解码、编码两次，并带来二次编码的画质损失。
+# 这里接受 video_resize 风格的目录参数（目录、宽高、替换/后缀、加速设备）和 video_blender 的字幕合成参数，
+# 在同一个滤镜图中完成缩放、字幕叠加和编码，只解码、编码一次。
+
+import os
+import sys
+import argparse
+
+import ffmpeg_runner
+from build_manifest import forget, load_record, stale_reason, record_build
+from job_queue import enqueue_invocation
+from video_blender import (add_blend_arguments, resolve_subtitle_suffixes, list_main_videos, prepare_list_job,
+                           share_band_geometry, resolve_slots, schedule_jobs, REPLACE_TEMP_SUFFIX)
+from video_resize import video_encoder_args
+
+# 替换模式覆盖原始文件后写入的构建记录参数；内容未再变化的文件已包含字幕，不再重复合成
+REPLACED_PARAMS = {"resize_blend": "replaced"}
+
+def fused_settings(width, height, device):
+    """video_resize 的设备参数 -> video_blender 的尺寸、硬件加速与编码器设置"""
+    codec = video_encoder_args(device)[1]
+    return {
+        'size': f"{width}x{height}",
+        'hwaccel': "nvenc" if device == 'nvenc' else None,
+        'codec': codec,
+    }
+
+def already_replaced(video_file):
+    """原始文件是否已被替换模式覆盖为合成结果（之后内容未变化）"""
+    record = load_record(video_file)
+    return (record is not None and record.get("params") == REPLACED_PARAMS
+            and stale_reason(video_file, [video_file], REPLACED_PARAMS) is None)
+
+def list_source_videos(directory, suffix, blend_args, only=None):
+    """需要处理的主视频：排除各类输出视频，以及已被替换模式处理过的文件；only 指定时只保留该视频"""
+    videos = []
+    for video_file in list_main_videos(blend_args, directory, (suffix,)):
+        if only and os.path.abspath(video_file) != os.path.abspath(only):
+            continue
+        if already_replaced(video_file):
+            print(f"跳过已替换为合成结果的文件: {video_file}")
+        else:
+            videos.append(video_file)
+    return videos
+
+def process_directory(directory, width, height, replace=False, suffix='_blended', device='cpu', blend_args=None, video=None):
+    """遍历目录，对每个主视频一次完成缩放与字幕合成；video 指定时只处理目录中的该视频（队列任务使用）"""
+    blend_args.__dict__.update(fused_settings(width, height, device))
+    resolve_subtitle_suffixes(blend_args)
+
+    # 替换模式先写入临时文件，成功后再覆盖原始文件
+    output_suffix = REPLACE_TEMP_SUFFIX if replace else suffix
+    jobs = [job for job in (prepare_list_job(blend_args, video_file, output_suffix)
+                            for video_file in list_source_videos(directory, suffix, blend_args, video)) if job]
+    if not jobs:
+        print(f"目录中没有需要处理的视频: {directory}")
+        return []
+
+    share_band_geometry(blend_args, jobs)
+    cpu_slots, hw_slots = resolve_slots(blend_args)
+    summary_path = blend_args.summary or os.path.join(directory, "resize_blend_summary.json")
+    results = schedule_jobs(jobs, cpu_slots, hw_slots, summary_path)
+
+    if replace:
+        succeeded = {item['output'] for item in results if item['ok']}
+        for job in jobs:
+            forget(job.output)  # 临时输出的构建记录，替换后不再有意义
+            if job.output in succeeded:
+                os.replace(job.output, job.main_video)
+                record_build(job.main_video, [job.main_video], REPLACED_PARAMS)
+            elif os.path.exists(job.output):
+                os.remove(job.output)
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='一次完成目录中MP4视频的缩放与字幕合成')
+    parser.add_argument('-d', '--directory', help='包含MP4文件的目录路径', required=True)
+    parser.add_argument('-w', '--width', type=int, help='视频的目标宽度', required=True)
+    parser.add_argument('--height', type=int, help='视频的目标高度', required=True)
+    parser.add_argument('-r', '--replace', action='store_true', default=False, help='替换原始文件而不是创建新文件')
+    parser.add_argument('-s', '--suffix', default='_blended', help='新文件的自定义后缀（默认: _blended）')
+    parser.add_argument('--device', choices=['cpu', 'nvenc', 'qsv', 'amf'], default='cpu', help='指定加速设备（cpu/nvenc/qsv/amf，默认: cpu）')
+    parser.add_argument('--video', default=None, help='只处理目录中的指定视频（队列任务使用）')
+    add_blend_arguments(parser)
+
+    args = parser.parse_args()
+    if args.replace and args.renditions:
+        parser.error("--replace 不能与 --renditions 同时使用")
+    ffmpeg_runner.configure(args.metrics_log, args.ffmpeg_timeout)
+    if args.enqueue:
+        # 只入队：每个主视频一个任务，启动更多 worker 即可并行处理
+        resolve_subtitle_suffixes(args)
+        for video_file in list_source_videos(args.directory, args.suffix, args, args.video):
+            enqueue_invocation(args.enqueue, "blend", __file__, sys.argv[1:],
+                               extra=["--video", os.path.abspath(video_file)])
+        sys.exit(0)
+
+    process_directory(args.directory, args.width, args.height, args.replace, args.suffix, args.device, args, args.video)
@@ -0,0 +1,196 @@
+# 角色目录索引：
+# 1. 一次扫描 flashtts_data/roles 和 flashtts_data/mega-roles，建立角色名 -> 角色信息的索引
+# 2. 每个角色记录参考音频路径、内容哈希、时长、采样率、参考文本以及可选的 .npy latent
+# 3. 哈希等元数据缓存在 flashtts_data/.role_catalog.json，按文件 mtime/大小失效，避免每次运行重新计算
+# 4. Mega 角色注册时直接上传 .npy latent 的文件内容（不经反序列化再序列化），每个文件只读取一次
+# 5. srt_tts.py（命令行）与 srt_tts_gui.py（图形界面）通过 get_catalog() 共享同一个索引
+#
+# 目录约定：
+#   roles/<角色名>/reference_audio.wav (+ reference_text.txt)
+#   mega-roles/<分组>/<角色名>.wav (+ <角色名>.npy)，角色名取文件名（不含扩展名）；
+#   不同分组中的同名角色只保留按分组名排序的第一个，并打印警告
+
+import os
+import json
+import wave
+import hashlib
+import threading
+
+DATA_DIR = "flashtts_data"
+CACHE_FILENAME = ".role_catalog.json"
+CACHE_VERSION = 2
+
+class RoleCatalog:
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self.cache_path = os.path.join(data_dir, CACHE_FILENAME)
+        self.entries = {"roles": {}, "mega-roles": {}}
+        self.audio_cache = {}  # 参考音频哈希 -> 文件内容
+        self.latent_bytes = {}  # latent 哈希 -> .npy 文件内容（上传用）
+        self.duplicates = {}  # 重名的 Mega 角色名 -> 各分组目录（第一个生效）
+        self.lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """重新扫描角色目录；文件 mtime/大小未变化的角色直接复用缓存的元数据"""
+        with self.lock:
+            cached = self._load_cache()
+            entries = {"roles": {}, "mega-roles": {}}
+            duplicates = {}
+            for entry in self._scan():
+                existing = entries[entry["kind"]].get(entry["name"])
+                if existing:
+                    duplicates.setdefault(entry["name"], [existing["dir"]]).append(entry["dir"])
+                    continue
+                previous = cached.get(entry["kind"], {}).get(entry["name"])
+                if previous and previous.get("stamps") == entry["stamps"]:
+                    entry = previous
+                else:
+                    self._fill_metadata(entry)
+                entries[entry["kind"]][entry["name"]] = entry
+            for name, dirs in duplicates.items():
+                if self.duplicates.get(name) != dirs:
+                    print(f"[role_catalog] 警告: Mega 角色 {name} 在多个分组中重名，使用 {dirs[0]}，忽略 {', '.join(dirs[1:])}")
+            self.duplicates = duplicates
+            changed = entries != cached
+            self.entries = entries
+            if changed:
+                self._save_cache()
+
+    def _scan(self):
+        roles_dir = os.path.join(self.data_dir, "roles")
+        if os.path.isdir(roles_dir):
+            for name in sorted(os.listdir(roles_dir)):
+                role_dir = os.path.join(roles_dir, name)
+                audio_path = os.path.join(role_dir, "reference_audio.wav")
+                if not os.path.isfile(audio_path):
+                    continue
+                text_path = os.path.join(role_dir, "reference_text.txt")
+                yield self._new_entry("roles", name, role_dir, audio_path,
+                                      text_path if os.path.isfile(text_path) else None, None)
+
+        mega_dir = os.path.join(self.data_dir, "mega-roles")
+        if os.path.isdir(mega_dir):
+            for group in sorted(os.listdir(mega_dir)):
+                group_dir = os.path.join(mega_dir, group)
+                if not os.path.isdir(group_dir):
+                    continue
+                stems = sorted({os.path.splitext(f)[0] for f in os.listdir(group_dir)
+                                if f.endswith((".wav", ".npy"))})
+                for stem in stems:
+                    audio_path = os.path.join(group_dir, f"{stem}.wav")
+                    latent_path = os.path.join(group_dir, f"{stem}.npy")
+                    yield self._new_entry("mega-roles", stem, group_dir,
+                                          audio_path if os.path.isfile(audio_path) else None, None,
+                                          latent_path if os.path.isfile(latent_path) else None)
+
+    def _new_entry(self, kind, name, role_dir, audio_path, text_path, latent_path):
+        return {
+            "kind": kind,
+            "name": name,
+            "dir": role_dir,
+            "audio_path": audio_path,
+            "text_path": text_path,
+            "latent_path": latent_path,
+            "stamps": [self._stamp(path) for path in (audio_path, text_path, latent_path)],
+        }
+
+    @staticmethod
+    def _stamp(path):
+        if not path:
+            return None
+        stat = os.stat(path)
+        return [stat.st_mtime, stat.st_size]
+
+    @staticmethod
+    def _file_hash(path):
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def _fill_metadata(self, entry):
+        """计算参考音频/latent 哈希、时长、采样率并读取参考文本"""
+        entry["audio_hash"] = None
+        entry["latent_hash"] = None
+        entry["duration"] = None
+        entry["sample_rate"] = None
+        entry["reference_text"] = None
+        if entry["audio_path"]:
+            entry["audio_hash"] = self._file_hash(entry["audio_path"])
+            try:
+                with wave.open(entry["audio_path"], "rb") as wav_file:
+                    entry["sample_rate"] = wav_file.getframerate()
+                    entry["duration"] = wav_file.getnframes() / wav_file.getframerate()
+            except (wave.Error, EOFError):
+                pass  # 非PCM编码的WAV，时长未知
+        if entry["latent_path"]:
+            entry["latent_hash"] = self._file_hash(entry["latent_path"])
+        if entry["text_path"]:
+            with open(entry["text_path"], "r", encoding="utf-8") as f:
+                entry["reference_text"] = f.read().strip()
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != CACHE_VERSION:
+                return {"roles": {}, "mega-roles": {}}  # 旧版本缓存缺少字段，全部重新计算
+            return {"roles": data.get("roles", {}), "mega-roles": data.get("mega-roles", {})}
+        except (OSError, ValueError):
+            return {"roles": {}, "mega-roles": {}}
+
+    def _save_cache(self):
+        try:
+            temp_path = self.cache_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": CACHE_VERSION, **self.entries}, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.cache_path)
+        except OSError:
+            pass  # 目录只读时仅使用内存中的索引
+
+    def get(self, name, kind=None):
+        """按角色名查找；未指定 kind 时先查 roles 再查 mega-roles"""
+        kinds = [kind] if kind else ["roles", "mega-roles"]
+        for current in kinds:
+            entry = self.entries.get(current, {}).get(name)
+            if entry:
+                return entry
+        return None
+
+    def names(self, kind="roles"):
+        return sorted(self.entries.get(kind, {}))
+
+    def content_hash(self, entry):
+        """角色内容标识（参考音频与 latent 哈希），用于缓存键"""
+        return [entry["audio_hash"], entry["latent_hash"]]
+
+    def read_audio(self, entry):
+        """读取参考音频内容（按哈希缓存在内存中，多次请求只读一次磁盘）"""
+        audio = self.audio_cache.get(entry["audio_hash"])
+        if audio is None:
+            with open(entry["audio_path"], "rb") as f:
+                audio = f.read()
+            self.audio_cache[entry["audio_hash"]] = audio
+        return audio
+
+    def read_latent(self, entry):
+        """返回用于上传的 .npy 文件内容（文件本身即 .npy 格式，直接读取并按哈希缓存）"""
+        with self.lock:
+            data = self.latent_bytes.get(entry["latent_hash"])
+            if data is None:
+                with open(entry["latent_path"], "rb") as f:
+                    data = self.latent_bytes[entry["latent_hash"]] = f.read()
+            return data
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def get_catalog(data_dir=DATA_DIR):
+    """返回进程内共享的角色索引（首次调用时扫描）"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None or _catalog.data_dir != data_dir:
+            _catalog = RoleCatalog(data_dir)
+        return _catalog
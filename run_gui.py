@@ -18,6 +18,7 @@ def check_dependencies():
         import pysrt
         import requests
         import tqdm
+        import numpy
         
         # 检查PIL库
         try:
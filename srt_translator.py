@@ -1,14 +1,17 @@
 #!/usr/bin/env python3
 import os
+import sys
 import argparse
 import glob
 import json
 import time
-import shutil  # 新增: 导入shutil模块用于文件复制
 from typing import List, Dict, Optional
 from datetime import datetime
-import requests
+import atexit
 from tqdm import tqdm
+from http_transport import get_transport, is_retryable, RequestStats
+from build_manifest import stale_reason, record_build, invalidate, copy_artifact
+from job_queue import enqueue_invocation
 from consts import API_CONFIG  # 修改: 从consts.py导入API_CONFIG
 
 class SRTCore:
@@ -81,7 +84,8 @@ class SRTCore:
         return '\n'.join(srt_content)
 
 class SFClient:
-    def __init__(self, api_key: str, endpoint: str, model: str, batch_size: int = 10, verbose: bool = False, temperature: float = 1.0):
+    def __init__(self, api_key: str, endpoint: str, model: str, batch_size: int = 10, verbose: bool = False, temperature: float = 1.0,
+                 concurrency: int = 1):
         self.endpoint = endpoint
         self.headers = {
             "Authorization": f"Bearer {api_key}",
@@ -99,6 +103,10 @@ class SFClient:
         }
         self.verbose = verbose
         self.model = model
+        # 共享HTTP传输层: 复用到API供应商的连接（keep-alive），避免每个批次重新TLS握手
+        # 连接池大小与同时在途的请求数一致（TranslationPipeline 按批次顺序请求，默认为 1）
+        self.transport = get_transport()
+        self.transport.configure_host(endpoint, max(1, concurrency))
 
     def _construct_payload(self, batch: List[Dict]) -> dict:
         """直接将原始字幕输入AI"""
@@ -132,7 +140,7 @@ class SFClient:
         
         for attempt in range(self.retry_policy['max_attempts']):
             try:
-                resp = requests.post(self.endpoint, headers=self.headers, json=payload, timeout=600)
+                resp = self.transport.post(self.endpoint, headers=self.headers, json=payload, timeout=600)
                 resp.raise_for_status()
                 translated_text = resp.json()['choices'][0]['message']['content'] + "\n"
                 
@@ -152,6 +160,10 @@ class SFClient:
             except Exception as e:
                 current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 print(f"[{self.__class__.__name__}.process_batch] [{current_time}] >> 批次处理错误（第{attempt+1}次尝试）: {str(e)}")
+                if not is_retryable(error=e):
+                    # 认证失败、参数错误等重试也不会成功
+                    print(f"[{self.__class__.__name__}.process_batch] [{current_time}] >> 不可重试的错误，放弃该批次")
+                    break
                 time.sleep(self.retry_policy['backoff'][attempt])
         
         return None
@@ -177,7 +189,7 @@ class SFClient:
         # Same retry logic as process_batch
         for attempt in range(self.retry_policy['max_attempts']):
             try:
-                resp = requests.post(self.endpoint, headers=self.headers, json=payload, timeout=600)
+                resp = self.transport.post(self.endpoint, headers=self.headers, json=payload, timeout=600)
                 resp.raise_for_status()
                 result = resp.json()['choices'][0]['message']['content']
                 return json.loads(result)
@@ -185,6 +197,8 @@ class SFClient:
                 if verbose:
                     current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                     print(f"[{self.__class__.__name__}.generate_description] [{current_time}] >> 生成描述错误（第{attempt+1}次尝试）: {str(e)}")
+                if not is_retryable(error=e):
+                    break
                 time.sleep(self.retry_policy['backoff'][attempt])
         return None
 
@@ -213,6 +227,23 @@ class TranslationPipeline:
         
         return translated
 
+def enqueue_translations(args):
+    """--enqueue：只把翻译任务写入队列；目录模式按文件拆分，原始文件备份在入队时完成"""
+    if not args.list_dir:
+        enqueue_invocation(args.enqueue, "translate", __file__, sys.argv[1:])
+        return
+    output_dir = args.output or args.input
+    os.makedirs(output_dir, exist_ok=True)
+    for srt_file in glob.glob(os.path.join(args.input, '*.srt')):
+        if srt_file.endswith(('_cn.srt', '_en.srt')):
+            continue
+        base, ext = os.path.splitext(os.path.basename(srt_file))
+        if args.original_prefix_addon:
+            # 原文备份随原文内容更新，合成时烧录的英文字幕与译文对应同一版原文
+            copy_artifact(srt_file, os.path.join(output_dir, f"{base}{args.original_prefix_addon}{ext}"))
+        enqueue_invocation(args.enqueue, "translate", __file__, sys.argv[1:], remove=("--list_dir",),
+                           extra=["-i", srt_file, "-o", os.path.join(output_dir, f"{base}_cn{ext}")])
+
 def main():
     parser = argparse.ArgumentParser(description="SRT自然流式翻译工具")
     parser.add_argument('-i', '--input', required=True, help='输入SRT文件路径')
@@ -234,9 +265,23 @@ def main():
     # 添加--desc参数
     parser.add_argument('--desc', action='store_true', default=False,
                        help='生成自媒体描述文件（标题、简介、标签）')
+    parser.add_argument('--force', action='store_true', default=False,
+                       help='忽略构建记录，重新翻译（默认只翻译原文或模型参数变化的文件）')
+    parser.add_argument('--enqueue', default=None,
+                       help='只把任务写入指定的队列数据库，由 job_queue.py --worker 执行（目录模式按文件拆分）')
     
     args = parser.parse_args()
 
+    if args.enqueue:
+        enqueue_translations(args)
+        return
+
+    # 详细模式下统计每个API主机的请求次数和耗时，退出时输出
+    if args.verbose:
+        stats = RequestStats()
+        get_transport().add_hook(stats)
+        atexit.register(stats.report, __name__)
+
     # 新增定时功能逻辑
     if args.timer:
         try:
@@ -325,6 +370,27 @@ def main():
         api_key = args.api_key
     api_endpoint = selected_model['API_ENDPOINT']
     model = selected_model['MODEL']
+    # 影响译文的参数，参数或原文变化时重新翻译
+    build_params = {'api_vendor': args.api_vendor, 'model': model, 'temperature': args.temperature, 'batch': args.batch}
+
+    def translation_stale(source, output):
+        """返回需要重新翻译的原因；译文为最新时返回 None"""
+        if args.force:
+            return "--force"
+        return stale_reason(output, [source], build_params)
+
+    def write_translation(translated_data, source, output):
+        """先写入临时文件再替换，中断时不会留下不完整的译文"""
+        temp_output = f"{output}.tmp"
+        SRTCore.generate_srt(translated_data, temp_output)
+        os.replace(temp_output, output)
+        if any(batch is None for batch in translated_data):
+            # 有批次翻译失败（译文中为 None）：保留已翻译部分，但不记为最新，下次运行重新翻译
+            invalidate(output)
+            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            print(f"[{__name__}] [{current_time}] >> 部分批次翻译失败，下次运行将重新翻译: {output}")
+        else:
+            record_build(output, [source], build_params)
 
     # 处理目录模式
     if args.list_dir:
@@ -333,7 +399,6 @@ def main():
             f for f in glob.glob(os.path.join(args.input, '*.srt')) 
             if not f.endswith('_cn.srt') 
             and not f.endswith('_en.srt')
-            and not os.path.exists(f.replace('.srt', f'{args.original_prefix_addon}.srt'))
         ]
         if not srt_files:
             current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -358,14 +423,15 @@ def main():
                 original_base = os.path.basename(srt_file)
                 original_base_name, ext = os.path.splitext(original_base)
                 original_output_path = os.path.join(args.output, f"{original_base_name}{args.original_prefix_addon}{ext}")
-                
-                if not os.path.exists(original_output_path):
-                    shutil.copy2(srt_file, original_output_path)
+
+                # 备份不存在或原文内容变化时重新备份，合成时烧录的英文字幕与译文对应同一版原文
+                backup_reason = copy_artifact(srt_file, original_output_path)
+                if backup_reason:
                     current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    print(f"[{__name__}] [{current_time}] >> 原始文件备份已保存至: {original_output_path}")
+                    print(f"[{__name__}] [{current_time}] >> 原始文件备份已保存至（{backup_reason}）: {original_output_path}")
                 else:
                     current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    print(f"[{__name__}] [{current_time}] >> 原始文件备份已存在，跳过: {original_output_path}")
+                    print(f"[{__name__}] [{current_time}] >> 原始文件备份已是最新，跳过: {original_output_path}")
 
             # 修改输出文件名构造逻辑，添加_cn后缀
             base_name = os.path.basename(srt_file)
@@ -373,11 +439,15 @@ def main():
             output_filename = f"{base}_cn{ext}"
             output_file = os.path.join(args.output, output_filename)  # 使用新文件名
 
-            # 检查目标文件是否已存在，如果存在则跳过
-            if os.path.exists(output_file):
+            # 译文为最新（原文与模型参数均未变化）时跳过
+            reason = translation_stale(srt_file, output_file)
+            if reason is None:
                 current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                print(f"[{__name__}] [{current_time}] >> 跳过已存在的文件: {output_file}")
+                print(f"[{__name__}] [{current_time}] >> 跳过已是最新的文件: {output_file}")
                 continue
+            if os.path.exists(output_file):
+                current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                print(f"[{__name__}] [{current_time}] >> 重新翻译（{reason}）: {output_file}")
 
             current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             print(f"[{__name__}] [{current_time}] >> 开始处理文件: {srt_file}")
@@ -400,7 +470,7 @@ def main():
         
             print(f"[{__name__}] [{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] >> 翻译流程完成")
             print(f"[{__name__}] [{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] >> 生成结果文件...")
-            SRTCore.generate_srt(translated_data, output_file)
+            write_translation(translated_data, srt_file, output_file)
 
             processed_files += 1
             print(f"[{__name__}] [{current_time}] >> 处理完成，输出文件已保存至 {output_file}")
@@ -428,6 +498,11 @@ def main():
             print(f"[{__name__}] [{current_time_str}] >> 当前时间已超过停止时间 {args.stop_timer}，停止处理")
             exit(0)
 
+        if translation_stale(args.input, args.output) is None:
+            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            print(f"[{__name__}] [{current_time}] >> 译文已是最新，跳过: {args.output}")
+            return
+
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         print(f"[{__name__}] [{current_time}] >> 正在解析输入文件...")
         srt_entries = SRTCore.parse_srt(args.input)
@@ -444,7 +519,7 @@ def main():
         print(translated_data)
         print(f"[{__name__}] [{current_time}] >> 翻译流程已完成")
         print(f"[{__name__}] [{current_time}] >> 生成结果文件...")
-        SRTCore.generate_srt(translated_data, args.output)
+        write_translation(translated_data, args.input, args.output)
 
         print(f"[{__name__}] [{current_time}] >> 处理完成！输出文件已保存至 {args.output}")
         
@@ -15,21 +15,46 @@
 # 本目录下flashtts_data
 
 import os
+import sys
 import re
-import subprocess
+import unicodedata
 import datetime
+import time
 import json
+import threading
+import multiprocessing
 import argparse
+import wave
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 import pysrt
 import requests
+import numpy as np
 
 from tqdm import tqdm  # 新增: 导入进度条库
+import ffmpeg_runner
+from http_transport import get_transport, is_retryable, RequestStats
+from role_catalog import get_catalog
+from build_manifest import stale_reason, record_build, invalidate
+from job_queue import enqueue_invocation
 from consts import TTS_BASE_URL
+try:
+    from consts import TTS_BASE_URLS  # 新增: 可选的多个TTS服务地址
+except ImportError:
+    TTS_BASE_URLS = [TTS_BASE_URL]
+
+MIX_SAMPLE_RATE = 24000  # 混音时间轴采样率（单声道 s16le）
+SPEECH_SPEEDS = ["very_low", "low", "moderate", "high", "very_high"]
+
+class SegmentOverrun(Exception):
+    """流式合成中途发现语音将超出字幕时长允许的拉伸范围"""
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="SRT字幕语音合成工具")
     parser.add_argument("-i", "--input", help="SRT字幕文件所在目录")
     parser.add_argument("-o", "--output", help="输出音频文件的目录，默认与--input相同")
+    parser.add_argument("--srt_file", default=None, help="只处理指定的单个SRT文件（忽略--input与--subtitle_suffix）")
     parser.add_argument("--subtitle_suffix", default="_cn", help="字幕文件的后缀，默认为'_cn'")
     parser.add_argument("--audio_suffix", default="", help="音频文件的后缀，默认为空")
     parser.add_argument("--audio_codec", default="aac", help="音频编码格式，默认为'aac'")
@@ -42,18 +67,430 @@ def parse_arguments():
                         choices=["very_low", "low", "moderate", "high", "very_high"],
                         help="音高（very_low, low, moderate, high, very_high），默认为'moderate'")
     parser.add_argument("-r", "--voice_role", default="male", help="合成角色，默认为'male'")
-    parser.add_argument("--clone_role", default="", help="克隆角色，默认为空")
+    parser.add_argument("--clone_role", default="", help="克隆角色（roles 或 mega-roles 中的角色名），默认为空")
     parser.add_argument("--verbose", action="store_true", help="启用详细输出")  # 新增: verbose 参数
     parser.add_argument("--speed_detection", action="store_true", default=True, help="是否开启语速探测，默认开启")
     parser.add_argument("--speed_adjust", action="store_true", help="启用语音时长调整以匹配字幕时间，默认关闭")
     parser.add_argument("--alternative", type=int, default=0, help="Number of alternative clone roles, default 0")  # Add new argument
+    parser.add_argument("--no_dedup", action="store_true", help="关闭重复字幕去重（默认对相同文本只合成一次）")
+    parser.add_argument("--work_dir", default=None, help="分段检查点目录，默认为输出目录下的 .<文件名>.tts_work")
+    parser.add_argument("--clean_work", action="store_true", help="合成成功后删除分段检查点目录")
+    parser.add_argument("--incremental", action="store_true", help="增量模式：只重新合成变化的字幕，并只重写混音时间轴中受影响的时间窗口")
+    parser.add_argument("--force", action="store_true", help="忽略构建记录与分段检查点，重新合成所有字幕（如TTS服务或模型更新后）")
+    parser.add_argument("--tts_workers", default="1", help="并发语音合成请求数，默认1；设为auto时根据服务端吞吐量和错误率自动调优")
+    parser.add_argument("--cpu_workers", type=int, default=None, help="分段解码/时长调整进程数，默认为CPU核心数")
+    parser.add_argument("--tts_urls", default=None, help="逗号分隔的多个TTS服务地址，默认使用consts中的TTS_BASE_URLS/TTS_BASE_URL")
+    parser.add_argument("--tts_timeout", type=float, default=300, help="单个TTS请求的读取超时（秒），默认300")
+    parser.add_argument("--stream", action="store_true", help="流式合成：边接收边解码PCM，预计超出字幕时长过多时提前中止并改用更快语速")
+    parser.add_argument("--max_stretch", type=float, default=1.5, help="流式合成允许的最大时长倍数（相对字幕时长），默认1.5")
+    parser.add_argument("--register_speaker", action="store_true", help="将克隆角色通过/add_speaker注册到某台服务器，并固定在该服务器上用/speak合成")
+    parser.add_argument("--metrics_log", default=None, help="ffmpeg 运行指标日志路径（JSON Lines，记录耗时、CPU、内存）")
+    parser.add_argument("--ffmpeg_timeout", type=float, default=None, help="单次 ffmpeg 调用超时（秒），默认不限制")
+    parser.add_argument("--enqueue", default=None, help="只把任务写入指定的队列数据库，由 job_queue.py --worker 执行（按SRT文件拆分）")
+
+    args = parser.parse_args()
+    if args.incremental and args.clean_work:
+        # 增量模式依赖检查点目录中的上次渲染记录，清理后下次运行无从比较
+        parser.error("--incremental 不能与 --clean_work 同时使用")
+    return args
+
+class ConcurrencyTuner:
+    """TTS服务并发自动调优
+
+    按窗口统计完成请求的吞吐量、错误率和平均延迟：吞吐量上升时并发加一，
+    出现5xx/超时时乘性下调，延迟明显上升且吞吐量不再增加时减一。
+    每个服务地址的最佳并发数记录在 ~/.srt_toolkit/tts_concurrency.json 中，下次运行时作为初始值。
+    """
+    STATE_FILE = os.path.join(os.path.expanduser("~"), ".srt_toolkit", "tts_concurrency.json")
+
+    def __init__(self, server, min_limit=1, max_limit=16, verbose=False):
+        self.server = server
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.verbose = verbose
+        saved = self.load_state().get(server, {})
+        self.limit = min(max(saved.get('limit', 2), min_limit), max_limit)
+        self.best_limit = self.limit
+        self.best_throughput = 0.0
+        self.base_latency = None
+        self.lock = threading.Lock()
+        self._reset_window()
+
+    def _reset_window(self):
+        self.window_start = time.monotonic()
+        self.window_ok = 0
+        self.window_errors = 0
+        self.window_latency = 0.0
+
+    def record(self, latency, ok):
+        """记录一次请求结果，窗口统计满后调整并发上限"""
+        with self.lock:
+            if ok:
+                self.window_ok += 1
+            else:
+                self.window_errors += 1
+            self.window_latency += latency
+            if self.window_ok + self.window_errors >= max(4, self.limit * 2):
+                self._adjust()
+
+    def _adjust(self):
+        """根据当前窗口的统计结果调整并发上限"""
+        total = self.window_ok + self.window_errors
+        elapsed = max(time.monotonic() - self.window_start, 1e-6)
+        throughput = self.window_ok / elapsed
+        avg_latency = self.window_latency / total
+        error_rate = self.window_errors / total
+        old_limit = self.limit
+
+        if error_rate > 0.05:
+            # 过载: 乘性下调，并降低吞吐量基准，避免立即回升
+            self.limit = max(self.min_limit, min(self.limit - 1, int(self.limit * 0.7)))
+            self.best_throughput *= 0.9
+        else:
+            if self.base_latency is None or avg_latency < self.base_latency:
+                self.base_latency = avg_latency
+            if throughput > self.best_throughput * 1.05:
+                self.best_throughput = throughput
+                self.best_limit = self.limit
+                self.limit = min(self.max_limit, self.limit + 1)
+            elif avg_latency > self.base_latency * 2 and self.limit > self.best_limit:
+                self.limit = max(self.min_limit, self.limit - 1)
+
+        if self.limit != old_limit:
+            if self.verbose:
+                print(f"[{__name__}] [{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] >> TTS并发调整: {old_limit} -> {self.limit} "
+                      f"(吞吐 {throughput:.2f} 次/秒, 错误率 {error_rate:.0%}, 平均延迟 {avg_latency:.2f} 秒)")
+            self.save_state()
+        self._reset_window()
+
+    @classmethod
+    def load_state(cls):
+        try:
+            with open(cls.STATE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self):
+        """记录该服务地址的最佳并发数"""
+        state = self.load_state()
+        state[self.server] = {
+            'limit': self.best_limit,
+            'throughput': round(self.best_throughput, 3),
+            'updated': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        try:
+            os.makedirs(os.path.dirname(self.STATE_FILE), exist_ok=True)
+            temp_path = self.STATE_FILE + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.STATE_FILE)
+        except OSError:
+            pass  # 记录失败不影响合成
+
+class TTSEndpoint:
+    """TTS服务节点的运行状态"""
+    def __init__(self, url, tuner=None):
+        self.url = url.rstrip("/")
+        self.tuner = tuner
+        self.outstanding = 0
+        self.ejected_until = 0.0
+        self.failures = 0  # 连续失败的请求数
+        self.ejections = 0  # 连续剔除次数（决定剔除时长）
+
+    def capacity(self):
+        return self.tuner.limit if self.tuner else None
+
+    def healthy(self, now=None):
+        return (now or time.monotonic()) >= self.ejected_until
+
+class TTSEndpointPool:
+    """多台TTS服务器的负载均衡
+
+    - 选择在途请求最少的健康节点（least outstanding requests）
+    - 连接失败或超时时立即临时剔除节点；5xx 只说明单个请求失败，连续 eject_after 个请求失败才剔除
+    - 连续剔除时剔除时间加倍，真实请求成功后复位
+    - 后台线程定期请求 HEALTH_CHECK_PATH 主动探测所有节点，探测成功的节点提前恢复
+    - 注册在某台服务器上的角色（affinity）固定路由到该服务器
+    """
+    HEALTH_CHECK_PATH = "/audio_roles"  # 轻量的只读接口，能返回角色列表说明服务已就绪
+
+    def __init__(self, urls, auto_tune=False, eject_seconds=30, max_eject_seconds=300, eject_after=3,
+                 health_interval=15, verbose=False):
+        self.endpoints = [TTSEndpoint(url, ConcurrencyTuner(url, verbose=verbose) if auto_tune else None) for url in urls]
+        self.eject_seconds = eject_seconds
+        self.eject_after = eject_after
+        self.max_eject_seconds = max_eject_seconds
+        self.health_interval = health_interval
+        self.verbose = verbose
+        self.pins = {}  # affinity key -> TTSEndpoint
+        self.cond = threading.Condition()
+        self.health_thread = None
+        self.closed = False
+
+    def _log(self, message):
+        if self.verbose:
+            print(f"[{__name__}] [{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] >> {message}")
+
+    def acquire(self, affinity=None):
+        """获取一个可用节点并占用一个在途名额"""
+        self._start_health_checks()
+        with self.cond:
+            while True:
+                endpoint = self._choose(affinity)
+                if endpoint is not None:
+                    endpoint.outstanding += 1
+                    return endpoint
+                self.cond.wait(timeout=1.0)
+
+    def _choose(self, affinity):
+        now = time.monotonic()
+        pinned = self.pins.get(affinity) if affinity is not None else None
+        if pinned is not None:
+            candidates = [pinned]
+        else:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint.healthy(now)]
+            if not candidates:
+                # 全部被剔除时不阻塞，使用最早恢复的节点
+                candidates = [min(self.endpoints, key=lambda endpoint: endpoint.ejected_until)]
+        available = [endpoint for endpoint in candidates
+                     if endpoint.capacity() is None or endpoint.outstanding < endpoint.capacity()]
+        if not available:
+            return None
+        return min(available, key=lambda endpoint: endpoint.outstanding)
+
+    def release(self, endpoint, latency, ok, error=None):
+        """归还名额并记录结果；连接失败、超时或连续多个请求失败时临时剔除节点"""
+        with self.cond:
+            endpoint.outstanding -= 1
+            if ok:
+                endpoint.failures = 0
+                endpoint.ejections = 0
+            else:
+                endpoint.failures += 1
+                if self._unreachable(error) or endpoint.failures >= self.eject_after:
+                    self._eject(endpoint)
+            self.cond.notify_all()
+        if endpoint.tuner:
+            endpoint.tuner.record(latency, ok)
+
+    def _unreachable(self, error):
+        """连接失败、超时或响应中途断开：节点本身不可用，而不是某个请求出错"""
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                                  requests.exceptions.ChunkedEncodingError))
+
+    def _eject(self, endpoint):
+        if len(self.endpoints) == 1:
+            return  # 只有一个节点时剔除没有意义，由并发调优负责降载
+        endpoint.ejections += 1
+        seconds = min(self.eject_seconds * (2 ** (endpoint.ejections - 1)), self.max_eject_seconds)
+        endpoint.ejected_until = time.monotonic() + seconds
+        self._log(f"TTS节点暂时剔除 {seconds} 秒: {endpoint.url}（连续失败 {endpoint.failures} 次）")
+
+    def pin(self, affinity, endpoint):
+        with self.cond:
+            self.pins[affinity] = endpoint
+
+    def unpin(self, affinity):
+        with self.cond:
+            self.pins.pop(affinity, None)
+
+    def pinned(self, affinity):
+        """返回角色固定的节点；节点已被剔除时返回None"""
+        with self.cond:
+            endpoint = self.pins.get(affinity)
+            return endpoint if endpoint is not None and endpoint.healthy() else None
+
+    def _start_health_checks(self):
+        if self.health_thread is not None or len(self.endpoints) == 1:
+            return
+        with self.cond:
+            if self.health_thread is None:
+                self.health_thread = threading.Thread(target=self._health_loop, daemon=True)
+                self.health_thread.start()
+
+    def _health_loop(self):
+        while not self.closed:
+            for endpoint in self.endpoints:
+                try:
+                    ok = get_transport().get(f"{endpoint.url}{self.HEALTH_CHECK_PATH}", timeout=5).status_code == 200
+                except requests.exceptions.RequestException:
+                    ok = False
+                with self.cond:
+                    if ok and not endpoint.healthy():
+                        # 剔除次数保留到真实请求成功为止，反复出错的节点剔除时间会持续加倍
+                        endpoint.ejected_until = 0.0
+                        self._log(f"TTS节点恢复: {endpoint.url}")
+                    elif not ok and endpoint.healthy():
+                        self._eject(endpoint)
+                    self.cond.notify_all()
+            time.sleep(self.health_interval)
+
+    def close(self):
+        self.closed = True
+        for endpoint in self.endpoints:
+            if endpoint.tuner:
+                endpoint.tuner.save_state()
+
+class MixTimeline:
+    """PCM混音时间轴文件（单声道 s16le，MIX_SAMPLE_RATE）的内存映射
+
+    分段完成后立即叠加到对应位置；写入超出文件长度时扩展文件并重新映射。
+    多个线程可能同时写入，读写都在锁内进行。
+    """
+    def __init__(self, path, keep=False):
+        self.path = path
+        self.entries = {}  # 字幕序号 -> 已放置分段的混音记录（写入 render.json）
+        self.lock = threading.Lock()
+        if not keep and os.path.exists(path):
+            os.remove(path)
+        with open(path, 'ab'):
+            pass
+        self.samples = os.path.getsize(path) // 2
+        self.array = None
+        self._map()
+
+    def _map(self):
+        # 空文件无法映射，首次写入时再扩展
+        self.array = np.memmap(self.path, dtype=np.int16, mode='r+', shape=(self.samples,)) if self.samples else None
+
+    def _resize(self, samples):
+        if self.array is not None:
+            self.array.flush()
+        self.array = None
+        with open(self.path, 'r+b') as f:
+            f.truncate(samples * 2)
+        self.samples = samples
+        self._map()
+
+    def add(self, offset, pcm, window_start=0, window_end=None):
+        """将PCM叠加到 offset 处，只写入 [window_start, window_end) 范围"""
+        with self.lock:
+            end = offset + len(pcm)
+            if end > self.samples:
+                # 按比例扩展，逐段写入时不必每次重新映射；close() 时截断为最终长度
+                self._resize(max(end, self.samples * 3 // 2))
+            window_end = self.samples if window_end is None else window_end
+            start = max(offset, window_start)
+            stop = min(end, window_end)
+            if start >= stop:
+                return
+            mixed = self.array[start:stop].astype(np.int32) + pcm[start - offset:stop - offset]
+            self.array[start:stop] = np.clip(mixed, -32768, 32767)
+
+    def subtract(self, offset, pcm):
+        """撤销 add()（叠加时被削波的采样无法完全还原，只在字幕重叠且音量很大时出现）"""
+        self.add(offset, -pcm.astype(np.int32))
+
+    def clear(self, start, end):
+        with self.lock:
+            end = min(end, self.samples)
+            if start < end:
+                self.array[start:end] = 0
+
+    def close(self, samples=None):
+        """写回磁盘；给定 samples 时把文件截断为最终长度"""
+        with self.lock:
+            if self.array is not None:
+                self.array.flush()
+            self.array = None
+            if samples is not None:
+                with open(self.path, 'r+b') as f:
+                    f.truncate(samples * 2)
+                self.samples = samples
+
+class PcmResampler:
+    """把流式到达的 s16le PCM 分块转换为时间轴格式（单声道，MIX_SAMPLE_RATE），跨分块保持线性插值连续"""
+    def __init__(self, sample_rate, channels):
+        self.step = sample_rate / MIX_SAMPLE_RATE
+        self.frame_bytes = 2 * channels
+        self.channels = channels
+        self.remainder = b""  # 不足一帧的字节
+        self.tail = np.empty(0)  # 尚未用完的输入采样
+        self.position = 0.0  # 下一个输出采样在 tail 中的位置
+
+    def feed(self, data):
+        data = self.remainder + data
+        usable = len(data) - len(data) % self.frame_bytes
+        self.remainder = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype=np.int16)
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        if self.step == 1.0:
+            return samples.astype(np.int16)
+        source = np.concatenate([self.tail, samples])
+        count = int((len(source) - 1 - self.position) // self.step) + 1 if len(source) - 1 >= self.position else 0
+        pcm = np.interp(self.position + np.arange(count) * self.step, np.arange(len(source)), source)
+        self.position += count * self.step
+        drop = min(int(self.position), len(source))
+        self.tail = source[drop:]
+        self.position -= drop
+        return np.round(pcm).astype(np.int16)
+
+class StreamTarget:
+    """流式合成结果的去向：PCM 转换为时间轴格式后写入分段文件，并可直接叠加到混音时间轴
 
-    return parser.parse_args()
+    同组重复字幕共用一次合成，每条字幕一个分段文件和一个时间轴位置。
+    不保留音频数据，只记录已写入的采样数；请求中止或失败时 discard() 撤销已写入的内容。
+    """
+    def __init__(self, paths=(), mix=None, offsets=()):
+        self.paths = list(paths)
+        self.mix = mix
+        self.offsets = list(offsets)
+        self.files = []
+        self.resampler = None
+        self.samples = 0
+
+    def begin(self, sample_rate, channels):
+        self.resampler = PcmResampler(sample_rate, channels)
+        self.files = [open(path + ".part", 'wb') for path in self.paths]
+        self.samples = 0
+
+    def write(self, data):
+        pcm = self.resampler.feed(data)
+        if not len(pcm):
+            return
+        for f in self.files:
+            f.write(pcm.tobytes())
+        if self.mix is not None:
+            for offset in self.offsets:
+                self.mix.add(offset + self.samples, pcm)
+        self.samples += len(pcm)
+
+    def finish(self):
+        """完成写入并返回采样数；没有收到任何音频时视为合成失败"""
+        if not self.samples:
+            self.discard()
+            return 0
+        self._close_files()
+        for path in self.paths:
+            os.replace(path + ".part", path)
+        return self.samples
+
+    def discard(self):
+        self._close_files()
+        if self.mix is not None and self.samples and self.paths:
+            # 从已写入的分段文件读回，减去已叠加到时间轴的部分
+            pcm = np.fromfile(self.paths[0] + ".part", dtype=np.int16)
+            for offset in self.offsets:
+                self.mix.subtract(offset, pcm)
+        for path in self.paths:
+            if os.path.exists(path + ".part"):
+                os.remove(path + ".part")
+        self.samples = 0
+
+    def _close_files(self):
+        for f in self.files:
+            f.close()
+        self.files = []
 
 class SrtTTS:
     def __init__(self, input, output=None, subtitle_suffix="_cn", audio_suffix="", audio_codec="aac", audio_quality="-vbr 3", 
                  audio_format="m4a", speech_speed="moderate", speech_pitch="moderate", voice_role="male", clone_role="", 
-                 verbose=False, speed_detection=True, speed_adjust=False, alternative=0):  # Add alternative parameter
+                 verbose=False, speed_detection=True, speed_adjust=False, alternative=0, dedup=True,
+                 work_dir=None, clean_work=False, incremental=False, tts_workers=1, cpu_workers=None,
+                 tts_urls=None, register_speaker=False, tts_timeout=300, stream=False, max_stretch=1.5,
+                 force=False):  # Add alternative parameter
         self.input = input
         self.output = output
         self.subtitle_suffix = subtitle_suffix
@@ -70,39 +507,379 @@ class SrtTTS:
         self.speed_detection = speed_detection
         self.speed_adjust = speed_adjust  # 新增speed_adjust属性
         self.alternative = alternative  # Add alternative attribute
+        self.dedup = dedup  # 新增: 相同文本只合成一次
+        self.work_dir = work_dir  # 新增: 分段检查点根目录
+        self.clean_work = clean_work
+        self.incremental = incremental  # 新增: 基于上次混音结果增量更新
+        self.force = force  # 新增: 忽略构建记录与检查点，全部重新合成
+        # 新增: TTS服务节点池；auto 时每个节点由 ConcurrencyTuner 在运行中调整实际并发
+        self.auto_tune = str(tts_workers) == "auto"
+        self.pool = TTSEndpointPool(tts_urls or TTS_BASE_URLS, auto_tune=self.auto_tune, verbose=verbose)
+        if self.auto_tune:
+            self.tts_workers = sum(endpoint.tuner.max_limit for endpoint in self.pool.endpoints)
+        else:
+            self.tts_workers = max(1, int(tts_workers))
+        # 过载或多节点时，5xx 先在（调整后的）服务上重试，而不是直接判定角色失败
+        self.retry_on_overload = self.auto_tune or len(self.pool.endpoints) > 1
+        # 新增: 共享HTTP传输层，每个节点的连接池按并发数配置
+        self.transport = get_transport()
+        self.tts_timeout = tts_timeout
+        for endpoint in self.pool.endpoints:
+            self.transport.configure_host(endpoint.url, self.tts_workers)
+        self.catalog = get_catalog()  # 新增: 角色索引（参考音频、哈希、参考文本）
+        self.register_speaker = register_speaker  # 新增: 克隆角色注册到服务器后按名称合成
+        self.stream = stream  # 新增: 流式合成（以WAV/PCM接收）
+        self.max_stretch = max_stretch
+        self.registered_speakers = {}
+        self.register_lock = threading.Lock()
+        self.cpu_workers = cpu_workers or os.cpu_count() or 1  # 新增: 解码/调整进程数
+        self.stop_requested = False  # 新增: 由GUI停止按钮等外部调用设置
 
-    def process_srt_files(self):
-        """处理指定目录下的所有SRT文件"""
+    def process_srt_files(self, srt_paths=None):
+        """处理指定目录下的所有SRT文件；给定 srt_paths 时只处理这些文件"""
         current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         if self.verbose:
             print(f"[{__name__}] [{current_time}] >> 开始处理目录: {self.input}")
         
-        # 新增: 添加目录处理进度条
-        srt_files = [f for f in os.listdir(self.input) if f.endswith(f"{self.subtitle_suffix}.srt")]
-        for srt_file in tqdm(srt_files, desc="Processing SRT files"):
-            self.process_single_srt(os.path.join(self.input, srt_file))
+        stats = RequestStats() if self.verbose else None
+        if stats:
+            self.transport.add_hook(stats)
+        try:
+            # 新增: 添加目录处理进度条
+            if srt_paths is None:
+                srt_paths = [os.path.join(self.input, f) for f in os.listdir(self.input) if f.endswith(f"{self.subtitle_suffix}.srt")]
+            for srt_path in tqdm(srt_paths, desc="Processing SRT files"):
+                if self.stop_requested:
+                    break
+                self.process_single_srt(srt_path)
+        finally:
+            self.pool.close()
+            if stats:
+                self.transport.remove_hook(stats)
+                stats.report(__name__)
+
+    def stop(self):
+        """请求停止处理，已完成的分段保留在检查点目录中，下次运行时继续"""
+        self.stop_requested = True
 
     def process_single_srt(self, srt_file_path):
         """处理单个SRT文件"""
         current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         if self.verbose:
             print(f"[{__name__}] [{current_time}] >> 开始处理文件: {srt_file_path}")
+        # 字幕内容与合成参数均未变化时，最终音频已是最新
+        output_path = self.final_audio_path(srt_file_path)
+        work_dir = self.get_work_dir(srt_file_path)
+        if self.force:
+            # 服务端或模型变化不体现在参数中：丢弃已完成的分段，全部重新合成
+            reason = "--force"
+            shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            reason = stale_reason(output_path, [srt_file_path], self.build_params())
+        if reason is None:
+            print(f"[{__name__}] [{current_time}] >> 音频已是最新，跳过: {output_path}")
+            return
+        if self.verbose and os.path.exists(output_path):
+            print(f"[{__name__}] [{current_time}] >> 重新合成（{reason}）: {output_path}")
         subtitles = self.parse_srt(srt_file_path)
-        # 新增: 如果speed_detection为True，则进行语速探测
+        checkpoint = self.load_checkpoint(work_dir, srt_file_path)
+        # 新增: 如果speed_detection为True，则进行语速探测（续跑时复用上次探测结果）
         if self.speed_detection:
-            self.speech_speed = self.detect_optimal_speed(subtitles)
-        audio_segments = []
-        # 新增: 添加字幕处理进度条
-        for subtitle in tqdm(subtitles, desc="Synthesizing subtitles", leave=False):
-            audio_segment = self.synthesize_speech(subtitle)
+            if checkpoint['manifest'].get('detected_speed'):
+                self.speech_speed = checkpoint['manifest']['detected_speed']
+            else:
+                self.speech_speed = self.detect_optimal_speed(subtitles)
+                checkpoint['manifest']['detected_speed'] = self.speech_speed
+                self.write_json_atomic(os.path.join(work_dir, "manifest.json"), checkpoint['manifest'])
+
+        done = {pos for pos, subtitle in enumerate(subtitles) if self.find_checkpoint_segment(checkpoint, subtitle)}
+        if done:
+            first_missing = next((subtitles[pos]['index'] for pos in range(len(subtitles)) if pos not in done), None)
+            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            if first_missing is None:
+                print(f"[{__name__}] [{current_time}] >> 发现检查点: 全部 {len(subtitles)} 段已完成，直接混音")
+            else:
+                print(f"[{__name__}] [{current_time}] >> 发现检查点: 已完成 {len(done)}/{len(subtitles)} 段，从第 {first_missing} 条字幕继续")
+
+        groups = self.group_duplicate_subtitles(subtitles)
+        pending = [positions for positions in groups if any(pos not in done for pos in positions)]
+        missing = sum(1 for positions in pending for pos in positions if pos not in done)
+        mix = self.open_mix(checkpoint, subtitles)
+        failed = self.synthesize_segments(subtitles, pending, done, checkpoint, mix)
+        if self.verbose and self.dedup:
+            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            print(f"[{__name__}] [{current_time}] >> 字幕去重: {missing} 条待合成字幕共发起 {len(pending)} 次合成请求，节省 {missing - len(pending)} 次")
+
+        # 只有全部分段完成后才进行混音
+        if self.stop_requested or len(done) + len(failed) < len(subtitles):
+            mix.close()
+            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            print(f"[{__name__}] [{current_time}] >> 处理已中断，已保存 {len(done)}/{len(subtitles)} 段至 {work_dir}，重新运行即可继续")
+            return
+
+        timeline_path = self.finish_mix(mix, checkpoint, subtitles)
+        self.save_final_audio(timeline_path, srt_file_path)
+        if failed:
+            # 合成失败的分段未放置：音频不完整，不记为最新，下次运行重试这些分段
+            invalidate(output_path)
+            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            print(f"[{__name__}] [{current_time}] >> {len(failed)} 段合成失败，音频不完整，重新运行将重试: {output_path}")
+        else:
+            record_build(output_path, [srt_file_path], self.build_params())
+            if self.clean_work:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    def synthesize_segments(self, subtitles, pending, done, checkpoint, mix):
+        """分阶段流水线：合成线程（网络）-> 进程池（时长调整、落盘、解码）-> 主线程记录检查点并放置到混音时间轴
+
+        同时在途的分组数有上限，合成结果在队列中堆积时会暂停提交新的合成请求。
+        返回本次合成失败（空音频）的分段位置集合。
+        """
+        failed = set()
+        max_inflight = self.tts_workers + self.cpu_workers * 2
+        options = self.segment_options()
+        # 流式合成且无需调整时长时，合成线程已把分段写入文件和时间轴，不经过进程池
+        direct = self.stream and not self.speed_adjust
+
+        def record_results(results, placed=False):
+            for pos, record in results:
+                if record is None:
+                    failed.add(pos)
+                    continue
+                self.append_checkpoint_record(checkpoint, record)
+                self.place_segment(mix, checkpoint, subtitles[pos], placed)
+                done.add(pos)
+
+        synth_futures = {}
+        fit_futures = {}
+        queue = iter(pending)
+        exhausted = False
+        # 新增: 添加字幕处理进度条（按去重后的合成请求计数）
+        with ThreadPoolExecutor(max_workers=self.tts_workers) as io_pool, \
+                ProcessPoolExecutor(max_workers=self.cpu_workers, mp_context=segment_pool_context()) as cpu_pool, \
+                tqdm(total=len(pending), desc="Synthesizing subtitles", leave=False) as pbar:
+            while True:
+                # 背压: 在途分组（合成中 + 等待/正在处理）达到上限时不再提交
+                while not exhausted and not self.stop_requested and len(synth_futures) + len(fit_futures) < max_inflight:
+                    positions = next(queue, None)
+                    if positions is None:
+                        exhausted = True
+                        break
+                    group = [(pos, subtitles[pos]) for pos in positions if pos not in done]
+                    future = io_pool.submit(self.synthesize_group, checkpoint['work_dir'], group, mix)
+                    synth_futures[future] = group
+                if not synth_futures and not fit_futures:
+                    break
+
+                finished, _ = wait(list(synth_futures) + list(fit_futures), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if future in synth_futures:
+                        group = synth_futures.pop(future)
+                        pbar.update(1)
+                        if direct:
+                            record_results(future.result(), placed=True)
+                            continue
+                        fit_future = cpu_pool.submit(process_segment_group, options, checkpoint['work_dir'],
+                                                     group, future.result())
+                        fit_futures[fit_future] = group
+                    else:
+                        fit_futures.pop(future)
+                        record_results(future.result())
+        return failed
+
+    def synthesize_group(self, work_dir, group, mix):
+        """合成阶段（合成线程）：同组字幕共用一次合成，按时长最短的字幕判断超长和选择语速，合成结果放得进组内每一条
+
+        非流式时返回音频内容，由进程池调整时长并解码。流式时PCM边接收边转换为时间轴格式写入文件：
+        需要调整时长时写入一个临时文件并返回其路径；否则直接写入每条字幕的分段文件并叠加到时间轴，
+        返回 (位置, 检查点记录) 列表。
+        """
+        shortest = min((subtitle for _, subtitle in group), key=lambda subtitle: subtitle['end_time'] - subtitle['start_time'])
+        if not self.stream:
+            return self.synthesize_speech(shortest)
+        if self.speed_adjust:
+            temp_path = os.path.join(work_dir, f"stream_{shortest['index']:05d}.pcm")
+            return temp_path if self.synthesize_speech(shortest, target=StreamTarget([temp_path])) else None
+        filenames = [self.segment_filename(subtitle) for _, subtitle in group]
+        offsets = [int(round(subtitle['start_time'] * MIX_SAMPLE_RATE)) for _, subtitle in group]
+        target = StreamTarget([os.path.join(work_dir, filename) for filename in filenames], mix, offsets)
+        ok = self.synthesize_speech(shortest, target=target)
+        return [(pos, self.checkpoint_record(subtitle, filename) if ok else None)
+                for (pos, subtitle), filename in zip(group, filenames)]
+
+    def segment_options(self):
+        """分段处理进程所需的参数（需可序列化）"""
+        return {
+            # 流式合成的分段直接保存为时间轴格式的PCM，最终编码仍使用 audio_codec
+            'audio_codec': "pcm_s16le" if self.stream else self.audio_codec,
+            'audio_format': "pcm" if self.stream else self.audio_format,
+            'speed_adjust': self.speed_adjust,
+            'verbose': self.verbose,
+        }
+
+    def process_segments(self, work_dir, group, audio_data):
+        """调整同一合成结果对应的各个分段时长，落盘并预先解码为PCM，返回 (位置, 检查点记录)
+
+        流式合成时 audio_data 为合成线程写入的临时PCM文件（时间轴格式），读取后删除。
+        """
+        stream = self.segment_options()['audio_format'] == "pcm"
+        if stream and audio_data is not None:
+            temp_path = audio_data
+            audio_data = np.fromfile(temp_path, dtype=np.int16)
+            os.remove(temp_path)
+        adjust = self.adjust_pcm_duration if stream else self.adjust_audio_duration
+        results = []
+        adjusted_cache = {}  # 同一组内时长相同的字幕复用调整结果
+        for pos, subtitle in group:
             # 修改: 根据speed_adjust标志决定是否调整时长
-            if self.speed_adjust:
-                adjusted_audio = self.adjust_audio_duration(audio_segment, subtitle)
+            if self.speed_adjust and audio_data is not None and len(audio_data):
+                target = round(subtitle['end_time'] - subtitle['start_time'], 3)
+                if target not in adjusted_cache:
+                    adjusted_cache[target] = adjust(audio_data, subtitle)
+                adjusted_audio = adjusted_cache[target]
             else:
-                adjusted_audio = audio_segment
-            audio_segments.append(adjusted_audio)
-        final_audio = self.concatenate_audio(audio_segments, subtitles)
-        self.save_final_audio(final_audio, srt_file_path)
+                adjusted_audio = audio_data
+            results.append((pos, self.save_checkpoint_segment(work_dir, subtitle, adjusted_audio)))
+        return results
+
+    def get_work_dir(self, srt_file_path):
+        """获取单个SRT文件的分段检查点目录"""
+        base = os.path.splitext(os.path.basename(srt_file_path))[0]
+        root = self.work_dir or self.output or self.input
+        return os.path.join(root, f".{base}.tts_work")
+
+    def checkpoint_params(self):
+        """影响分段合成结果的参数，参数变化时检查点失效"""
+        return {
+            'audio_codec': self.audio_codec,
+            'audio_format': self.audio_format,
+            'speech_speed': self.speech_speed if not self.speed_detection else None,
+            'speech_pitch': self.speech_pitch,
+            'voice_role': self.voice_role,
+            'clone_role': self.clone_role,
+            'alternative': self.alternative,
+            'speed_adjust': self.speed_adjust,
+            'stream': self.stream,
+            # 参考音频内容变化时，已合成的克隆分段同样失效
+            'clone_hashes': self.clone_role_hashes(),
+        }
+
+    def build_params(self):
+        """影响最终音频的参数（构建清单用）"""
+        return {**self.checkpoint_params(), 'audio_quality': self.audio_quality}
+
+    def clone_role_candidates(self):
+        """依次尝试的克隆角色名（角色名 + 数字后缀）；均不存在时按原名查找（如 Mega 角色 bbc_news）"""
+        if not self.clone_role:
+            return []
+        candidates = [f"{self.clone_role}{attempt + 1}" for attempt in range(self.alternative + 1)]  # 修复: 总是添加数字后缀
+        if not any(self.catalog.get(name) for name in candidates) and self.catalog.get(self.clone_role):
+            candidates = [self.clone_role]
+        return candidates
+
+    def clone_role_hashes(self):
+        hashes = []
+        for name in self.clone_role_candidates():
+            role = self.catalog.get(name)
+            hashes.append(self.catalog.content_hash(role) if role else None)
+        return hashes
+
+    def load_checkpoint(self, work_dir, srt_file_path):
+        """加载（或新建）检查点：manifest.json 记录参数，segments.jsonl 逐行记录已完成的分段"""
+        manifest_path = os.path.join(work_dir, "manifest.json")
+        params = self.checkpoint_params()
+        manifest = None
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                manifest = None
+        if manifest is None or manifest.get('params') != params:
+            if manifest is not None and self.verbose:
+                print(f"[{__name__}] [{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] >> 合成参数已变化，丢弃旧检查点: {work_dir}")
+            shutil.rmtree(work_dir, ignore_errors=True)
+            manifest = {'srt': os.path.abspath(srt_file_path), 'params': params}
+        os.makedirs(work_dir, exist_ok=True)
+        self.write_json_atomic(manifest_path, manifest)
+
+        segments = {}
+        segments_path = os.path.join(work_dir, "segments.jsonl")
+        if os.path.exists(segments_path):
+            with open(segments_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # 中断时可能留下不完整的最后一行
+                    segments[record['index']] = record
+        return {'work_dir': work_dir, 'manifest': manifest, 'segments': segments}
+
+    def find_checkpoint_segment(self, checkpoint, subtitle):
+        """返回字幕对应的已完成分段文件路径；文本或时间轴不一致时视为未完成"""
+        record = checkpoint['segments'].get(subtitle['index'])
+        if not record:
+            return None
+        if (record['text'] != subtitle['text'] or record['start_time'] != subtitle['start_time']
+                or record['end_time'] != subtitle['end_time']):
+            return None
+        path = os.path.join(checkpoint['work_dir'], record['file'])
+        return path if os.path.exists(path) else None
+
+    def save_checkpoint_segment(self, work_dir, subtitle, audio_data):
+        """落盘单个分段及其PCM解码结果，返回检查点记录；合成失败或无法解码的分段返回None，续跑时会重试
+
+        流式合成的分段已是时间轴格式的PCM，直接保存。
+        """
+        if audio_data is None or len(audio_data) == 0:
+            return None
+        filename = self.segment_filename(subtitle)
+        segment_path = os.path.join(work_dir, filename)
+        temp_path = segment_path + ".part"
+        if self.segment_options()['audio_format'] == "pcm":
+            audio_data.tofile(temp_path)
+            os.replace(temp_path, segment_path)
+            return self.checkpoint_record(subtitle, filename)
+        with open(temp_path, 'wb') as f:
+            f.write(audio_data)
+        os.replace(temp_path, segment_path)
+
+        pcm = self.decode_to_pcm(segment_path)
+        if pcm is None:
+            if self.verbose:
+                print(f"[{__name__}] [{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] >> 跳过无效的音频片段: {segment_path}")
+            os.remove(segment_path)
+            return None
+        pcm_path = os.path.splitext(segment_path)[0] + ".pcm"
+        pcm.tofile(pcm_path + ".part")
+        os.replace(pcm_path + ".part", pcm_path)
+        return self.checkpoint_record(subtitle, filename)
+
+    def segment_filename(self, subtitle):
+        return f"seg_{subtitle['index']:05d}.{self.segment_options()['audio_format']}"
+
+    def checkpoint_record(self, subtitle, filename):
+        """segments.jsonl 中的一条已完成分段记录"""
+        return {
+            'index': subtitle['index'],
+            'text': subtitle['text'],
+            'start_time': subtitle['start_time'],
+            'end_time': subtitle['end_time'],
+            'file': filename,
+        }
+
+    def append_checkpoint_record(self, checkpoint, record):
+        """追加一条已完成分段记录（仅在主线程调用）"""
+        with open(os.path.join(checkpoint['work_dir'], "segments.jsonl"), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        checkpoint['segments'][record['index']] = record
+
+    def write_json_atomic(self, path, data):
+        """先写临时文件再替换，避免中断时留下损坏的JSON"""
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, path)
 
     def parse_srt(self, srt_file_path):
         """解析SRT文件，返回字幕列表"""
@@ -117,6 +894,21 @@ class SrtTTS:
             })
         return subtitles
 
+    def normalize_text(self, text):
+        """归一化字幕文本，用于判断重复字幕"""
+        text = unicodedata.normalize("NFKC", text)
+        return re.sub(r"\s+", " ", text).strip()
+
+    def group_duplicate_subtitles(self, subtitles):
+        """按归一化文本对字幕分组，返回每组字幕在列表中的位置"""
+        if not self.dedup:
+            return [[pos] for pos in range(len(subtitles))]
+
+        groups = {}
+        for pos, subtitle in enumerate(subtitles):
+            groups.setdefault(self.normalize_text(subtitle['text']), []).append(pos)
+        return list(groups.values())
+
     def time_to_seconds(self, timecode):
         """将SRT时间码转换为秒数"""
         h, m, s, ms = map(int, re.match(r'(\d+):(\d+):(\d+),(\d+)', timecode).groups())
@@ -146,14 +938,17 @@ class SrtTTS:
         if self.verbose:
             print(f"[{__name__}] [{current_time}] >> 有效的最快字幕: {fastest_subtitle} (语速: {self.calculate_speech_speed(fastest_subtitle):.3f} 字/秒)")
             
-        # 定义语速范围
-        speeds = ["very_low", "low", "moderate", "high", "very_high"]
         # 从慢到快尝试每种语速
-        for speed in speeds:
-            # 生成不同语速的语音
-            audio_segment = self.synthesize_speech(fastest_subtitle, speed)
-            # 检查是否可以完全播放
-            if self.can_play_fully(audio_segment, fastest_subtitle):
+        for speed in SPEECH_SPEEDS:
+            if self.stream:
+                # 流式合成不保存音频：最长只接收字幕时长，中途超出即无法完整播放
+                fits = self.stream_fits(fastest_subtitle, speed)
+            else:
+                # 生成不同语速的语音
+                audio_segment = self.synthesize_speech(fastest_subtitle, speed, allow_overrun_retry=False)
+                # 检查是否可以完全播放
+                fits = self.can_play_fully(audio_segment, fastest_subtitle)
+            if fits:
                 print(f"[{__name__}] [{current_time}] >> 探测到的最优语速: {speed}")
                 return speed
 
@@ -161,36 +956,69 @@ class SrtTTS:
         print(f"[{__name__}] [{current_time}] >> 未找到合适的语速，使用默认语速: very_high")
         return "very_high"
 
+    def stream_fits(self, subtitle, speed):
+        """流式合成能否在字幕时长内完整播放"""
+        try:
+            return bool(self._synthesize_once(subtitle, speed, subtitle['end_time'] - subtitle['start_time']))
+        except SegmentOverrun:
+            return False
+
     # 修改: 添加speed参数
-    def synthesize_speech(self, subtitle, speed=None):
-        """调用语音合成API，获取合成后的音频文件"""
+    def synthesize_speech(self, subtitle, speed=None, allow_overrun_retry=True, target=None):
+        """调用语音合成API，获取合成后的音频文件
+
+        流式合成时PCM写入 target，返回写入的采样数；若语音预计超出字幕时长的 max_stretch 倍则提前中止，
+        改用更快一档语速重新合成。
+        """
         speed = speed if speed else self.speech_speed
+        while True:
+            fastest = speed == SPEECH_SPEEDS[-1]
+            try:
+                max_seconds = None
+                if self.stream and allow_overrun_retry and not fastest:
+                    max_seconds = (subtitle['end_time'] - subtitle['start_time']) * self.max_stretch
+                return self._synthesize_once(subtitle, speed, max_seconds if max_seconds and max_seconds > 0 else None, target)
+            except SegmentOverrun as e:
+                faster = SPEECH_SPEEDS[min(SPEECH_SPEEDS.index(speed) + 1, len(SPEECH_SPEEDS) - 1)] if speed in SPEECH_SPEEDS else SPEECH_SPEEDS[-1]
+                if self.verbose:
+                    print(f"[{__name__}] [{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] >> 第 {subtitle.get('index')} 条字幕 {e}，改用语速 {faster} 重新合成")
+                speed = faster
+
+    def _synthesize_once(self, subtitle, speed, max_seconds=None, target=None):
+        """按当前语速合成一次（克隆角色依次尝试，失败时回退普通合成）"""
         if self.clone_role:
-            max_attempts = self.alternative + 1
-            for attempt in range(max_attempts):
-                current_clone_role = f"{self.clone_role}{attempt + 1}"  # 修复: 总是添加数字后缀
-                role_dir = os.path.join("flashtts_data", "roles", current_clone_role)
+            candidates = self.clone_role_candidates()
+            max_attempts = len(candidates)
+            for attempt, current_clone_role in enumerate(candidates):
+                role = self.catalog.get(current_clone_role)
 
-                if not os.path.exists(role_dir):
+                if role is None:
                     if attempt == max_attempts - 1:
                         print(f"[{__name__}] [{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] >> 所有克隆角色尝试失败，切换回普通语音合成")
-                        return self._fallback_to_normal_tts(subtitle, speed)
+                        return self._fallback_to_normal_tts(subtitle, speed, max_seconds, target)
                     continue
                 
-                try:
-                    # 修改: 首次尝试带reference_text，重试时不带
-                    return self._try_clone_synthesis(subtitle, speed, role_dir, current_clone_role, include_ref_text=(attempt == 0))
-                except requests.exceptions.HTTPError as e:
-                    print(e)
-                    if e.response.status_code == 500 and attempt < max_attempts - 1:
-                        continue
-                    print(f"[{__name__}] [{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] >> 克隆语音合成失败，切换回普通语音合成")
-                    return self._fallback_to_normal_tts(subtitle, speed)
-            return self._fallback_to_normal_tts(subtitle, speed)
+                # 启用并发调优时，500可能是服务过载而非角色问题：并发下调后先重试同一角色一次
+                overload_retries = 1 if self.retry_on_overload else 0
+                while True:
+                    try:
+                        # 修改: 首次尝试带reference_text，重试时不带
+                        return self._try_clone_synthesis(subtitle, speed, role, include_ref_text=(attempt == 0), max_seconds=max_seconds, target=target)
+                    except requests.exceptions.HTTPError as e:
+                        print(e)
+                        if e.response.status_code == 500 and overload_retries > 0:
+                            overload_retries -= 1
+                            continue
+                        break
+                if attempt < max_attempts - 1:
+                    continue
+                print(f"[{__name__}] [{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] >> 克隆语音合成失败，切换回普通语音合成")
+                return self._fallback_to_normal_tts(subtitle, speed, max_seconds, target)
+            return self._fallback_to_normal_tts(subtitle, speed, max_seconds, target)
         else:
-            return self._fallback_to_normal_tts(subtitle, speed)
+            return self._fallback_to_normal_tts(subtitle, speed, max_seconds, target)
 
-    def _fallback_to_normal_tts(self, subtitle, speed):
+    def _fallback_to_normal_tts(self, subtitle, speed, max_seconds=None, target=None):
         """回退到普通语音合成"""
         payload = {
             "name": self.voice_role,
@@ -201,115 +1029,387 @@ class SrtTTS:
             "top_k": 50,
             "top_p": 0.95,
             "max_tokens": 2048,
-            "stream": False,
-            "response_format": self.audio_codec
+            **self.response_options()
         }
-        resp = requests.post(f"{TTS_BASE_URL}/speak", json=payload)
-        return resp.content if resp.status_code == 200 else b""
+        read_audio = lambda resp: self.read_audio(resp, max_seconds, target)
+        resp = self._post("/speak", read_audio=read_audio, json=payload)
+        if resp.status_code >= 500 and self.retry_on_overload:
+            resp = self._post("/speak", read_audio=read_audio, json=payload)  # 过载时并发已下调，重试一次
+        return resp.audio if resp.status_code == 200 else b""
 
-    def _try_clone_synthesis(self, subtitle, speed, role_dir, clone_role, include_ref_text=True):
+    def _try_clone_synthesis(self, subtitle, speed, role, include_ref_text=True, max_seconds=None, target=None):
         """尝试使用特定克隆角色进行语音合成"""
-        ref_audio_path = os.path.join(role_dir, "reference_audio.wav")
-        ref_text_path = os.path.join(role_dir, "reference_text.txt")
-        
-        if not os.path.exists(ref_audio_path):
-            raise FileNotFoundError(f"Reference audio not found: {ref_audio_path}")
+        # Mega 角色总是先注册（随 latent 上传），避免服务器每条字幕重新编码说话人
+        if self.register_speaker or role['kind'] == "mega-roles":
+            return self._speak_registered(subtitle, speed, role, max_seconds, target)
             
         payload = {
             "text": subtitle['text'],
             "temperature": 0.9,
-            "response_format": self.audio_codec,
             "pitch": self.speech_pitch,
             "speed": speed,
             "top_k": 50,
             "top_p": 0.95,
             "max_tokens": 2048,
-            "stream": False
+            **self.response_options()
         }
         
         # 修改: 根据include_ref_text标志决定是否添加reference_text
-        if include_ref_text and os.path.exists(ref_text_path):
-            with open(ref_text_path, "r", encoding="utf-8") as text_file:
-                payload["reference_text"] = text_file.read().strip()
+        if include_ref_text and role['reference_text']:
+            payload["reference_text"] = role['reference_text']
 
-        with open(ref_audio_path, "rb") as audio_file:
-            files = {"reference_audio_file": audio_file}
-            resp = requests.post(f"{TTS_BASE_URL}/clone_voice", data=payload, files=files)
+        files = {"reference_audio_file": ("reference_audio.wav", self.catalog.read_audio(role))}
+        resp = self._post("/clone_voice", read_audio=lambda r: self.read_audio(r, max_seconds, target), data=payload, files=files)
             
         if resp.status_code == 500:
             raise requests.exceptions.HTTPError(response=resp)
         if resp.status_code != 200:
             raise Exception(f"API error: {resp.status_code} - {resp.text}")
             
-        return resp.content
-
-    def concatenate_audio(self, audio_segments, subtitles):
-        """使用FFMPEG拼接音频片段，考虑字幕的时间位置"""
-        temp_files = []
-        valid_indices = []  # 新增: 记录有效音频片段对应的原字幕索引
-        for i, segment in enumerate(audio_segments):
-            temp_file = f"temp_{i}.{self.audio_format}"
-            with open(temp_file, 'wb') as f:
-                f.write(segment)
-            
-            # 新增音频文件验证
-            if not self.validate_audio_file(temp_file):
-                os.remove(temp_file)
-                if self.verbose:
-                    print(f"[{__name__}] [{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] >> 跳过无效的音频片段: {temp_file}")
-                continue
-                
-            temp_files.append(temp_file)
-            valid_indices.append(i)  # 记录有效索引
-        
-        # 新增空文件检查
-        if not temp_files:
+        return resp.audio
+
+    def response_options(self):
+        """合成请求的返回格式：流式合成时按WAV分块返回"""
+        if self.stream:
+            return {"stream": True, "response_format": "wav"}
+        return {"stream": False, "response_format": self.audio_codec}
+
+    def read_audio(self, resp, max_seconds=None, target=None):
+        """读取合成结果
+
+        非流式时返回完整的音频内容。流式时边接收边把PCM交给 target（分段文件与混音时间轴），
+        只累计已接收的字节数，超出 max_seconds 时中止请求并抛出 SegmentOverrun；返回写入的采样数。
+        """
+        if not self.stream:
+            return resp.content
+
+        if target is None:
+            target = StreamTarget()  # 只统计时长
+        header = bytearray()  # 解析出WAV头之前收到的数据
+        params = None  # (采样率, 声道数, 采样字节数, PCM数据起始位置)
+        received = 0
+        try:
+            for chunk in resp.iter_content(chunk_size=8192):
+                if params is None:
+                    header.extend(chunk)
+                    params = self.parse_wav_header(header)
+                    if params is None:
+                        continue
+                    target.begin(params[0], params[1])
+                    chunk = bytes(header[params[3]:])
+                sample_rate, channels, sample_width, _ = params
+                received += len(chunk)
+                seconds = received / (sample_rate * channels * sample_width)
+                if max_seconds is not None and seconds > max_seconds:
+                    resp.close()  # 断开连接，服务端停止生成
+                    raise SegmentOverrun(f"已生成 {seconds:.2f} 秒，超过允许的 {max_seconds:.2f} 秒")
+                target.write(chunk)
+            if params is None and header:
+                raise ValueError(f"流式合成返回的WAV头不完整（共 {len(header)} 字节）")
+            return target.finish()
+        except BaseException:
+            target.discard()
+            raise
+
+    def parse_wav_header(self, data):
+        """解析WAV头，返回 (采样率, 声道数, 采样字节数, PCM数据起始位置)；数据不足时返回None
+
+        流式WAV头中的长度字段通常无效，只读取格式信息。不是 16 位 PCM WAV 时抛出 ValueError。
+        """
+        if len(data) < 12:
+            return None
+        if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+            raise ValueError("流式合成返回的数据不是WAV格式（缺少RIFF/WAVE头），无法确定采样格式")
+        pos = 12
+        fmt = None
+        while pos + 8 <= len(data):
+            chunk_id = bytes(data[pos:pos + 4])
+            chunk_size = int.from_bytes(data[pos + 4:pos + 8], "little")
+            if chunk_id == b"data":
+                if fmt is None:
+                    return None
+                return fmt + (pos + 8,)
+            if pos + 8 + chunk_size > len(data):
+                return None
+            if chunk_id == b"fmt ":
+                audio_format = int.from_bytes(data[pos + 8:pos + 10], "little")
+                channels = int.from_bytes(data[pos + 10:pos + 12], "little")
+                sample_rate = int.from_bytes(data[pos + 12:pos + 16], "little")
+                bits = int.from_bytes(data[pos + 22:pos + 24], "little")
+                # 1 为 PCM，0xFFFE 为 WAVE_FORMAT_EXTENSIBLE
+                if audio_format not in (1, 0xFFFE) or bits != 16:
+                    raise ValueError(f"流式合成只支持 16 位 PCM WAV（格式 {audio_format}，{bits} 位）")
+                fmt = (sample_rate, channels, bits // 8)
+            pos += 8 + chunk_size + (chunk_size % 2)
+        return None
+
+    def _post(self, path, affinity=None, read_audio=None, **kwargs):
+        """通过节点池发送TTS请求，记录耗时和错误用于剔除节点和并发调优
+
+        read_audio 在占用节点名额期间读取响应体（流式合成时直到接收完成才释放），结果保存在 resp.audio。
+        未固定节点的请求遇到连接失败或超时时换一个节点重试。
+        """
+        attempts = len(self.pool.endpoints) if affinity is None else 1
+        for attempt in range(attempts):
+            endpoint = self.pool.acquire(affinity)
+            start = time.monotonic()
+            ok = False
+            error = None
+            try:
+                resp = self.transport.post(f"{endpoint.url}{path}", timeout=self.request_timeout(), stream=self.stream, **kwargs)
+                ok = not is_retryable(response=resp)
+                if read_audio is not None and resp.status_code == 200:
+                    resp.audio = read_audio(resp)
+                return resp
+            except requests.exceptions.RequestException as e:
+                ok = False
+                error = e
+                if attempt == attempts - 1:
+                    raise
+                for file_obj in kwargs.get("files", {}).values():
+                    if hasattr(file_obj, "seek"):
+                        file_obj.seek(0)  # 上传文件需从头重新发送
+            finally:
+                self.pool.release(endpoint, time.monotonic() - start, ok, error)
+
+    def request_timeout(self):
+        """TTS请求的 (连接超时, 读取超时)"""
+        return (self.transport.connect_timeout, self.tts_timeout)
+
+    def ensure_speaker(self, role):
+        """确保克隆角色已注册在某台健康的服务器上，返回该节点"""
+        clone_role = role['name']
+        with self.register_lock:
+            endpoint = self.pool.pinned(clone_role)
+            if endpoint is not None:
+                return endpoint
+            self.pool.unpin(clone_role)
+            endpoint = self.pool.acquire()
+            start = time.monotonic()
+            ok = False
+            error = None
+            try:
+                data = {"name": clone_role}
+                if role['reference_text']:
+                    data["reference_text"] = role['reference_text']
+                files = {}
+                if role['audio_path']:
+                    files["audio_file"] = (os.path.basename(role['audio_path']), self.catalog.read_audio(role))
+                if role['latent_path']:
+                    files["latent_file"] = (os.path.basename(role['latent_path']), self.catalog.read_latent(role))
+                resp = self.transport.post(f"{endpoint.url}/add_speaker", timeout=self.request_timeout(),
+                                           data=data, files=files)
+                ok = not is_retryable(response=resp)
+                # 角色已存在（例如上次运行注册过）同样可以直接使用
+                if resp.status_code != 200 and "exist" not in resp.text.lower():
+                    raise requests.exceptions.HTTPError(response=resp)
+            except requests.exceptions.RequestException as e:
+                error = e
+                raise
+            finally:
+                self.pool.release(endpoint, time.monotonic() - start, ok, error)
+            self.pool.pin(clone_role, endpoint)
+            self.registered_speakers[clone_role] = endpoint.url
+            if self.verbose:
+                print(f"[{__name__}] [{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] >> 克隆角色 {clone_role} 已注册到 {endpoint.url}")
+            return endpoint
+
+    def _speak_registered(self, subtitle, speed, role, max_seconds=None, target=None):
+        """使用已注册到服务器的克隆角色合成，请求固定发往注册该角色的服务器"""
+        self.ensure_speaker(role)
+        clone_role = role['name']
+        payload = {
+            "name": clone_role,
+            "text": subtitle['text'],
+            "pitch": self.speech_pitch,
+            "speed": speed,
+            "temperature": 0.9,
+            "top_k": 50,
+            "top_p": 0.95,
+            "max_tokens": 2048,
+            **self.response_options()
+        }
+        resp = self._post("/speak", affinity=clone_role, read_audio=lambda r: self.read_audio(r, max_seconds, target), json=payload)
+        if resp.status_code == 500:
+            raise requests.exceptions.HTTPError(response=resp)
+        if resp.status_code != 200:
+            raise Exception(f"API error: {resp.status_code} - {resp.text}")
+        return resp.audio
+
+    def open_mix(self, checkpoint, subtitles):
+        """准备PCM混音时间轴（mix.pcm）并放置检查点中已完成的分段；本次合成的分段完成后由 place_segment() 放置
+
+        增量模式下与上次混音记录（render.json）按序号、文本和时间轴比对：未变化的分段保留在时间轴上，
+        只清空变化或删除的字幕所覆盖的时间窗口，并重新放置窗口内保留的分段。
+        """
+        work_dir = checkpoint['work_dir']
+        timeline_path = os.path.join(work_dir, "mix.pcm")
+        render_path = os.path.join(work_dir, "render.json")
+
+        previous = None
+        if self.incremental and os.path.exists(render_path) and os.path.exists(timeline_path):
+            try:
+                with open(render_path, 'r', encoding='utf-8') as f:
+                    previous = json.load(f)
+            except (OSError, ValueError):
+                previous = None
+            if previous and previous.get('sample_rate') != MIX_SAMPLE_RATE:
+                previous = None
+        # 时间轴修改过程中中断会导致 render.json 与 mix.pcm 不一致，先删除记录，完成后再写回
+        if os.path.exists(render_path):
+            os.remove(render_path)
+        # 没有可用的上次记录时新建时间轴，所有分段均需放置
+        mix = MixTimeline(timeline_path, keep=previous is not None)
+
+        kept = []
+        ready = []  # 检查点中已完成、需要放置的字幕
+        windows = []
+        prev_entries = {entry['index']: entry for entry in previous['entries']} if previous else {}
+        for subtitle in subtitles:
+            segment_path = self.find_checkpoint_segment(checkpoint, subtitle)
+            prev = prev_entries.pop(subtitle['index'], None)
+            if prev and segment_path is not None:
+                entry = self._segment_entry(subtitle, segment_path)
+                if all(prev.get(key) == entry[key] for key in entry):
+                    kept.append(prev)
+                    mix.entries[subtitle['index']] = prev
+                    continue
+            # 变化或合成失败的字幕：上次的内容需要清除
+            if prev:
+                windows.append(self._entry_window(prev))
+            if segment_path is not None:
+                ready.append(subtitle)
+        # 本次已删除的字幕
+        removed = len(prev_entries)
+        windows.extend(self._entry_window(prev) for prev in prev_entries.values())
+        windows = self._merge_windows(windows)
+
+        for window_start, window_end in windows:
+            mix.clear(window_start, window_end)
+            for entry in kept:
+                entry_start, entry_end = self._entry_window(entry)
+                if entry_end <= window_start or entry_start >= window_end:
+                    continue
+                pcm = self.load_segment_pcm(os.path.join(work_dir, entry['file']))
+                if pcm is not None:
+                    mix.add(entry_start, pcm, window_start, window_end)
+        for subtitle in ready:
+            self.place_segment(mix, checkpoint, subtitle)
+
+        if previous is not None and self.verbose:
+            changed_seconds = sum(end - start for start, end in windows) / MIX_SAMPLE_RATE
+            print(f"[{__name__}] [{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] >> 增量更新: 保留 {len(kept)} 段，{removed} 段删除，清空 {len(windows)} 个时间窗口，共 {changed_seconds:.1f} 秒")
+        return mix
+
+    def _segment_entry(self, subtitle, segment_path):
+        """混音记录：按序号、文本、时间轴和分段文件判断上次放置的内容是否仍然有效"""
+        stat = os.stat(segment_path)
+        return {
+            'index': subtitle['index'],
+            'text': subtitle['text'],
+            'start_time': subtitle['start_time'],
+            'end_time': subtitle['end_time'],
+            'file': os.path.basename(segment_path),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+        }
+
+    def place_segment(self, mix, checkpoint, subtitle, placed=False):
+        """把已完成的分段叠加到混音时间轴（在主线程中随流水线逐段调用）
+
+        placed 表示流式合成时已边接收边叠加到时间轴，只需记录（分段文件即时间轴格式的PCM）。
+        """
+        segment_path = self.find_checkpoint_segment(checkpoint, subtitle)
+        if placed and segment_path:
+            entry = self._segment_entry(subtitle, segment_path)
+            entry['samples'] = entry['size'] // 2
+            mix.entries[subtitle['index']] = entry
+            return
+        pcm = self.load_segment_pcm(segment_path) if segment_path else None
+        if pcm is None:
+            if self.verbose:
+                print(f"[{__name__}] [{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] >> 跳过无效的音频片段: {segment_path}")
+            return
+        entry = self._segment_entry(subtitle, segment_path)
+        entry['samples'] = len(pcm)
+        mix.add(self._entry_window(entry)[0], pcm)
+        mix.entries[subtitle['index']] = entry
+
+    def finish_mix(self, mix, checkpoint, subtitles):
+        """全部分段放置完成后截断时间轴并写回混音记录，返回时间轴文件路径"""
+        entries = [mix.entries[subtitle['index']] for subtitle in subtitles if subtitle['index'] in mix.entries]
+        if not entries:
+            mix.close()
             raise ValueError("没有有效的音频片段可供拼接")
-        
-        # 修改后的FFMPEG拼接逻辑：
-        output_file = f"temp_final.{self.audio_format}"
-        
-        filter_complex = []
-        inputs = []
-        delays = []
-        
-        # 构建每个音频流的延迟和持续时间
-        for idx, temp_file in zip(valid_indices, temp_files):
-            start_time = subtitles[idx]['start_time']
-            end_time = subtitles[idx]['end_time']
-            duration = end_time - start_time
-            
-            # 为每个音频流添加延迟和持续时间控制
-            filter_complex.append(
-                f"[{len(inputs)}:a]adelay=delays={int(start_time*1000)}:all=1[d{idx}];"
-                f"[d{idx}]apad=whole_dur={duration}[p{idx}]"
-            )
-            inputs.extend(["-i", temp_file])
-
-        # 合并所有处理后的音频流
-        merge_inputs = "".join([f"[p{idx}]" for idx in valid_indices])
-        filter_complex.append(f"{merge_inputs}amix=inputs={len(valid_indices)}:duration=longest[aout]")
-        
+        total_samples = max(end for _, end in map(self._entry_window, entries))
+        mix.close(total_samples)
+        self.write_json_atomic(os.path.join(checkpoint['work_dir'], "render.json"), {
+            'sample_rate': MIX_SAMPLE_RATE,
+            'samples': total_samples,
+            'entries': entries,
+        })
+        return mix.path
+
+    def _entry_window(self, entry):
+        """分段在时间轴上占据的采样区间 [start, end)"""
+        start = int(round(entry['start_time'] * MIX_SAMPLE_RATE))
+        return start, start + entry['samples']
+
+    def _merge_windows(self, windows):
+        """合并重叠或相邻的时间窗口"""
+        merged = []
+        for start, end in sorted(windows):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return [tuple(window) for window in merged]
+
+    def read_wav_pcm(self, file_path):
+        """直接读取 16 位 PCM WAV（流式合成的分段）并转换为时间轴格式，无需启动FFMPEG"""
+        try:
+            with wave.open(file_path, 'rb') as wav_file:
+                if wav_file.getsampwidth() != 2 or wav_file.getnframes() == 0:
+                    return None
+                channels = wav_file.getnchannels()
+                sample_rate = wav_file.getframerate()
+                pcm = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16)
+        except (wave.Error, EOFError, OSError):
+            return None
+        if channels > 1:
+            pcm = pcm.reshape(-1, channels).mean(axis=1)
+        if sample_rate != MIX_SAMPLE_RATE:
+            length = int(round(len(pcm) * MIX_SAMPLE_RATE / sample_rate))
+            positions = np.arange(length) * (sample_rate / MIX_SAMPLE_RATE)
+            pcm = np.interp(positions, np.arange(len(pcm)), pcm)
+        return np.asarray(pcm).astype(np.int16)
+
+    def load_segment_pcm(self, segment_path):
+        """读取分段的PCM，优先使用处理分段时已解码的 .pcm 文件"""
+        pcm_path = os.path.splitext(segment_path)[0] + ".pcm"
+        if os.path.exists(pcm_path) and os.path.getmtime(pcm_path) >= os.path.getmtime(segment_path):
+            return np.fromfile(pcm_path, dtype=np.int16)
+        return self.decode_to_pcm(segment_path)
+
+    def decode_to_pcm(self, file_path):
+        """使用FFMPEG将音频分段解码为混音时间轴格式的PCM，无法解码时返回None"""
+        if file_path.endswith(".wav"):
+            pcm = self.read_wav_pcm(file_path)
+            if pcm is not None:
+                return pcm
         command = [
             self.ffmpeg_path,
-            *inputs,
-            "-filter_complex",
-            ";".join(filter_complex),
-            "-map", "[aout]",
-            '-c:a', self.audio_codec,
-            *self.audio_quality,
-            output_file
+            '-v', 'error',
+            '-i', file_path,
+            '-f', 's16le',
+            '-ac', '1',
+            '-ar', str(MIX_SAMPLE_RATE),
+            '-'
         ]
-        subprocess.run(command, check=True)
-        
-        with open(output_file, 'rb') as f:
-            final_audio = f.read()
-        
-        for temp_file in temp_files:
-            os.remove(temp_file)
-        os.remove(output_file)
-        
-        return final_audio
+        result = ffmpeg_runner.run_ffmpeg(command, step="tts_decode", capture_stdout=True, check=False)
+        if result.returncode != 0 or not result.stdout:
+            return None
+        return np.frombuffer(result.stdout, dtype=np.int16)
 
     # 新增: 音频时长调整方法
     def adjust_audio_duration(self, audio_data, subtitle):
@@ -321,19 +1421,14 @@ class SrtTTS:
             return audio_data
 
         # 计算需要的速度因子并应用atempo滤镜
-        speed_factor = current_duration / target_duration
-        atempo_filters = []
-        while speed_factor > 2.0:
-            atempo_filters.append("atempo=2.0")
-            speed_factor /= 2.0
-        if speed_factor != 1.0:
-            atempo_filters.append(f"atempo={speed_factor:.3f}")
+        atempo_filters = self.atempo_filters(current_duration / target_duration)
 
         # 创建临时文件
-        input_temp = f"temp_input_adjust.{self.audio_format}"
-        output_temp = f"temp_output_adjust.{self.audio_format}"
-        with open(input_temp, 'wb') as f:
+        # 多进程并行处理时临时文件名需唯一
+        fd, input_temp = tempfile.mkstemp(suffix=f".{self.audio_format}")
+        with os.fdopen(fd, 'wb') as f:
             f.write(audio_data)
+        output_temp = os.path.splitext(input_temp)[0] + f"_adjusted.{self.audio_format}"
 
         # 构建FFmpeg命令
         filter_str = ",".join(atempo_filters) if atempo_filters else None
@@ -347,7 +1442,7 @@ class SrtTTS:
         command += ['-c:a', self.audio_codec, output_temp]
 
         try:
-            subprocess.run(command, check=True)
+            ffmpeg_runner.run_ffmpeg(command, step="tts_atempo")
             with open(output_temp, 'rb') as f:
                 return f.read()
         except Exception as e:
@@ -358,6 +1453,43 @@ class SrtTTS:
                 if os.path.exists(f):
                     os.remove(f)
 
+    def atempo_filters(self, speed_factor):
+        """atempo 单级最多加速2倍，超出时串联多级"""
+        filters = []
+        while speed_factor > 2.0:
+            filters.append("atempo=2.0")
+            speed_factor /= 2.0
+        if speed_factor != 1.0:
+            filters.append(f"atempo={speed_factor:.3f}")
+        return filters
+
+    def adjust_pcm_duration(self, pcm, subtitle):
+        """调整流式合成分段（时间轴格式PCM）的时长以匹配字幕时间"""
+        current_duration = len(pcm) / MIX_SAMPLE_RATE
+        target_duration = subtitle['end_time'] - subtitle['start_time']
+        if current_duration <= target_duration or target_duration <= 0:
+            return pcm
+
+        fd, input_temp = tempfile.mkstemp(suffix=".pcm")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pcm.tobytes())
+        raw_format = ['-f', 's16le', '-ar', str(MIX_SAMPLE_RATE), '-ac', '1']
+        command = [
+            self.ffmpeg_path,
+            '-hide_banner', '-loglevel', 'error',
+            *raw_format, '-i', input_temp,
+            '-filter:a', ",".join(self.atempo_filters(current_duration / target_duration)),
+            *raw_format, '-'
+        ]
+        try:
+            result = ffmpeg_runner.run_ffmpeg(command, step="tts_atempo", capture_stdout=True)
+            return np.frombuffer(result.stdout, dtype=np.int16)
+        except Exception as e:
+            print(f"Audio adjustment failed: {str(e)}")
+            return pcm
+        finally:
+            os.remove(input_temp)
+
     # 新增: 检查音频是否可以完全播放的方法
     def can_play_fully(self, audio_segment, subtitle):
         """检查音频是否可以完全播放"""
@@ -375,8 +1507,8 @@ class SrtTTS:
     def get_audio_duration(self, audio_data):
         """获取音频文件的长度"""
         # 使用FFMPEG计算音频长度
-        temp_file = "temp_audio_for_duration.m4a"
-        with open(temp_file, 'wb') as f:
+        fd, temp_file = tempfile.mkstemp(suffix=".m4a")
+        with os.fdopen(fd, 'wb') as f:
             f.write(audio_data)
         
         command = [
@@ -386,7 +1518,7 @@ class SrtTTS:
             "-"
         ]
         
-        result = subprocess.run(command, stderr=subprocess.PIPE, text=True)
+        result = ffmpeg_runner.run_ffmpeg(command, step="tts_duration", text=True, check=False)
         os.remove(temp_file)
         
         for line in result.stderr.splitlines():
@@ -397,15 +1529,29 @@ class SrtTTS:
         
         return 0.0  # 如果无法获取时长，返回0
 
-    def save_final_audio(self, audio_data, srt_file_path):
-        """保存最终的完整语音文件"""
+    def final_audio_path(self, srt_file_path):
         output_file = os.path.splitext(os.path.basename(srt_file_path))[0] + f"{self.audio_suffix}.{self.audio_format}"
-        output_path = os.path.join(self.output, output_file)
+        return os.path.join(self.output, output_file)
+
+    def save_final_audio(self, timeline_path, srt_file_path):
+        """将混音时间轴编码为最终的完整语音文件"""
+        output_path = self.final_audio_path(srt_file_path)
         current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         if self.verbose:
             print(f"[{__name__}] [{current_time}] >> 保存最终音频文件: {output_path}")
-        with open(output_path, 'wb') as f:
-            f.write(audio_data)
+        command = [
+            self.ffmpeg_path,
+            '-y', '-hide_banner', '-loglevel', 'error',
+            '-f', 's16le',
+            '-ar', str(MIX_SAMPLE_RATE),
+            '-ac', '1',
+            '-i', timeline_path,
+            '-c:a', self.audio_codec,
+            *self.audio_quality,
+            output_path
+        ]
+        ffmpeg_runner.run_ffmpeg(command, step="tts_mix", output=output_path,
+                                 duration=os.path.getsize(timeline_path) / 2 / MIX_SAMPLE_RATE)
 
     # 新增音频验证方法
     def validate_audio_file(self, file_path):
@@ -423,7 +1569,7 @@ class SrtTTS:
                 '-f', 'null',
                 '-'
             ]
-            result = subprocess.run(command, stderr=subprocess.PIPE, text=True)
+            result = ffmpeg_runner.run_ffmpeg(command, step="tts_validate", check=False)
             return result.returncode == 0
             
         except Exception as e:
@@ -431,9 +1577,69 @@ class SrtTTS:
                 print(f"[{__name__}] [{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] >> 文件验证失败: {str(e)}")
             return False
 
+class SegmentWorker:
+    """进程池中的分段处理器：只保存解码与时长调整所需的参数
+
+    不创建 TTS 节点池、HTTP 传输层和角色索引（多个进程同时重建角色索引会互相覆盖索引文件）。
+    """
+    def __init__(self, audio_codec, audio_format, speed_adjust=False, verbose=False):
+        self.audio_codec = audio_codec
+        self.audio_format = audio_format
+        self.speed_adjust = speed_adjust
+        self.verbose = verbose
+        self.ffmpeg_path = "ffmpeg"
+
+    def segment_options(self):
+        return {
+            'audio_codec': self.audio_codec,
+            'audio_format': self.audio_format,
+            'speed_adjust': self.speed_adjust,
+            'verbose': self.verbose,
+        }
+
+    # 分段处理逻辑与 SrtTTS 共用
+    process_segments = SrtTTS.process_segments
+    adjust_audio_duration = SrtTTS.adjust_audio_duration
+    adjust_pcm_duration = SrtTTS.adjust_pcm_duration
+    atempo_filters = SrtTTS.atempo_filters
+    save_checkpoint_segment = SrtTTS.save_checkpoint_segment
+    segment_filename = SrtTTS.segment_filename
+    checkpoint_record = SrtTTS.checkpoint_record
+    get_audio_duration = SrtTTS.get_audio_duration
+    decode_to_pcm = SrtTTS.decode_to_pcm
+    read_wav_pcm = SrtTTS.read_wav_pcm
+
+_segment_worker = None
+
+def segment_pool_context():
+    """分段处理进程池的启动方式
+
+    合成线程运行期间创建进程池：fork 会复制正在被其他线程持有的锁（HTTP连接池、日志等），
+    子进程可能死锁，因此使用 forkserver（不可用时使用 spawn）。
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def process_segment_group(options, work_dir, group, audio_data):
+    """进程池入口：每个工作进程复用一个 SegmentWorker 处理分段"""
+    global _segment_worker
+    if _segment_worker is None or _segment_worker.segment_options() != options:
+        _segment_worker = SegmentWorker(**options)
+    return _segment_worker.process_segments(work_dir, group, audio_data)
+
 # 修改: 主函数部分
 if __name__ == "__main__":
     args = parse_arguments()
+    if args.enqueue:
+        # 只入队：每个SRT文件一个任务
+        srt_paths = [args.srt_file] if args.srt_file else [
+            os.path.join(args.input, f) for f in sorted(os.listdir(args.input)) if f.endswith(f"{args.subtitle_suffix}.srt")]
+        for srt_path in srt_paths:
+            enqueue_invocation(args.enqueue, "tts", __file__, sys.argv[1:], extra=["--srt_file", os.path.abspath(srt_path)])
+        sys.exit(0)
+    ffmpeg_runner.configure(args.metrics_log, args.ffmpeg_timeout)
+    if args.srt_file and not args.input:
+        args.input = os.path.dirname(os.path.abspath(args.srt_file))
     output_dir = args.output if args.output else args.input
     tts = SrtTTS(
         input=args.input,
@@ -449,6 +1655,18 @@ if __name__ == "__main__":
         clone_role=args.clone_role,
         verbose=args.verbose,
         speed_adjust=args.speed_adjust,  # 传递新的参数
-        alternative=args.alternative  # Add new parameter
+        alternative=args.alternative,  # Add new parameter
+        dedup=not args.no_dedup,
+        work_dir=args.work_dir,
+        clean_work=args.clean_work,
+        incremental=args.incremental,
+        tts_workers=args.tts_workers,
+        cpu_workers=args.cpu_workers,
+        tts_urls=[url.strip() for url in args.tts_urls.split(",") if url.strip()] if args.tts_urls else None,
+        register_speaker=args.register_speaker,
+        tts_timeout=args.tts_timeout,
+        stream=args.stream,
+        max_stretch=args.max_stretch,
+        force=args.force
     )
-    tts.process_srt_files()
+    tts.process_srt_files([args.srt_file] if args.srt_file else None)
@@ -14,6 +14,7 @@ except ImportError:
 
 # 导入原有的srt_tts模块
 from srt_tts import SrtTTS
+from role_catalog import get_catalog
 
 # 定义深色主题颜色
 DARK_BG = "#121212"
@@ -98,6 +99,8 @@ class SrtTTSGUI:
         self.speed_detection = tk.BooleanVar(value=True)
         self.speed_adjust = tk.BooleanVar(value=False)
         self.alternative = tk.IntVar(value=0)
+        self.dedup = tk.BooleanVar(value=True)
+        self.force = tk.BooleanVar(value=False)
         
         # 创建界面
         self.create_widgets()
@@ -109,6 +112,7 @@ class SrtTTSGUI:
         # 处理线程
         self.processing_thread = None
         self.is_processing = False
+        self.tts = None
         
         # 添加标题栏
         self.create_title_bar()
@@ -331,6 +335,12 @@ class SrtTTSGUI:
         # 替代角色数量
         ttk.Label(advanced_frame, text="替代角色数量:").grid(row=1, column=0, sticky="w", pady=5)
         ttk.Spinbox(advanced_frame, from_=0, to=10, textvariable=self.alternative, width=10).grid(row=1, column=1, sticky="w", padx=(5, 0), pady=5)
+        
+        # 重复字幕去重
+        ttk.Checkbutton(advanced_frame, text="重复字幕去重", variable=self.dedup).grid(row=2, column=0, sticky="w", pady=5)
+        
+        # 强制重新合成（忽略已是最新的音频与分段检查点）
+        ttk.Checkbutton(advanced_frame, text="强制重新合成", variable=self.force).grid(row=2, column=1, sticky="w", padx=(20, 0), pady=5)
 
     def create_roles_frame(self, parent):
         # 角色设置框架
@@ -399,19 +409,9 @@ class SrtTTSGUI:
 
     def refresh_roles(self):
         """刷新角色列表"""
-        roles = []
-        roles_dir = os.path.join("flashtts_data", "roles")
-        
-        if os.path.exists(roles_dir):
-            for role_name in os.listdir(roles_dir):
-                role_path = os.path.join(roles_dir, role_name)
-                if os.path.isdir(role_path):
-                    # 检查是否有参考音频文件
-                    ref_audio = os.path.join(role_path, "reference_audio.wav")
-                    if os.path.exists(ref_audio):
-                        roles.append(role_name)
-        
-        self.clone_role_combo['values'] = roles
+        catalog = get_catalog()
+        catalog.refresh()
+        self.clone_role_combo['values'] = catalog.names("roles") + catalog.names("mega-roles")
         
         # 更新角色信息显示
         self.update_role_info()
@@ -424,25 +424,32 @@ class SrtTTSGUI:
             self.role_info_text.insert(tk.END, "请选择一个克隆角色查看详细信息")
             return
         
-        role_dir = os.path.join("flashtts_data", "roles", selected_role)
-        info = f"角色: {selected_role}\n"
-        info += f"目录: {role_dir}\n\n"
-        
-        # 检查文件
-        ref_audio = os.path.join(role_dir, "reference_audio.wav")
-        ref_text = os.path.join(role_dir, "reference_text.txt")
+        role = get_catalog().get(selected_role)
+        if role is None:
+            self.role_info_text.delete(1.0, tk.END)
+            self.role_info_text.insert(tk.END, f"角色: {selected_role}\n✗ 参考音频: 未找到")
+            return
+
+        info = f"角色: {selected_role}{'（Mega）' if role['kind'] == 'mega-roles' else ''}\n"
+        info += f"目录: {role['dir']}\n\n"
         
-        if os.path.exists(ref_audio):
-            size = os.path.getsize(ref_audio)
+        ref_audio = role['audio_path']
+        if ref_audio:
             info += f"✓ 参考音频: {ref_audio}\n"
-            info += f"  大小: {size} 字节\n"
+            info += f"  大小: {role['stamps'][0][1]} 字节\n"
+            if role['duration'] is not None:
+                info += f"  时长: {role['duration']:.2f} 秒，采样率: {role['sample_rate']} Hz\n"
+            info += f"  哈希: {role['audio_hash'][:12]}\n"
         else:
             info += f"✗ 参考音频: 未找到\n"
+
+        if role['latent_path']:
+            info += f"✓ Latent: {role['latent_path']}\n"
+            info += f"  哈希: {role['latent_hash'][:12]}\n"
         
-        if os.path.exists(ref_text):
-            with open(ref_text, 'r', encoding='utf-8') as f:
-                text_content = f.read().strip()
-            info += f"✓ 参考文本: {ref_text}\n"
+        text_content = role['reference_text']
+        if text_content is not None:
+            info += f"✓ 参考文本: {role['text_path']}\n"
             info += f"  内容: {text_content[:100]}{'...' if len(text_content) > 100 else ''}\n"
         else:
             info += f"✗ 参考文本: 未找到\n"
@@ -490,13 +497,17 @@ class SrtTTSGUI:
         self.start_button.config(state=tk.NORMAL)
         self.stop_button.config(state=tk.DISABLED)
         
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 用户停止处理")
+        # 通知合成线程在当前分段完成后停止，已完成分段保留在检查点中
+        if self.tts:
+            self.tts.stop()
+        
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 用户停止处理，下次开始时将从检查点继续")
 
     def process_files(self):
         """处理文件"""
         try:
             # 创建SrtTTS实例
-            tts = SrtTTS(
+            tts = self.tts = SrtTTS(
                 input=self.input_dir.get(),
                 output=self.output_dir.get(),
                 subtitle_suffix=self.subtitle_suffix.get(),
@@ -511,7 +522,9 @@ class SrtTTSGUI:
                 verbose=self.verbose.get(),
                 speed_detection=self.speed_detection.get(),
                 speed_adjust=self.speed_adjust.get(),
-                alternative=self.alternative.get()
+                alternative=self.alternative.get(),
+                dedup=self.dedup.get(),
+                force=self.force.get()
             )
             
             print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 开始处理SRT文件...")
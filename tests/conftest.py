@@ -0,0 +1,15 @@
+import os
+import sys
+import types
+
+# 各工具是仓库根目录下的独立脚本，测试直接按模块名导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# consts.py 是本地配置（由 consts.py.template 复制，不提交到git）；未配置时用占位值，测试不访问任何服务
+try:
+    import consts  # noqa: F401
+except ImportError:
+    consts = types.ModuleType("consts")
+    consts.API_CONFIG = {}
+    consts.TTS_BASE_URL = "http://127.0.0.1:8000"
+    sys.modules["consts"] = consts
@@ -0,0 +1,118 @@
+import os
+
+import pytest
+
+import build_manifest
+from build_manifest import stale_reason, record_build, invalidate, copy_artifact, load_record
+
+def write(path, content):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+def set_mtime(path, mtime):
+    os.utime(path, (mtime, mtime))
+
+@pytest.fixture
+def built(tmp_path):
+    """已记录构建的产物：out.txt <- in.txt，参数 model=a"""
+    source = tmp_path / "in.txt"
+    output = tmp_path / "out.txt"
+    write(source, "v1")
+    write(output, "result")
+    record_build(str(output), [str(source)], {"model": "a"})
+    return str(source), str(output)
+
+def test_missing_output(tmp_path):
+    write(tmp_path / "in.txt", "v1")
+    assert stale_reason(str(tmp_path / "out.txt"), [str(tmp_path / "in.txt")]) == "产物不存在"
+
+def test_missing_input(built):
+    source, output = built
+    os.remove(source)
+    assert stale_reason(output, [source], {"model": "a"}).startswith("缺少输入")
+
+def test_current_after_record(built):
+    source, output = built
+    assert stale_reason(output, [source], {"model": "a"}) is None
+
+def test_touched_but_identical_input_is_current(built, monkeypatch):
+    source, output = built
+    set_mtime(source, os.path.getmtime(source) + 100)
+    assert stale_reason(output, [source], {"model": "a"}) is None
+    # 新的 mtime 已写回记录，再次检查不会重新计算哈希
+    monkeypatch.setattr(build_manifest, "file_hash", lambda path: pytest.fail("不应重新计算哈希"))
+    assert stale_reason(output, [source], {"model": "a"}) is None
+
+def test_content_change(built):
+    source, output = built
+    write(source, "v2")
+    assert stale_reason(output, [source], {"model": "a"}) == "输入内容变化 in.txt"
+
+def test_same_size_same_mtime_is_not_rehashed(built):
+    # 哈希按 (大小, mtime) 缓存：内容变化但大小与 mtime 都不变时视为未变化
+    source, output = built
+    mtime = os.path.getmtime(source)
+    write(source, "v9")
+    set_mtime(source, mtime)
+    assert stale_reason(output, [source], {"model": "a"}) is None
+
+def test_param_change(built):
+    source, output = built
+    assert stale_reason(output, [source], {"model": "b"}) == "参数变化 model"
+    assert stale_reason(output, [source], {"model": "a", "speed": 1}) == "参数变化 speed"
+
+def test_params_are_normalized(tmp_path):
+    write(tmp_path / "in.txt", "v1")
+    write(tmp_path / "out.txt", "result")
+    output, source = str(tmp_path / "out.txt"), str(tmp_path / "in.txt")
+    record_build(output, [source], {"size": (1920, 1080)})
+    assert stale_reason(output, [source], {"size": [1920, 1080]}) is None
+
+def test_input_list_change(built, tmp_path):
+    source, output = built
+    extra = tmp_path / "extra.txt"
+    write(extra, "x")
+    assert stale_reason(output, [source, str(extra)], {"model": "a"}) == "输入文件列表变化"
+
+def test_none_inputs_are_ignored(built):
+    source, output = built
+    assert stale_reason(output, [source, None], {"model": "a"}) is None
+
+def test_adopt_output_newer_than_inputs(tmp_path):
+    source, output = str(tmp_path / "in.txt"), str(tmp_path / "out.txt")
+    write(source, "v1")
+    write(output, "result")
+    set_mtime(source, 1000)
+    set_mtime(output, 2000)
+    assert stale_reason(output, [source]) is None
+    assert load_record(output) is not None
+
+def test_reject_output_older_than_inputs(tmp_path):
+    source, output = str(tmp_path / "in.txt"), str(tmp_path / "out.txt")
+    write(source, "v1")
+    write(output, "result")
+    set_mtime(source, 2000)
+    set_mtime(output, 1000)
+    assert stale_reason(output, [source]) == "没有构建记录且输入比产物新"
+    assert load_record(output) is None
+
+def test_invalidate_until_rebuilt(built):
+    source, output = built
+    invalidate(output)
+    assert stale_reason(output, [source], {"model": "a"}) == "已标记为需要重建"
+    record_build(output, [source], {"model": "a"})
+    assert stale_reason(output, [source], {"model": "a"}) is None
+
+def test_record_paths_are_relative(built, tmp_path):
+    _, output = built
+    assert list(load_record(output)["inputs"]) == ["in.txt"]
+
+def test_copy_artifact_follows_source(tmp_path):
+    source, backup = str(tmp_path / "a.srt"), str(tmp_path / "a_en.srt")
+    write(source, "v1")
+    assert copy_artifact(source, backup) == "产物不存在"
+    assert copy_artifact(source, backup) is None
+    write(source, "v2 edited")
+    assert copy_artifact(source, backup) == "输入内容变化 a.srt"
+    with open(backup, encoding="utf-8") as f:
+        assert f.read() == "v2 edited"
@@ -0,0 +1,37 @@
+import pytest
+
+import chunked_encode
+from chunked_encode import plan_chunks
+
+@pytest.fixture
+def probe(monkeypatch):
+    """替换 ffprobe：probe(duration, keyframes) 设置探测结果"""
+    def configure(duration, keyframes=()):
+        monkeypatch.setattr(chunked_encode, "probe_duration", lambda path: duration)
+        monkeypatch.setattr(chunked_encode, "probe_keyframes", lambda path: list(keyframes))
+    return configure
+
+def test_cuts_at_first_keyframe_after_target(probe):
+    probe(100.0, [float(t) for t in range(0, 100, 4)])
+    assert plan_chunks("v.mp4", 4) == [(0.0, 28.0), (28.0, 52.0), (52.0, 76.0), (76.0, None)]
+
+def test_single_chunk(probe):
+    probe(100.0, [0.0, 50.0])
+    assert plan_chunks("v.mp4", 1) == [(0.0, None)]
+
+def test_unknown_duration(probe):
+    probe(None)
+    assert plan_chunks("v.mp4", 4) == [(0.0, None)]
+
+def test_short_video_limits_chunk_count(probe):
+    probe(25.0, [float(t) for t in range(25)])
+    # 每段至少 min_seconds：25 秒只能切成 2 段
+    assert plan_chunks("v.mp4", 8, min_seconds=10) == [(0.0, 13.0), (13.0, None)]
+
+def test_sparse_keyframes_merge_chunks(probe):
+    probe(100.0, [0.0, 90.0])
+    assert plan_chunks("v.mp4", 4) == [(0.0, 90.0), (90.0, None)]
+
+def test_no_keyframe_before_end(probe):
+    probe(100.0, [0.0, 100.0])
+    assert plan_chunks("v.mp4", 4) == [(0.0, None)]
@@ -0,0 +1,167 @@
+import io
+import os
+import json
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import cover_extractor
+
+def probe_result(streams):
+    return subprocess.CompletedProcess([], 0, stdout=json.dumps({"streams": streams}).encode(), stderr=b"")
+
+def stream(index, codec, cover=True, codec_type="video"):
+    return {"index": index, "codec_type": codec_type, "codec_name": codec, "width": 1280, "height": 720,
+            "disposition": {"attached_pic": 1 if cover else 0}}
+
+@pytest.fixture
+def ffprobe(monkeypatch):
+    """替换 ffprobe：ffprobe(streams) 设置探测结果，返回实际执行的命令列表"""
+    calls = []
+    def configure(streams):
+        def run(cmd, **kwargs):
+            calls.append(cmd)
+            if isinstance(streams, Exception):
+                raise streams
+            return probe_result(streams)
+        monkeypatch.setattr(cover_extractor.subprocess, "run", run)
+        return calls
+    return configure
+
+def test_probe_prefers_mjpeg_cover(ffprobe):
+    calls = ffprobe([stream(0, "h264", cover=False), stream(1, "aac", False, "audio"), stream(2, "png"), stream(3, "mjpeg")])
+    assert cover_extractor.probe_cover_stream("v.mp4") == {"index": 3, "map": "0:3", "codec": "mjpeg", "width": 1280, "height": 720}
+    # 只读取流信息，不解码
+    assert calls[0][0] == "ffprobe" and "-show_streams" in calls[0]
+
+def test_probe_falls_back_to_first_cover(ffprobe):
+    ffprobe([stream(0, "h264", cover=False), stream(2, "png")])
+    assert cover_extractor.detect_cover_map("v.mp4") == "0:2"
+
+def test_probe_without_cover(ffprobe):
+    ffprobe([stream(0, "h264", cover=False)])
+    assert cover_extractor.probe_cover_stream("v.mp4") is None
+
+def test_probe_failure(ffprobe):
+    ffprobe(subprocess.CalledProcessError(1, "ffprobe", stderr=b"invalid data"))
+    assert cover_extractor.probe_cover_stream("v.mp4", verbose=True) is None
+
+@pytest.fixture
+def ffmpeg(monkeypatch):
+    commands = []
+    def run(cmd, **kwargs):
+        commands.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, stdout=b"", stderr=b"")
+    monkeypatch.setattr(cover_extractor.ffmpeg_runner, "run_ffmpeg", run)
+    return commands
+
+@pytest.mark.parametrize("codec, expected", [("mjpeg", ["-c", "copy"]), ("png", ["-q:v", "2"])])
+def test_extract_detected_cover(ffprobe, ffmpeg, codec, expected):
+    ffprobe([stream(0, "h264", cover=False), stream(1, codec)])
+    assert cover_extractor.extract_cover("v.mp4", "v.jpg", detect_map=True)
+    cmd = ffmpeg[0]
+    assert cmd[cmd.index("-map") + 1] == "0:1"
+    assert cmd[-3:] == [*expected, "v.jpg"]
+
+@pytest.fixture
+def extractor(monkeypatch):
+    """在线程池中运行提取任务，extract_cover 替换为写出占位封面；返回提取过的视频名"""
+    monkeypatch.setattr(cover_extractor, "ProcessPoolExecutor", ThreadPoolExecutor)
+    extracted = []
+    def extract(video_path, output_path, *args):
+        extracted.append(os.path.basename(video_path))
+        if "broken" in video_path:
+            return False
+        with open(output_path, "wb") as f:
+            f.write(b"jpeg")
+        return True
+    monkeypatch.setattr(cover_extractor, "extract_cover", extract)
+    return extracted
+
+def test_incremental_extraction(tmp_path, extractor):
+    videos = tmp_path / "videos"
+    (videos / "sub").mkdir(parents=True)
+    for path in ("a.mp4", "sub/b.MP4", "broken.mp4", "notes.txt"):
+        (videos / path).write_bytes(b"video")
+    covers = tmp_path / "covers"
+
+    result = cover_extractor.process_directory(str(videos), str(covers))
+    assert (result["extracted"], result["skipped"], result["failed"]) == (2, 0, 1)
+    assert sorted(extractor) == ["a.mp4", "b.MP4", "broken.mp4"]
+    manifest = cover_extractor.load_manifest(str(covers / cover_extractor.MANIFEST_FILENAME))
+    assert manifest[str(videos / "a.mp4")]["ok"] and not manifest[str(videos / "broken.mp4")]["ok"]
+
+    # 未变化的视频跳过；失败的、修改过的、封面被删除的重新提取
+    extractor.clear()
+    (videos / "a.mp4").write_bytes(b"new video")
+    result = cover_extractor.process_directory(str(videos), str(covers))
+    assert sorted(extractor) == ["a.mp4", "broken.mp4"] and result["skipped"] == 1
+    extractor.clear()
+    (covers / "b.jpg").unlink()
+    cover_extractor.process_directory(str(videos), str(covers))
+    assert sorted(extractor) == ["b.MP4", "broken.mp4"]
+
+def test_params_change_and_force(tmp_path, extractor):
+    (tmp_path / "a.mp4").write_bytes(b"video")
+    cover_extractor.process_directory(str(tmp_path), str(tmp_path))
+    cover_extractor.process_directory(str(tmp_path), str(tmp_path))
+    assert extractor == ["a.mp4"]
+    cover_extractor.process_directory(str(tmp_path), str(tmp_path), resize=True)
+    cover_extractor.process_directory(str(tmp_path), str(tmp_path), resize=True, force=True)
+    assert extractor == ["a.mp4"] * 3
+
+def test_manifest_merges_concurrent_updates(tmp_path, extractor):
+    (tmp_path / "a.mp4").write_bytes(b"video")
+    (tmp_path / "b.mp4").write_bytes(b"video")
+    # 两个队列任务分别处理同一目录中的不同视频
+    cover_extractor.process_directory(str(tmp_path), str(tmp_path), videos=[str(tmp_path / "a.mp4")])
+    cover_extractor.process_directory(str(tmp_path), str(tmp_path), videos=[str(tmp_path / "b.mp4")])
+    manifest = cover_extractor.load_manifest(str(tmp_path / cover_extractor.MANIFEST_FILENAME))
+    assert sorted(manifest) == [str(tmp_path / "a.mp4"), str(tmp_path / "b.mp4")]
+
+def encode_image(size, fmt):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(buffer, fmt)
+    return buffer.getvalue()
+
+def test_resize_small_cover(tmp_path):
+    from PIL import Image
+    output = tmp_path / "cover.jpg"
+    cover_extractor.save_resized_cover(encode_image((640, 360), "JPEG"), str(output), (1280, 720))
+    with Image.open(output) as img:
+        assert (img.format, img.size) == ("JPEG", (1280, 720))
+
+def test_large_jpeg_written_unchanged(tmp_path):
+    data = encode_image((1920, 1080), "JPEG")
+    output = tmp_path / "cover.jpg"
+    cover_extractor.save_resized_cover(data, str(output), (1280, 720))
+    assert output.read_bytes() == data
+
+def test_large_png_converted_to_jpeg(tmp_path):
+    from PIL import Image
+    output = tmp_path / "cover.jpg"
+    cover_extractor.save_resized_cover(encode_image((1920, 1080), "PNG"), str(output), (1280, 720))
+    with Image.open(output) as img:
+        assert (img.format, img.size) == ("JPEG", (1920, 1080))
+
+@pytest.mark.parametrize("codec, expected", [("mjpeg", ["-c", "copy"]), ("hevc", ["-vcodec", "png"])])
+def test_resize_pipes_cover_bytes(tmp_path, ffprobe, monkeypatch, codec, expected):
+    ffprobe([stream(1, codec)])
+    commands = []
+    data = encode_image((640, 360), "JPEG")
+    def run(cmd, **kwargs):
+        commands.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, stdout=data, stderr=b"")
+    monkeypatch.setattr(cover_extractor.ffmpeg_runner, "run_ffmpeg", run)
+    output = tmp_path / "cover.jpg"
+    assert cover_extractor.extract_cover("v.mp4", str(output), detect_map=True, resize=True)
+    assert all(arg in commands[0] for arg in expected) and commands[0][-1] == "-"
+    assert output.exists()
+
+def test_resize_undecodable_cover(tmp_path, ffprobe, monkeypatch):
+    ffprobe([stream(1, "mjpeg")])
+    monkeypatch.setattr(cover_extractor.ffmpeg_runner, "run_ffmpeg",
+                        lambda cmd, **kwargs: subprocess.CompletedProcess(cmd, 0, stdout=b"not an image", stderr=b""))
+    assert not cover_extractor.extract_cover("v.mp4", str(tmp_path / "cover.jpg"), detect_map=True, resize=True)
@@ -0,0 +1,124 @@
+import os
+import sys
+import json
+import threading
+import subprocess
+
+import pytest
+
+import ffmpeg_runner
+from ffmpeg_runner import FfmpegError, FfmpegCancelled, run_ffmpeg
+
+def test_progress_parses_blocks():
+    snapshots = []
+    progress = ffmpeg_runner._Progress("blend a.mp4", 100.0, snapshots.append)
+    for line in ("frame=250\n", "fps=50.0\n", "out_time_us=10000000\n", "speed=2.5x\n", "progress=continue\n",
+                 "frame=5000\n", "out_time_us=N/A\n", "speed=N/A\n", "progress=end\n"):
+        progress.feed(line)
+    first, last = snapshots
+    assert first == {"label": "blend a.mp4", "media_seconds": 10.0, "frames": 250, "fps": 50.0, "speed": 2.5,
+                     "percent": 10.0, "eta": 36.0}
+    # 无法解析的值保留上一次的结果
+    assert (last["frames"], last["media_seconds"], last["speed"]) == (5000, 10.0, 2.5)
+
+def test_progress_without_duration():
+    progress = ffmpeg_runner._Progress("resize", None, None)
+    progress.feed("out_time_ms=5000000")
+    progress.feed("progress=continue")
+    assert progress.snapshot()["media_seconds"] == 5.0
+    assert progress.snapshot()["percent"] is None and progress.snapshot()["eta"] is None
+
+def test_ffmpeg_error_keeps_stderr_tail():
+    error = FfmpegError(1, ["ffmpeg"], stderr=b"banner\n\nline 1\nline 2\nline 3\n")
+    assert str(error) == "ffmpeg 退出码 1: line 1 | line 2 | line 3"
+    assert str(FfmpegError(2, ["ffmpeg"], stderr="")) == "ffmpeg 退出码 2"
+    assert isinstance(error, subprocess.CalledProcessError)
+
+def test_summarize_metrics(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    for record in ({"step": "blend", "status": "ok", "wall_seconds": 10.0, "cpu_user_seconds": 30.0,
+                    "cpu_system_seconds": 2.0, "source": "a.mp4"},
+                   {"step": "blend", "status": "failed", "wall_seconds": 20.0, "source": "b.mp4"},
+                   {"step": "cover", "status": "ok", "wall_seconds": 0.5, "output": "c.jpg"}):
+        ffmpeg_runner.write_metrics(record, str(path))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"step": "blend", "wall_sec')  # 写入中断的最后一行
+    steps = ffmpeg_runner.summarize_metrics(str(path))
+    assert steps["blend"] == {"count": 2, "failed": 1, "wall": 30.0, "cpu": 32.0, "slowest": "b.mp4", "slowest_wall": 20.0}
+    assert steps["cover"]["slowest"] == "c.jpg"
+
+FAKE_FFMPEG = """#!{python}
+import sys, time
+mode = sys.argv[-1]
+if mode == "sleep":
+    time.sleep(30)
+if "-progress" in sys.argv:
+    print("frame=24\\nfps=24.0\\nout_time_us=1000000\\nspeed=1.5x\\nprogress=end", flush=True)
+if mode == "fail":
+    sys.stderr.write("first\\nInvalid data found when processing input\\n")
+    sys.exit(1)
+if mode == "pipe":
+    sys.stdout.buffer.write(b"image bytes")
+"""
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    """可执行的假 ffmpeg：最后一个参数决定行为（ok/fail/sleep/pipe）；指标写入 tmp_path 下的日志"""
+    if os.name != "posix":
+        pytest.skip("假 ffmpeg 为 POSIX 可执行脚本")
+    path = tmp_path / "ffmpeg"
+    path.write_text(FAKE_FFMPEG.format(python=sys.executable))
+    path.chmod(0o755)
+    monkeypatch.setenv(ffmpeg_runner.METRICS_LOG_ENV, str(tmp_path / "metrics.jsonl"))
+    monkeypatch.delenv(ffmpeg_runner.TIMEOUT_ENV, raising=False)
+    return str(path)
+
+def metrics(tmp_path):
+    with open(tmp_path / "metrics.jsonl", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def test_run_records_progress_and_usage(fake_ffmpeg, tmp_path):
+    result = run_ffmpeg([fake_ffmpeg, "-i", "in.mp4", "ok"], step="resize", duration=2.0)
+    assert result.returncode == 0
+    record = metrics(tmp_path)[0]
+    assert (record["step"], record["source"], record["output"], record["status"]) == ("resize", "in.mp4", "ok", "ok")
+    assert (record["media_seconds"], record["frames"], record["fps"], record["speed"]) == (1.0, 24, 24.0, 1.5)
+    if hasattr(os, "wait4"):
+        assert record["cpu_user_seconds"] is not None and record["peak_rss_mb"] > 0
+    assert result.metrics == record
+
+def test_run_captures_stdout(fake_ffmpeg):
+    result = run_ffmpeg([fake_ffmpeg, "-i", "in.mp4", "pipe"], capture_stdout=True)
+    assert result.stdout == b"image bytes"
+    assert "-progress" not in result.args
+
+def test_run_failure(fake_ffmpeg, tmp_path):
+    with pytest.raises(FfmpegError) as excinfo:
+        run_ffmpeg([fake_ffmpeg, "-i", "in.mp4", "fail"])
+    assert "Invalid data" in str(excinfo.value)
+    assert metrics(tmp_path)[0]["status"] == "failed"
+    result = run_ffmpeg([fake_ffmpeg, "-i", "in.mp4", "fail"], check=False, text=True)
+    assert result.returncode == 1 and "Invalid data" in result.stderr
+
+def test_run_timeout(fake_ffmpeg, tmp_path):
+    with pytest.raises(subprocess.TimeoutExpired):
+        run_ffmpeg([fake_ffmpeg, "sleep"], timeout=0.3)
+    record = metrics(tmp_path)[0]
+    assert record["status"] == "timeout" and record["wall_seconds"] < 5
+    assert not ffmpeg_runner._running
+
+def test_cancel_all(fake_ffmpeg, tmp_path):
+    errors = []
+    def run():
+        try:
+            run_ffmpeg([fake_ffmpeg, "sleep"])
+        except FfmpegCancelled as e:
+            errors.append(e)
+    thread = threading.Thread(target=run)
+    thread.start()
+    while not ffmpeg_runner._running:
+        thread.join(0.01)
+    ffmpeg_runner.cancel_all()
+    thread.join(10)
+    assert not thread.is_alive() and len(errors) == 1
+    assert metrics(tmp_path)[0]["status"] == "cancelled"
@@ -0,0 +1,96 @@
+import pytest
+import requests
+
+import http_transport
+from http_transport import HttpTransport, RequestStats, is_retryable
+
+def response(status):
+    resp = requests.Response()
+    resp.status_code = status
+    return resp
+
+def test_host_of():
+    assert HttpTransport.host_of("https://api.example.com:8443/v1/chat?x=1") == "https://api.example.com:8443"
+    assert HttpTransport.host_of("http://127.0.0.1:8000/tts") == "http://127.0.0.1:8000"
+
+@pytest.mark.parametrize("status, expected", [(408, True), (429, True), (500, True), (503, True), (599, True),
+                                              (400, False), (401, False), (404, False)])
+def test_is_retryable_status(status, expected):
+    assert is_retryable(response=response(status)) is expected
+    assert is_retryable(requests.exceptions.HTTPError(response=response(status))) is expected
+
+def test_is_retryable_errors():
+    assert is_retryable(requests.exceptions.ConnectionError())
+    assert is_retryable(requests.exceptions.ReadTimeout())
+    assert is_retryable(requests.exceptions.ChunkedEncodingError())
+    assert not is_retryable(requests.exceptions.InvalidURL())
+    # 非网络错误默认可重试
+    assert is_retryable(ValueError("bad json"))
+
+def test_configure_host_keeps_largest_pool():
+    transport = HttpTransport(default_pool_size=2)
+    url = "http://tts.local:8000/tts"
+    assert transport.session_for(url) is transport.session_for("http://tts.local:8000/other")
+    assert transport.sessions["http://tts.local:8000"][1] == 2
+
+    old = transport.session_for(url)
+    transport.configure_host(url, 8)
+    # 扩容时替换 Session；缩小不生效
+    new = transport.session_for(url)
+    assert new is not old
+    assert transport.sessions["http://tts.local:8000"][1] == 8
+    transport.configure_host(url, 4)
+    assert transport.session_for(url) is new
+    assert transport.pool_sizes["http://tts.local:8000"] == 8
+    transport.close()
+    assert transport.sessions == {}
+
+class FakeSession:
+    def __init__(self, result):
+        self.result = result
+        self.calls = []
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.calls.append((method, url, timeout))
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+def test_request_timeout_and_hooks(monkeypatch):
+    transport = HttpTransport(connect_timeout=5, read_timeout=300)
+    session = FakeSession(response(200))
+    monkeypatch.setattr(transport, "session_for", lambda url: session)
+    events = []
+    transport.add_hook(events.append)
+
+    transport.get("http://a.local/x")
+    transport.post("http://a.local/y", timeout=2)
+    transport.post("http://a.local/z", timeout=(1, 30))
+    assert [call[2] for call in session.calls] == [(5, 300), (2, 2), (1, 30)]
+    assert [(e['method'], e['host'], e['status'], e['error']) for e in events] == [
+        ("GET", "http://a.local", 200, None), ("POST", "http://a.local", 200, None), ("POST", "http://a.local", 200, None)]
+
+    transport.remove_hook(events.append)
+    transport.get("http://a.local/x")
+    assert len(events) == 3
+
+def test_request_error_reaches_hooks(monkeypatch):
+    transport = HttpTransport()
+    error = requests.exceptions.ConnectionError("refused")
+    monkeypatch.setattr(transport, "session_for", lambda url: FakeSession(error))
+    stats = RequestStats()
+    transport.add_hook(stats)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        transport.get("http://b.local/x")
+    assert stats.hosts["http://b.local"]["count"] == 1
+    assert stats.hosts["http://b.local"]["errors"] == 1
+
+def test_request_stats_counts_http_errors():
+    stats = RequestStats()
+    stats({'host': "h", 'status': 200, 'elapsed': 1.0, 'error': None})
+    stats({'host': "h", 'status': 503, 'elapsed': 3.0, 'error': None})
+    assert stats.hosts["h"] == {'count': 2, 'errors': 1, 'elapsed': 4.0, 'max': 3.0}
+
+def test_get_transport_is_shared(monkeypatch):
+    monkeypatch.setattr(http_transport, "_transport", None)
+    assert http_transport.get_transport() is http_transport.get_transport()
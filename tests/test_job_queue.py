@@ -0,0 +1,115 @@
+import json
+import sqlite3
+
+import pytest
+
+from job_queue import JobQueue, strip_enqueue
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "queue.sqlite"))
+
+def status(queue, job_id):
+    return next(job for job in queue.jobs() if job["id"] == job_id)
+
+def test_enqueue_dedups_active_jobs(queue):
+    first = queue.enqueue("tts", "srt_tts.py", ["--srt_file", "a.srt"])
+    assert queue.enqueue("tts", "srt_tts.py", ["--srt_file", "a.srt"]) == first
+    assert queue.enqueue("tts", "srt_tts.py", ["--srt_file", "b.srt"]) != first
+
+def test_enqueue_after_done_creates_new_job(queue):
+    first = queue.enqueue("tts", "srt_tts.py", ["a"])
+    job = queue.claim("w1")
+    queue.finish(job["id"], "w1", 0)
+    assert queue.enqueue("tts", "srt_tts.py", ["a"]) != first
+
+def test_claim_respects_kinds_and_order(queue):
+    queue.enqueue("blend", "video_blender.py", ["a"])
+    tts = queue.enqueue("tts", "srt_tts.py", ["a"])
+    job = queue.claim("w1", kinds=["tts"])
+    assert job["id"] == tts and job["attempts"] == 1
+    assert queue.claim("w2", kinds=["tts"]) is None
+
+def test_dependency_waits_until_done(queue):
+    translate = queue.enqueue("translate", "srt_translator.py", ["a"])
+    tts = queue.enqueue("tts", "srt_tts.py", ["a"], depends_on=[translate])
+    job = queue.claim("w1")
+    assert job["id"] == translate
+    assert queue.claim("w2") is None
+    queue.finish(translate, "w1", 0)
+    assert queue.claim("w2")["id"] == tts
+
+def test_failure_retries_with_backoff(queue):
+    job_id = queue.enqueue("tts", "srt_tts.py", ["a"], max_attempts=2)
+    queue.finish(queue.claim("w1")["id"], "w1", 1, "boom")
+    job = status(queue, job_id)
+    assert job["status"] == "pending" and job["error"] == "boom"
+    assert queue.claim("w1") is None  # 退避期间不可领取
+
+    sqlite3.connect(queue.db_path).execute("UPDATE jobs SET not_before = 0").connection.commit()
+    job = queue.claim("w1")
+    assert job["attempts"] == 2
+    queue.finish(job_id, "w1", 1, "boom again")
+    assert status(queue, job_id)["status"] == "failed"
+
+def test_failed_dependency_fails_dependents(queue):
+    translate = queue.enqueue("translate", "srt_translator.py", ["a"], max_attempts=1)
+    tts = queue.enqueue("tts", "srt_tts.py", ["a"], depends_on=[translate])
+    blend = queue.enqueue("blend", "video_blender.py", ["a"], depends_on=[tts])
+    queue.finish(queue.claim("w1")["id"], "w1", 1, "boom")
+    assert queue.claim("w1") is None
+    assert status(queue, tts)["status"] == "failed"
+    assert status(queue, tts)["error"] == "依赖任务失败"
+    # 下一次领取时沿依赖链继续传播
+    assert queue.claim("w1") is None
+    assert status(queue, blend)["status"] == "failed"
+
+def test_unknown_dependency_is_rejected(queue):
+    with pytest.raises(ValueError):
+        queue.enqueue("tts", "srt_tts.py", ["a"], depends_on=[42])
+    assert queue.jobs() == []
+
+def test_dangling_dependency_fails_instead_of_waiting(queue):
+    job_id = queue.enqueue("tts", "srt_tts.py", ["a"])
+    conn = sqlite3.connect(queue.db_path)
+    conn.execute("UPDATE jobs SET depends_on = ? WHERE id = ?", (json.dumps([99]), job_id))
+    conn.commit()
+    assert queue.claim("w1") is None
+    job = status(queue, job_id)
+    assert job["status"] == "failed" and "#99" in job["error"]
+
+def test_expired_lease_is_reclaimed(queue):
+    job_id = queue.enqueue("tts", "srt_tts.py", ["a"])
+    assert queue.claim("w1", lease_seconds=-1)["id"] == job_id
+    job = queue.claim("w2")
+    assert job["id"] == job_id and job["attempts"] == 2
+    # 失去租约的 worker 不能续租，也不能覆盖接手 worker 的结果
+    assert queue.heartbeat(job_id, "w1") is False
+    queue.finish(job_id, "w1", 1, "stale result")
+    assert status(queue, job_id)["status"] == "running"
+    assert queue.heartbeat(job_id, "w2") is True
+    queue.finish(job_id, "w2", 0)
+    assert status(queue, job_id)["status"] == "done"
+
+def test_expired_lease_without_attempts_left_fails(queue):
+    job_id = queue.enqueue("tts", "srt_tts.py", ["a"], max_attempts=1)
+    queue.claim("w1", lease_seconds=-1)
+    assert queue.claim("w2") is None
+    assert status(queue, job_id)["status"] == "failed"
+
+def test_release_does_not_count_attempt(queue):
+    job_id = queue.enqueue("tts", "srt_tts.py", ["a"])
+    queue.claim("w1")
+    queue.release(job_id, "w1")
+    assert queue.claim("w2")["attempts"] == 1
+
+def test_retry_failed_resets_attempts(queue):
+    job_id = queue.enqueue("tts", "srt_tts.py", ["a"], max_attempts=1)
+    queue.finish(queue.claim("w1")["id"], "w1", 1, "boom")
+    assert queue.retry_failed() == 1
+    job = queue.claim("w1")
+    assert job["id"] == job_id and job["attempts"] == 1
+
+def test_strip_enqueue():
+    assert strip_enqueue(["-i", "x", "--enqueue", "q.sqlite", "-v"]) == ["-i", "x", "-v"]
+    assert strip_enqueue(["--enqueue=q.sqlite", "-i", "x"]) == ["-i", "x"]
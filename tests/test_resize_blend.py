@@ -0,0 +1,68 @@
+import pytest
+
+import resize_blend
+from build_manifest import record_build, load_record
+from test_video_blender import blend_args
+
+def make_videos(directory, names):
+    for name in names:
+        (directory / name).write_bytes(name.encode())
+
+def test_fused_settings():
+    assert resize_blend.fused_settings(1280, 720, "cpu") == {'size': "1280x720", 'hwaccel': None, 'codec': "libx264"}
+    assert resize_blend.fused_settings(1280, 720, "nvenc") == {'size': "1280x720", 'hwaccel': "nvenc", 'codec': "h264_nvenc"}
+    assert resize_blend.fused_settings(1280, 720, "qsv")['hwaccel'] is None
+
+def test_list_source_videos_skips_outputs(tmp_path):
+    make_videos(tmp_path, ["a.mp4", "a_en.mp4", "a_cn.mp4", "a_blended.mp4", "a_small.mp4", "a_small_720p.mp4",
+                           "b.resize_blend_tmp.mp4", "c.mp4"])
+    videos = resize_blend.list_source_videos(str(tmp_path), "_small", blend_args())
+    assert sorted(videos) == [str(tmp_path / "a.mp4"), str(tmp_path / "c.mp4")]
+    only = resize_blend.list_source_videos(str(tmp_path), "_small", blend_args(), str(tmp_path / "c.mp4"))
+    assert only == [str(tmp_path / "c.mp4")]
+
+def test_already_replaced(tmp_path):
+    make_videos(tmp_path, ["a.mp4", "b.mp4"])
+    video = str(tmp_path / "a.mp4")
+    record_build(video, [video], resize_blend.REPLACED_PARAMS)
+    assert resize_blend.already_replaced(video)
+    assert resize_blend.list_source_videos(str(tmp_path), "_blended", blend_args()) == [str(tmp_path / "b.mp4")]
+    # 原始文件被重新下载或修改后需要重新处理
+    (tmp_path / "a.mp4").write_bytes(b"new source")
+    assert not resize_blend.already_replaced(video)
+    assert not resize_blend.already_replaced(str(tmp_path / "b.mp4"))
+
+@pytest.fixture
+def fake_schedule(monkeypatch):
+    """替换调度器：成功的任务写出输出文件，返回 schedule_jobs 格式的结果"""
+    def configure(fail=()):
+        scheduled = []
+        def schedule(jobs, cpu_slots, hw_slots, summary_path=None):
+            results = []
+            for job in jobs:
+                scheduled.append(job)
+                ok = not job.main_video.endswith(fail)
+                with open(job.output, "wb") as f:
+                    f.write(b"blended" if ok else b"partial")
+                results.append({"output": job.output, "ok": ok})
+            return results
+        monkeypatch.setattr(resize_blend, "schedule_jobs", schedule)
+        return scheduled
+    return configure
+
+def test_process_directory_replace(tmp_path, fake_schedule):
+    make_videos(tmp_path, ["a.mp4", "b.mp4"])
+    scheduled = fake_schedule(fail=("b.mp4",))
+    resize_blend.process_directory(str(tmp_path), 1280, 720, replace=True, blend_args=blend_args())
+    assert {job.output for job in scheduled} == {str(tmp_path / f"{name}.resize_blend_tmp.mp4") for name in "ab"}
+    assert all(job.size == "1280x720" and job.codec == "libx264" for job in scheduled)
+    # 成功的覆盖原始文件，失败的删除临时输出并保留原始文件
+    assert (tmp_path / "a.mp4").read_bytes() == b"blended"
+    assert (tmp_path / "b.mp4").read_bytes() == b"b.mp4"
+    assert sorted(p.name for p in tmp_path.glob("*.mp4")) == ["a.mp4", "b.mp4"]
+    assert load_record(str(tmp_path / "a.mp4"))["params"] == resize_blend.REPLACED_PARAMS
+
+    # 再次运行只处理未替换的文件
+    scheduled.clear()
+    resize_blend.process_directory(str(tmp_path), 1280, 720, replace=True, blend_args=blend_args())
+    assert [job.main_video for job in scheduled] == [str(tmp_path / "b.mp4")]
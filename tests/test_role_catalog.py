@@ -0,0 +1,103 @@
+import os
+import wave
+
+import role_catalog
+from role_catalog import RoleCatalog
+
+def write_wav(path, seconds=0.5, sample_rate=16000):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with wave.open(str(path), "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(b"\x00\x00" * int(seconds * sample_rate))
+
+def make_data_dir(root):
+    write_wav(os.path.join(root, "roles", "alice", "reference_audio.wav"))
+    with open(os.path.join(root, "roles", "alice", "reference_text.txt"), "w", encoding="utf-8") as f:
+        f.write(" 你好 \n")
+    os.makedirs(os.path.join(root, "roles", "empty"))  # 缺少参考音频，不是角色
+    write_wav(os.path.join(root, "mega-roles", "group1", "bob.wav"), seconds=1.0, sample_rate=24000)
+    with open(os.path.join(root, "mega-roles", "group1", "bob.npy"), "wb") as f:
+        f.write(b"\x93NUMPYlatent")
+    return str(root)
+
+def test_catalog_indexes_roles_and_mega_roles(tmp_path):
+    catalog = RoleCatalog(make_data_dir(tmp_path))
+    assert catalog.names() == ["alice"]
+    assert catalog.names("mega-roles") == ["bob"]
+
+    alice = catalog.get("alice")
+    assert alice["kind"] == "roles"
+    assert alice["reference_text"] == "你好"
+    assert alice["duration"] == 0.5 and alice["sample_rate"] == 16000
+    assert alice["latent_path"] is None and alice["latent_hash"] is None
+
+    bob = catalog.get("bob")
+    assert bob["kind"] == "mega-roles"
+    assert bob["duration"] == 1.0 and bob["sample_rate"] == 24000
+    assert bob["latent_hash"] == RoleCatalog._file_hash(bob["latent_path"])
+    assert catalog.get("bob", kind="roles") is None
+    assert catalog.get("nobody") is None
+
+def test_catalog_reuses_cached_metadata(tmp_path, monkeypatch):
+    data_dir = make_data_dir(tmp_path)
+    RoleCatalog(data_dir)
+    assert os.path.exists(os.path.join(data_dir, role_catalog.CACHE_FILENAME))
+
+    hashed = []
+    original = RoleCatalog._file_hash
+    monkeypatch.setattr(RoleCatalog, "_file_hash", staticmethod(lambda path: hashed.append(path) or original(path)))
+    catalog = RoleCatalog(data_dir)
+    assert hashed == []
+    assert catalog.get("alice")["reference_text"] == "你好"
+
+    # 修改后的文件按 mtime/大小失效，只重新计算该角色
+    write_wav(os.path.join(data_dir, "roles", "alice", "reference_audio.wav"), seconds=2.0)
+    catalog.refresh()
+    assert [os.path.basename(path) for path in hashed] == ["reference_audio.wav"]
+    assert catalog.get("alice")["duration"] == 2.0
+
+def test_catalog_ignores_old_cache_version(tmp_path, monkeypatch):
+    data_dir = make_data_dir(tmp_path)
+    with open(os.path.join(data_dir, role_catalog.CACHE_FILENAME), "w", encoding="utf-8") as f:
+        f.write('{"version": 1, "roles": {"alice": {}}}')
+    catalog = RoleCatalog(data_dir)
+    assert catalog.get("alice")["audio_hash"]
+
+def test_read_audio_cached_by_hash(tmp_path):
+    catalog = RoleCatalog(make_data_dir(tmp_path))
+    alice = catalog.get("alice")
+    audio = catalog.read_audio(alice)
+    assert audio[:4] == b"RIFF"
+    assert catalog.read_audio(alice) is audio
+
+def test_get_catalog_shared_per_data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(role_catalog, "_catalog", None)
+    data_dir = make_data_dir(tmp_path)
+    catalog = role_catalog.get_catalog(data_dir)
+    assert role_catalog.get_catalog(data_dir) is catalog
+    other = tmp_path / "other"
+    other.mkdir()
+    assert role_catalog.get_catalog(str(other)) is not catalog
+
+def test_read_latent_returns_file_bytes_once(tmp_path, monkeypatch):
+    catalog = RoleCatalog(make_data_dir(tmp_path))
+    bob = catalog.get("bob")
+    assert catalog.read_latent(bob) == b"\x93NUMPYlatent"
+    # 之后从内存返回，不再读取文件
+    os.remove(bob["latent_path"])
+    assert catalog.read_latent(bob) == b"\x93NUMPYlatent"
+
+def test_duplicate_mega_roles_keep_first_group(tmp_path, capsys):
+    data_dir = make_data_dir(tmp_path)
+    write_wav(os.path.join(data_dir, "mega-roles", "group2", "bob.wav"), seconds=3.0)
+    catalog = RoleCatalog(data_dir)
+    group1 = os.path.join(data_dir, "mega-roles", "group1")
+    group2 = os.path.join(data_dir, "mega-roles", "group2")
+    assert catalog.get("bob")["dir"] == group1
+    assert catalog.duplicates == {"bob": [group1, group2]}
+    assert "bob" in capsys.readouterr().out
+    # 重名情况未变化时不重复警告
+    catalog.refresh()
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,273 @@
+import os
+
+import numpy as np
+import pytest
+import requests
+
+import srt_tts
+
+@pytest.fixture
+def tts():
+    """不创建 TTS 节点池与角色索引的实例，只用于测试纯计算方法"""
+    instance = srt_tts.SrtTTS.__new__(srt_tts.SrtTTS)
+    instance.dedup = True
+    instance.speech_speed = "moderate"
+    return instance
+
+def subtitle(text):
+    return {"text": text, "start_time": 0.0, "end_time": 1.0}
+
+def test_group_duplicate_subtitles(tts):
+    subtitles = [subtitle("你好"), subtitle("再见"), subtitle(" 你好 "), subtitle("ｈｅｌｌｏ  world"), subtitle("hello world")]
+    assert tts.group_duplicate_subtitles(subtitles) == [[0, 2], [1], [3, 4]]
+
+def test_group_duplicate_subtitles_disabled(tts):
+    tts.dedup = False
+    assert tts.group_duplicate_subtitles([subtitle("a"), subtitle("a")]) == [[0], [1]]
+
+def test_merge_windows(tts):
+    assert tts._merge_windows([]) == []
+    assert tts._merge_windows([(10, 20), (0, 5), (5, 8), (15, 30), (40, 50)]) == [(0, 8), (10, 30), (40, 50)]
+    assert tts._merge_windows([(0, 100), (10, 20)]) == [(0, 100)]
+
+@pytest.fixture
+def checkpoint_tts(tts):
+    """检查点相关方法所需的合成参数（不使用克隆角色，不访问角色索引）"""
+    tts.audio_codec = "aac"
+    tts.audio_format = "m4a"
+    tts.speed_detection = True
+    tts.speech_pitch = "moderate"
+    tts.voice_role = "male"
+    tts.clone_role = ""
+    tts.alternative = 0
+    tts.speed_adjust = False
+    tts.stream = False
+    tts.verbose = False
+    return tts
+
+def timed(index, text, start):
+    return {"index": index, "text": text, "start_time": start, "end_time": start + 1.0}
+
+def test_checkpoint_resumes_completed_segments(checkpoint_tts, tmp_path):
+    work_dir = str(tmp_path / "work")
+    checkpoint = checkpoint_tts.load_checkpoint(work_dir, "a.srt")
+    done, pending = timed(1, "你好", 0.0), timed(2, "再见", 2.0)
+    (tmp_path / "work" / "seg_00001.m4a").write_bytes(b"audio")
+    checkpoint_tts.append_checkpoint_record(checkpoint, checkpoint_tts.checkpoint_record(done, "seg_00001.m4a"))
+
+    resumed = checkpoint_tts.load_checkpoint(work_dir, "a.srt")
+    assert checkpoint_tts.find_checkpoint_segment(resumed, done) == os.path.join(work_dir, "seg_00001.m4a")
+    assert checkpoint_tts.find_checkpoint_segment(resumed, pending) is None
+    # 文本或时间轴变化后分段不再有效
+    assert checkpoint_tts.find_checkpoint_segment(resumed, timed(1, "您好", 0.0)) is None
+    assert checkpoint_tts.find_checkpoint_segment(resumed, timed(1, "你好", 0.5)) is None
+
+def test_checkpoint_ignores_truncated_last_line(checkpoint_tts, tmp_path):
+    work_dir = str(tmp_path / "work")
+    checkpoint = checkpoint_tts.load_checkpoint(work_dir, "a.srt")
+    checkpoint_tts.append_checkpoint_record(checkpoint, checkpoint_tts.checkpoint_record(timed(1, "a", 0.0), "seg_00001.m4a"))
+    with open(os.path.join(work_dir, "segments.jsonl"), "a", encoding="utf-8") as f:
+        f.write('{"index": 2, "te')
+    assert list(checkpoint_tts.load_checkpoint(work_dir, "a.srt")["segments"]) == [1]
+
+def test_checkpoint_discarded_when_params_change(checkpoint_tts, tmp_path):
+    work_dir = str(tmp_path / "work")
+    checkpoint = checkpoint_tts.load_checkpoint(work_dir, "a.srt")
+    checkpoint_tts.append_checkpoint_record(checkpoint, checkpoint_tts.checkpoint_record(timed(1, "a", 0.0), "seg_00001.m4a"))
+    checkpoint_tts.voice_role = "female"
+    assert checkpoint_tts.load_checkpoint(work_dir, "a.srt")["segments"] == {}
+
+def test_mix_timeline_grows_and_mixes(tmp_path):
+    mix = srt_tts.MixTimeline(str(tmp_path / "mix.pcm"))
+    mix.add(10, np.full(5, 1000, dtype=np.int16))
+    mix.add(12, np.full(5, 32000, dtype=np.int16))  # 重叠部分叠加并削波
+    mix.clear(0, 11)
+    mix.close(17)
+    assert np.fromfile(str(tmp_path / "mix.pcm"), dtype=np.int16).tolist() == [0] * 11 + [1000] + [32767] * 3 + [32000] * 2
+
+def test_mix_timeline_window_limits_writes(tmp_path):
+    path = str(tmp_path / "mix.pcm")
+    np.full(10, 7, dtype=np.int16).tofile(path)
+    mix = srt_tts.MixTimeline(path, keep=True)
+    mix.add(0, np.ones(10, dtype=np.int16), window_start=4, window_end=6)
+    mix.close()
+    assert np.fromfile(path, dtype=np.int16).tolist() == [7] * 4 + [8] * 2 + [7] * 4
+
+def test_segment_pool_does_not_fork():
+    assert srt_tts.segment_pool_context().get_start_method() in ("forkserver", "spawn")
+
+def test_segments_placed_as_they_complete(checkpoint_tts, tmp_path):
+    checkpoint_tts.incremental = False
+    checkpoint = checkpoint_tts.load_checkpoint(str(tmp_path / "work"), "a.srt")
+    subtitles = [timed(1, "a", 0.0), timed(2, "b", 1.0)]
+    mix = checkpoint_tts.open_mix(checkpoint, subtitles)
+    for subtitle, value in zip(subtitles, (100, 200)):
+        name = f"seg_{subtitle['index']:05d}.m4a"
+        (tmp_path / "work" / name).write_bytes(b"audio")
+        np.full(srt_tts.MIX_SAMPLE_RATE * 2, value, dtype=np.int16).tofile(str(tmp_path / "work" / f"seg_{subtitle['index']:05d}.pcm"))
+        checkpoint_tts.append_checkpoint_record(checkpoint, checkpoint_tts.checkpoint_record(subtitle, name))
+        checkpoint_tts.place_segment(mix, checkpoint, subtitle)
+    timeline = np.fromfile(checkpoint_tts.finish_mix(mix, checkpoint, subtitles), dtype=np.int16)
+    rate = srt_tts.MIX_SAMPLE_RATE
+    assert len(timeline) == 3 * rate
+    assert (timeline[:rate] == 100).all() and (timeline[rate:2 * rate] == 300).all() and (timeline[2 * rate:] == 200).all()
+
+@pytest.fixture
+def tuner_state(tmp_path, monkeypatch):
+    path = str(tmp_path / "tts_concurrency.json")
+    monkeypatch.setattr(srt_tts.ConcurrencyTuner, "STATE_FILE", path)
+    return path
+
+def test_tuner_raises_limit_while_throughput_grows(tuner_state):
+    tuner = srt_tts.ConcurrencyTuner("http://a", max_limit=3)
+    assert tuner.limit == 2
+    for _ in range(4):
+        tuner.record(0.1, True)
+    assert tuner.limit == 3
+
+def test_tuner_backs_off_on_errors(tuner_state):
+    tuner = srt_tts.ConcurrencyTuner("http://a")
+    tuner.limit = 10
+    for ok in [True] * 18 + [False] * 2:
+        tuner.record(0.1, ok)
+    assert tuner.limit == 7
+
+def test_tuner_starts_from_saved_limit(tuner_state):
+    tuner = srt_tts.ConcurrencyTuner("http://a", max_limit=8)
+    tuner.best_limit = 5
+    tuner.save_state()
+    assert srt_tts.ConcurrencyTuner("http://a", max_limit=8).limit == 5
+    assert srt_tts.ConcurrencyTuner("http://a", max_limit=4).limit == 4
+    assert srt_tts.ConcurrencyTuner("http://b").limit == 2
+
+def endpoint_pool(*urls, **kwargs):
+    pool = srt_tts.TTSEndpointPool(urls, **kwargs)
+    pool.health_thread = object()  # 不启动后台健康检查
+    return pool
+
+def test_pool_routes_to_least_outstanding():
+    pool = endpoint_pool("http://a", "http://b")
+    first = pool.acquire()
+    second = pool.acquire()
+    assert {first.url, second.url} == {"http://a", "http://b"}
+    pool.release(first, 0.1, True)
+    assert pool.acquire() is first
+
+def test_pool_ejects_unreachable_endpoint_immediately():
+    pool = endpoint_pool("http://a", "http://b")
+    endpoint = pool.endpoints[0]
+    endpoint.outstanding = 1
+    pool.release(endpoint, 0.1, False, requests.exceptions.ConnectionError())
+    assert not endpoint.healthy()
+    assert pool.acquire().url == "http://b"
+
+def test_pool_ejects_after_repeated_server_errors():
+    pool = endpoint_pool("http://a", "http://b", eject_after=3)
+    endpoint = pool.endpoints[0]
+    for _ in range(3):
+        assert endpoint.healthy()
+        endpoint.outstanding += 1
+        pool.release(endpoint, 0.1, False)  # 5xx：单个请求失败
+    assert not endpoint.healthy()
+
+def test_pool_success_resets_failures():
+    pool = endpoint_pool("http://a", "http://b", eject_after=2)
+    endpoint = pool.endpoints[0]
+    for ok in (False, True, False):
+        endpoint.outstanding += 1
+        pool.release(endpoint, 0.1, ok)
+    assert endpoint.healthy()
+
+def test_pool_pins_affinity():
+    pool = endpoint_pool("http://a", "http://b")
+    pool.pin("role", pool.endpoints[1])
+    assert pool.acquire("role") is pool.endpoints[1]
+    assert pool.acquire("role") is pool.endpoints[1]
+    pool.endpoints[1].ejected_until = float("inf")
+    assert pool.pinned("role") is None
+
+def wav_header(sample_rate=24000, channels=1, bits=16, audio_format=1):
+    fmt = (audio_format.to_bytes(2, "little") + channels.to_bytes(2, "little") + sample_rate.to_bytes(4, "little")
+           + (sample_rate * channels * bits // 8).to_bytes(4, "little") + (channels * bits // 8).to_bytes(2, "little")
+           + bits.to_bytes(2, "little"))
+    # 流式WAV头中的长度字段无效
+    return b"RIFF" + b"\xff" * 4 + b"WAVE" + b"fmt " + len(fmt).to_bytes(4, "little") + fmt + b"data" + b"\xff" * 4
+
+class FakeStreamResponse:
+    def __init__(self, body, chunk_size=1000):
+        self.chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+        self.closed = False
+
+    def iter_content(self, chunk_size=None):
+        for chunk in self.chunks:
+            if self.closed:
+                return
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+def test_parse_wav_header(tts):
+    header = wav_header(16000, 2)
+    assert tts.parse_wav_header(header[:20]) is None
+    assert tts.parse_wav_header(header) == (16000, 2, 2, len(header))
+    with pytest.raises(ValueError):
+        tts.parse_wav_header(b"ID3\x04" + b"\x00" * 40)
+    with pytest.raises(ValueError):
+        tts.parse_wav_header(wav_header(bits=32, audio_format=3))
+
+def test_resampler_chunks_match_whole_stream():
+    source = (np.sin(np.arange(16000) / 7) * 10000).astype(np.int16)
+    stereo = np.repeat(source, 2).tobytes()
+    whole = srt_tts.PcmResampler(16000, 2).feed(stereo)
+    resampler = srt_tts.PcmResampler(16000, 2)
+    # 分块边界不对齐帧
+    chunked = np.concatenate([resampler.feed(stereo[i:i + 999]) for i in range(0, len(stereo), 999)])
+    assert np.array_equal(whole, chunked)
+    assert abs(len(whole) - len(source) * srt_tts.MIX_SAMPLE_RATE // 16000) <= 1
+
+@pytest.fixture
+def stream_tts(checkpoint_tts):
+    checkpoint_tts.stream = True
+    return checkpoint_tts
+
+def test_read_audio_streams_into_segments_and_mix(stream_tts, tmp_path):
+    pcm = (np.arange(4800) % 200 - 100).astype(np.int16)
+    mix = srt_tts.MixTimeline(str(tmp_path / "mix.pcm"))
+    paths = [str(tmp_path / "a.pcm"), str(tmp_path / "b.pcm")]
+    target = srt_tts.StreamTarget(paths, mix, [0, 10000])
+    assert stream_tts.read_audio(FakeStreamResponse(wav_header() + pcm.tobytes()), 1.0, target) == len(pcm)
+    for path in paths:
+        assert np.array_equal(np.fromfile(path, dtype=np.int16), pcm)
+        assert not os.path.exists(path + ".part")
+    assert np.array_equal(mix.array[:4800], pcm)
+    assert np.array_equal(mix.array[10000:14800], pcm)
+    assert not mix.array[4800:10000].any()
+
+def test_read_audio_overrun_discards_written_audio(stream_tts, tmp_path):
+    mix = srt_tts.MixTimeline(str(tmp_path / "mix.pcm"))
+    existing = np.full(2000, 50, dtype=np.int16)
+    mix.add(1000, existing)
+    before = np.array(mix.array)
+    path = str(tmp_path / "a.pcm")
+    target = srt_tts.StreamTarget([path], mix, [0])
+    resp = FakeStreamResponse(wav_header() + np.full(24000, 300, dtype=np.int16).tobytes())
+    with pytest.raises(srt_tts.SegmentOverrun):
+        stream_tts.read_audio(resp, 0.5, target)
+    assert resp.closed
+    assert not os.path.exists(path) and not os.path.exists(path + ".part")
+    assert np.array_equal(mix.array[:len(before)], before)
+    assert not mix.array[len(before):].any()
+
+def test_read_audio_rejects_truncated_header(stream_tts, tmp_path):
+    path = str(tmp_path / "a.pcm")
+    with pytest.raises(ValueError):
+        stream_tts.read_audio(FakeStreamResponse(wav_header()[:30]), None, srt_tts.StreamTarget([path]))
+    assert not os.path.exists(path + ".part")
+
+def test_stream_target_without_audio_fails(tmp_path):
+    path = str(tmp_path / "a.pcm")
+    target = srt_tts.StreamTarget([path])
+    target.begin(24000, 1)
+    assert target.finish() == 0
+    assert not os.path.exists(path) and not os.path.exists(path + ".part")
@@ -0,0 +1,256 @@
+import argparse
+
+import pysrt
+import pytest
+
+import video_blender
+
+def blend_args(**overrides):
+    """命令行默认参数（与 video_blender 主程序一致），overrides 覆盖单项"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--codec", default="libx264")
+    parser.add_argument("--hwaccel", default=None)
+    parser.add_argument("--size", default=None)
+    video_blender.add_blend_arguments(parser)
+    args = parser.parse_args([])
+    args.main_video = "main.mp4"
+    args.output = "out.mp4"
+    args.threads = 4
+    for key, value in overrides.items():
+        setattr(args, key, value)
+    video_blender.resolve_subtitle_suffixes(args)
+    return args
+
+def filter_graph(cmd):
+    return cmd[cmd.index("-filter_complex") + 1]
+
+def test_ass_time_and_text():
+    assert video_blender.ass_time(pysrt.SubRipTime(1, 2, 3, 456)) == "1:02:03.45"
+    assert video_blender.ass_text(" <i>第一行</i>\n{第二行} ") == "第一行\\N(第二行)"
+
+def test_escape_filter_value():
+    assert video_blender.escape_filter_value("C:/a b/x.ass") == "C\\\\:/a b/x.ass"
+    assert video_blender.escape_filter_value("it's[1].ass") == "it\\\\\\'s\\[1\\].ass"
+
+def test_build_bilingual_ass(tmp_path):
+    en = tmp_path / "v_en.srt"
+    cn = tmp_path / "v_cn.srt"
+    en.write_text("1\n00:00:01,000 --> 00:00:02,500\nHello\n", encoding="utf-8")
+    cn.write_text("1\n00:00:01,000 --> 00:00:02,500\n你好\n世界\n", encoding="utf-8")
+    ass_path = tmp_path / "v.ass"
+    video_blender.build_bilingual_ass(str(en), str(cn), str(ass_path), 1280, 720, blend_args(srt=True))
+    lines = ass_path.read_text(encoding="utf-8").splitlines()
+    assert "PlayResX: 1280" in lines and "PlayResY: 720" in lines
+    # 未指定字号时按视频高度计算
+    assert any(line.startswith("Style: Sub1,Noto Sans CJK SC,27,") for line in lines)
+    assert any(line.startswith("Style: Sub2,Noto Sans CJK SC,33,") for line in lines)
+    assert "Dialogue: 0,0:00:01.00,0:00:02.50,Sub1,,0,0,0,,Hello" in lines
+    assert "Dialogue: 0,0:00:01.00,0:00:02.50,Sub2,,0,0,0,,你好\\N世界" in lines
+
+def test_burn_in_decodes_main_video_once():
+    args = blend_args(srt=True, size="1280x720")
+    cmd = video_blender.build_burn_in_command(args, "/tmp/sub.ass")
+    assert cmd.count("-i") == 1
+    assert filter_graph(cmd) == "[0:v]scale=1280:720,ass=/tmp/sub.ass[final]"
+    assert cmd[-1] == "out.mp4"
+    assert cmd[cmd.index("-c:v") + 1] == "libx264"
+
+def test_burn_in_segment_restores_timestamps():
+    args = blend_args(srt=True, segment=(12.5, 30.0))
+    cmd = video_blender.build_burn_in_command(args, "/tmp/sub.ass")
+    assert cmd[cmd.index("-ss") + 1] == "12.500" and cmd[cmd.index("-to") + 1] == "30.000"
+    assert filter_graph(cmd) == "[0:v]setpts=PTS+12.500/TB,ass=/tmp/sub.ass,setpts=PTS-STARTPTS[final]"
+    # 分段不含音频
+    assert "-an" in cmd
+
+def test_burn_in_nvenc_renders_on_cpu():
+    cmd = video_blender.build_burn_in_command(blend_args(srt=True, hwaccel="nvenc"), "/tmp/sub.ass")
+    assert "-hwaccel_output_format" not in cmd
+    assert cmd[cmd.index("-c:v") + 1] == "hevc_nvenc"
+
+def band_geometry():
+    return {"band1": {"y": 980, "h": 60, "width": 1920, "height": 1080},
+            "band2": {"y": 900, "h": 80, "width": 1920, "height": 1080}}
+
+def test_parse_band():
+    assert video_blender.parse_band("980:100") == (980, 100)
+
+def test_band_overlay_crops_and_scales_by_height():
+    args = blend_args(size="1280x720")
+    cmd = video_blender.build_band_overlay_command(args, band_geometry())
+    assert filter_graph(cmd).split(";") == [
+        "[0:v]scale=1280:720[v0]",
+        "[1:v]crop=iw:60:0:980,scale=1280:40[b1]",
+        "[2:v]crop=iw:80:0:900,scale=1280:52[b2]",
+        "[v0][b1]overlay=x=0:y=643[v1]",
+        "[v1][b2]overlay=x=0:y=535[final]",
+    ]
+
+def test_band_overlay_nvenc_crops_in_decoder():
+    args = blend_args(hwaccel="nvenc")
+    cmd = video_blender.build_band_overlay_command(args, band_geometry())
+    crops = [cmd[i + 1] for i, arg in enumerate(cmd) if arg == "-crop"]
+    assert crops == ["980x40x0x0", "900x100x0x0"]
+    assert "[1:v]null[b1]" in filter_graph(cmd)
+    assert "[v0][b1]overlay_cuda=x=0:y=970[v1]" in filter_graph(cmd)
+
+def test_detect_subtitle_band(monkeypatch):
+    captured = {}
+    def fake_run(cmd, **kwargs):
+        captured["cmd"] = cmd
+        return argparse.Namespace(stderr="crop=1920:40:0:1000\n[Parsed_cropdetect] crop=1920:63:0:977\n")
+    monkeypatch.setattr(video_blender.ffmpeg_runner, "run_ffmpeg", fake_run)
+    monkeypatch.setattr(video_blender, "probe_video_size", lambda path: (1920, 1080))
+    # 取最后一次（累积所有采样帧）的结果，上下各留 padding 并对齐到偶数
+    assert video_blender.detect_subtitle_band("sub.mp4") == (972, 72)
+    assert "fps=4,cropdetect=limit=24:round=2:reset=0" in captured["cmd"]
+
+def test_detect_subtitle_band_empty(monkeypatch):
+    monkeypatch.setattr(video_blender.ffmpeg_runner, "run_ffmpeg", lambda cmd, **kwargs: argparse.Namespace(stderr=""))
+    assert video_blender.detect_subtitle_band("sub.mp4") is None
+
+@pytest.fixture
+def original_audio(monkeypatch):
+    """替换 ffprobe：original_audio(True/False) 设置主视频是否有音轨"""
+    def configure(present):
+        monkeypatch.setattr(video_blender, "has_audio_stream", lambda path: present)
+    return configure
+
+def test_audio_options_default_copies_original():
+    assert video_blender.audio_options(blend_args(), 3) == ([], [], ["-map", "0:a?", "-c:a", "copy"])
+
+def test_audio_options_track_mode(original_audio):
+    original_audio(True)
+    inputs, filters, output = video_blender.audio_options(blend_args(tts_audio="v_cn.m4a"), 3)
+    assert inputs == ["-i", "v_cn.m4a"] and filters == []
+    assert output == ["-map", "0:a?", "-map", "3:a", "-c:a", "copy",
+                      "-metadata:s:a:1", "language=chi", "-metadata:s:a:1", "title=TTS"]
+
+def test_audio_options_track_without_original(original_audio):
+    original_audio(False)
+    _, _, output = video_blender.audio_options(blend_args(tts_audio="v_cn.m4a"), 1)
+    assert output[:4] == ["-map", "1:a", "-c:a", "copy"]
+    assert "-metadata:s:a:0" in output
+
+def test_audio_options_duck_mode(original_audio):
+    original_audio(True)
+    _, filters, output = video_blender.audio_options(blend_args(tts_audio="v_cn.m4a", tts_mode="duck"), 3)
+    assert filters[0] == "[3:a]asplit=2[tts][sidechain]"
+    assert filters[1].startswith("[0:a][sidechain]sidechaincompress=threshold=0.05:ratio=8")
+    assert output[:2] == ["-map", "[aout]"]
+
+def test_audio_options_segment_has_no_audio():
+    assert video_blender.audio_options(blend_args(tts_audio="v_cn.m4a", segment=(0.0, 10.0)), 3) == ([], [], ["-an"])
+
+def test_tts_audio_muxed_in_overlay_pass(original_audio):
+    original_audio(True)
+    cmd = video_blender.build_overlay_command(blend_args(tts_audio="v_cn.m4a", subtitle1="v_en.mp4", subtitle2="v_cn.mp4"))
+    assert cmd[cmd.index("-i", cmd.index("v_cn.mp4")) + 1] == "v_cn.m4a"
+    assert cmd.index("3:a") < cmd.index("out.mp4")
+
+def test_mux_command_copies_video(original_audio):
+    original_audio(True)
+    cmd = video_blender.build_mux_command(blend_args(tts_audio="v_cn.m4a", audio_only=True))
+    assert cmd[cmd.index("-c:v") + 1] == "copy"
+    assert "-filter_complex" not in cmd
+
+def test_list_job_skips_missing_tts_audio(tmp_path):
+    video = tmp_path / "v.mp4"
+    video.write_bytes(b"video")
+    args = blend_args(tts_audio="_cn.m4a", main_video=str(tmp_path))
+    assert video_blender.prepare_list_job(args, str(video)) is None
+    (tmp_path / "v_cn.m4a").write_bytes(b"audio")
+    job = video_blender.prepare_list_job(args, str(video))
+    assert job.tts_audio == str(tmp_path / "v_cn.m4a")
+    assert job.output == str(tmp_path / "v_blended.mp4")
+
+def test_encoder_args_cpu_slot_falls_back_from_nvenc():
+    assert video_blender.encoder_args(blend_args(codec="h264_nvenc"))[:2] == ["-c:v", video_blender.CPU_FALLBACK_CODEC]
+    assert video_blender.encoder_args(blend_args(codec="libx265"))[:4] == ["-c:v", "libx265", "-threads", "4"]
+    assert video_blender.encoder_args(blend_args(codec="h264_nvenc", hwaccel="nvenc"))[:2] == ["-c:v", "h264_nvenc"]
+    assert video_blender.encoder_args(blend_args(hwaccel="nvenc"))[:2] == ["-c:v", "hevc_nvenc"]
+
+def test_resolve_slots(monkeypatch):
+    monkeypatch.setattr(video_blender.os, "cpu_count", lambda: 32)
+    assert video_blender.resolve_slots(blend_args()) == (4, 0)
+    assert video_blender.resolve_slots(blend_args(hwaccel="nvenc")) == (0, 2)
+    assert video_blender.resolve_slots(blend_args(hwaccel="nvenc", cpu_slots=1, hw_slots=3)) == (1, 3)
+
+def test_schedule_jobs_splits_slots(tmp_path, monkeypatch):
+    monkeypatch.setattr(video_blender.os, "cpu_count", lambda: 8)
+    monkeypatch.setattr(video_blender, "probe_duration", lambda path: 10.0)
+    recorded = []
+    monkeypatch.setattr(video_blender, "record_blend", lambda job: recorded.append(job.output))
+    started = []
+    def fake_combine(job):
+        started.append((job.main_video, job.hwaccel, job.threads, job.quiet))
+        return not job.main_video.endswith("bad.mp4")
+    monkeypatch.setattr(video_blender, "combine_video_with_subtitles", fake_combine)
+
+    jobs = []
+    for name, size in (("small.mp4", 10), ("big.mp4", 1000), ("bad.mp4", 100)):
+        path = tmp_path / name
+        path.write_bytes(b"x" * size)
+        jobs.append(blend_args(main_video=str(path), output=str(path) + ".out", codec="h264_nvenc"))
+    summary = tmp_path / "summary.json"
+    results = video_blender.schedule_jobs(jobs, cpu_slots=1, hw_slots=1, summary_path=str(summary))
+
+    assert len(results) == 3
+    assert {item["file"]: item["ok"] for item in results} == {"small.mp4": True, "big.mp4": True, "bad.mp4": False}
+    assert sorted(recorded) == sorted(str(tmp_path / name) + ".out" for name in ("small.mp4", "big.mp4"))
+    # 线程预算按槽位平均分配；并行时只输出错误信息
+    assert {(hwaccel, threads, quiet) for _, hwaccel, threads, quiet in started} <= {("nvenc", 4, True), (None, 4, True)}
+    assert summary.exists()
+
+def test_schedule_jobs_largest_first(tmp_path, monkeypatch):
+    monkeypatch.setattr(video_blender, "probe_duration", lambda path: None)
+    monkeypatch.setattr(video_blender, "record_blend", lambda job: None)
+    started = []
+    monkeypatch.setattr(video_blender, "combine_video_with_subtitles", lambda job: started.append(job) or True)
+    jobs = []
+    for name, size in (("small.mp4", 10), ("big.mp4", 1000), ("medium.mp4", 100)):
+        path = tmp_path / name
+        path.write_bytes(b"x" * size)
+        jobs.append(blend_args(main_video=str(path)))
+    video_blender.schedule_jobs(jobs, cpu_slots=1, hw_slots=0)
+    assert [job.main_video for job in started] == [str(tmp_path / name) for name in ("big.mp4", "medium.mp4", "small.mp4")]
+    assert started[0].quiet is False
+
+def test_schedule_jobs_requires_a_slot():
+    with pytest.raises(ValueError):
+        video_blender.schedule_jobs([], 0, 0)
+
+def test_parse_renditions():
+    assert video_blender.parse_renditions("1920x1080, 1280x720:libx264") == [(1920, 1080, None), (1280, 720, "libx264")]
+    assert video_blender.rendition_output("/v/out.mp4", 720) == "/v/out_720p.mp4"
+
+def test_renditions_split_once():
+    args = blend_args(renditions=[(1920, 1080, None), (1280, 720, None)])
+    filters, tail = video_blender.output_args(args, ["-map", "0:a?", "-c:a", "copy"])
+    assert filters == ["[final]split=2[s0][s1]", "[s0]scale=1920:1080[r0]", "[s1]scale=1280:720[r1]"]
+    assert tail == ["-map", "[r0]", "-map", "0:a?", "-c:a", "copy", "-c:v", "libx264", "-threads", "4", "-rc-lookahead", "32", "out_1080p.mp4",
+                    "-map", "[r1]", "-map", "0:a?", "-c:a", "copy", "-c:v", "libx264", "-threads", "4", "-rc-lookahead", "32", "out_720p.mp4"]
+
+def test_renditions_split_filtered_audio():
+    args = blend_args(renditions=[(1280, 720, None), (854, 480, None)])
+    filters, tail = video_blender.output_args(args, ["-map", "[aout]", "-c:a", "aac"])
+    assert "[aout]asplit=2[a0][a1]" in filters
+    assert tail.count("[a0]") == 1 and tail.count("[a1]") == 1 and "[aout]" not in tail
+
+def test_renditions_cpu_branch_on_gpu_frames():
+    args = blend_args(hwaccel="nvenc", renditions=[(1920, 1080, None), (1280, 720, "libx264")])
+    filters, tail = video_blender.output_args(args, [])
+    assert filters[1:] == ["[s0]scale_cuda=1920:1080[r0]", "[s1]scale_cuda=1280:720,hwdownload,format=nv12[r1]"]
+    assert tail[tail.index("[r0]") + 2] == "hevc_nvenc"
+    assert tail[tail.index("[r1]") + 2:tail.index("[r1]") + 5] == ["libx264", "-threads", "4"]
+
+def test_renditions_scaled_on_cpu_after_ass():
+    args = blend_args(srt=True, hwaccel="nvenc", renditions=[(1280, 720, None)])
+    cmd = video_blender.build_burn_in_command(args, "/tmp/sub.ass")
+    assert "[s0]scale=1280:720[r0]" in filter_graph(cmd).split(";")
+
+def test_renditions_outputs_tracked():
+    args = blend_args(renditions=[(1920, 1080, None), (1280, 720, None)])
+    assert video_blender.blend_outputs(args) == ["out_1080p.mp4", "out_720p.mp4"]
+    assert video_blender.is_output_video("/v/a_blended_720p.mp4")
+    assert not video_blender.is_output_video("/v/a_720p.mp4")
@@ -0,0 +1,104 @@
+import os
+import json
+import argparse
+
+import pytest
+
+import video_pipeline
+from job_queue import JobQueue
+from video_pipeline import Pipeline, VideoJob
+
+def test_video_job_paths(tmp_path):
+    video = tmp_path / "talk.mp4"
+    job = VideoJob(str(video), audio_format="wav", cover_dir=str(tmp_path / "covers"))
+    assert job.output("translate") == str(tmp_path / "talk_cn.srt")
+    assert job.output("tts") == str(tmp_path / "talk_cn.wav") and job.audio_suffix == "_cn.wav"
+    assert job.output("blend") == str(tmp_path / "talk_blended.mp4")
+    assert job.output("cover") == str(tmp_path / "covers" / "talk.jpg")
+    # 翻译输入优先使用原始字幕
+    assert job.source_srt == str(tmp_path / "talk_en.srt")
+    (tmp_path / "talk.srt").write_text("1\n", encoding="utf-8")
+    assert job.source_srt == str(tmp_path / "talk.srt")
+
+def test_list_videos(tmp_path):
+    for name in ("b.mp4", "a.mp4", "a_en.mp4", "a_blended.mp4", "a_blended_720p.mp4", "a.srt"):
+        (tmp_path / name).write_bytes(b"x")
+    assert video_pipeline.list_videos(str(tmp_path)) == [str(tmp_path / "a.mp4"), str(tmp_path / "b.mp4")]
+
+def test_parse_stages():
+    assert video_pipeline.parse_stages("tts, blend") == ["tts", "blend"]
+    with pytest.raises(argparse.ArgumentTypeError):
+        video_pipeline.parse_stages("tts,upload")
+
+def options(tmp_path, **overrides):
+    values = {"force": False, "status_interval": 3600, "status_file": str(tmp_path / "status.json"),
+              "audio_format": "m4a", "translate_args": [], "tts_args": [], "blend_args": [],
+              "cover_resize": False, "cover_min_size": (1920, 1080)}
+    values.update(overrides)
+    return argparse.Namespace(**values)
+
+@pytest.fixture
+def stage_runs(monkeypatch):
+    """替换各阶段的工具调用：写出阶段输出并记录调用；名称含 bad 的视频翻译失败"""
+    runs = []
+    def fake(stage):
+        def run(self, job):
+            runs.append((job.base, stage))
+            if stage == "translate" and "bad" in job.base:
+                raise RuntimeError("翻译服务不可用")
+            with open(job.output(stage), "w", encoding="utf-8") as f:
+                f.write(stage)
+        return run
+    for stage in video_pipeline.STAGES:
+        monkeypatch.setattr(Pipeline, f"run_{stage}", fake(stage))
+    return runs
+
+def make_jobs(tmp_path, names):
+    jobs = []
+    for name in names:
+        (tmp_path / f"{name}.mp4").write_bytes(b"video")
+        (tmp_path / f"{name}.srt").write_text("1\n", encoding="utf-8")
+        (tmp_path / f"{name}_en.srt").write_text("1\n", encoding="utf-8")
+        jobs.append(VideoJob(str(tmp_path / f"{name}.mp4")))
+    return jobs
+
+def test_pipeline_runs_chain_and_blocks_after_failure(tmp_path, stage_runs):
+    jobs = make_jobs(tmp_path, ["a", "b", "bad"])
+    limits = {"translate": 2, "tts": 1, "blend": 1, "cover": 2}
+    Pipeline(jobs, list(video_pipeline.STAGES), limits, options(tmp_path)).run()
+
+    status = {job.base: job.status for job in jobs}
+    assert status["a"] == status["b"] == {"translate": "done", "tts": "done", "blend": "done", "cover": "done"}
+    assert status["bad"] == {"translate": "failed", "tts": "blocked", "blend": "blocked", "cover": "done"}
+    # 同一视频的阶段按依赖顺序执行
+    for base in ("a", "b"):
+        chain = [stage for name, stage in stage_runs if name == base and stage != "cover"]
+        assert chain == ["translate", "tts", "blend"]
+    with open(tmp_path / "status.json", encoding="utf-8") as f:
+        written = json.load(f)
+    assert written["videos"][2]["errors"] == {"translate": "翻译服务不可用"}
+
+def test_pipeline_reports_skipped_and_missing_inputs(tmp_path, stage_runs, monkeypatch):
+    jobs = make_jobs(tmp_path, ["a", "b"])
+    (tmp_path / "a_cn.srt").write_text("translated", encoding="utf-8")
+    # 工具判断产物已是最新时不改写输出
+    monkeypatch.setattr(Pipeline, "run_tts", lambda self, job: stage_runs.append((job.base, "tts")))
+    Pipeline(jobs, ["tts"], {"tts": 1}, options(tmp_path)).run()
+    assert jobs[0].status["tts"] == "failed" and "未生成输出" in jobs[0].errors["tts"]
+    assert jobs[1].status["tts"] == "failed" and "缺少输入" in jobs[1].errors["tts"]
+
+    (tmp_path / "a_cn.m4a").write_bytes(b"audio")
+    Pipeline(jobs[:1], ["tts"], {"tts": 1}, options(tmp_path)).run()
+    assert jobs[0].status["tts"] == "skipped"
+
+def test_enqueue_stages(tmp_path, capsys):
+    db_path = str(tmp_path / "queue.sqlite")
+    videos = [str(tmp_path / "a.mp4"), str(tmp_path / "b.mp4")]
+    argv = ["-d", str(tmp_path), "--enqueue", db_path]
+    video_pipeline.enqueue_stages(db_path, videos, ["translate", "blend", "cover"], argv)
+    jobs = JobQueue(db_path).jobs()
+    assert [job["kind"] for job in jobs] == ["translate", "blend", "cover"] * 2
+    translate, blend, cover = jobs[:3]
+    assert json.loads(blend["depends_on"]) == [translate["id"]]
+    assert json.loads(cover["depends_on"]) == []
+    assert json.loads(translate["args"]) == ["-d", str(tmp_path), "--video", videos[0], "--stages", "translate"]
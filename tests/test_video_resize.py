@@ -0,0 +1,87 @@
+import subprocess
+
+import pytest
+
+import video_resize
+from video_resize import plan_resize
+
+@pytest.fixture
+def streams(monkeypatch):
+    """替换 ffprobe：streams(list) 设置探测到的流信息"""
+    def configure(result):
+        def probe(path):
+            if isinstance(result, Exception):
+                raise result
+            return result
+        monkeypatch.setattr(video_resize, "probe_streams", probe)
+    return configure
+
+def video(index=0, width=1920, height=1080, cover=False):
+    return {"index": index, "codec_type": "video", "width": width, "height": height,
+            "disposition": {"attached_pic": 1 if cover else 0}}
+
+def audio(index, codec):
+    return {"index": index, "codec_type": "audio", "codec_name": codec}
+
+def test_plan_copies_compatible_audio(streams, tmp_path):
+    streams([video(), audio(1, "aac"), audio(2, "ac3")])
+    plan = plan_resize("in.mp4", str(tmp_path / "out.mp4"), 1280, 720)
+    assert (plan["action"], plan["audio"], plan["video_index"]) == ("transcode", "copy", 0)
+    assert plan["reason"] == "1920x1080 -> 1280x720"
+
+def test_plan_reencodes_when_any_audio_incompatible(streams, tmp_path):
+    streams([video(), audio(1, "aac"), audio(2, "opus")])
+    assert plan_resize("in.mp4", str(tmp_path / "out.mp4"), 1280, 720)["audio"] == "aac"
+
+def test_plan_without_audio(streams, tmp_path):
+    streams([video()])
+    assert plan_resize("in.mp4", str(tmp_path / "out.mp4"), 1280, 720)["audio"] == "none"
+
+def test_plan_skips_cover_art(streams, tmp_path):
+    streams([video(0, 600, 600, cover=True), video(1), audio(2, "aac")])
+    assert plan_resize("in.mp4", str(tmp_path / "out.mp4"), 1280, 720)["video_index"] == 1
+
+@pytest.mark.parametrize("result, reason", [
+    ([video(0, 1280, 720)], "已是 1280x720"),
+    ([audio(0, "aac")], "没有视频流"),
+    ([video(0, 600, 600, cover=True)], "没有视频流"),
+    (subprocess.CalledProcessError(1, "ffprobe"), "无法读取流信息"),
+])
+def test_plan_skips(streams, tmp_path, result, reason):
+    streams(result)
+    plan = plan_resize("in.mp4", str(tmp_path / "out.mp4"), 1280, 720)
+    assert (plan["action"], plan["reason"]) == ("skip", reason)
+
+def test_plan_skips_existing_output(streams, tmp_path):
+    streams([video()])
+    output = tmp_path / "out.mp4"
+    output.write_bytes(b"x")
+    assert plan_resize("in.mp4", str(output), 1280, 720)["reason"] == "输出已存在"
+    assert plan_resize("in.mp4", str(output), 1280, 720, replace=True)["action"] == "transcode"
+
+def test_audio_codec_args():
+    assert video_resize.audio_codec_args("copy") == ["-c:a", "copy"]
+    assert video_resize.audio_codec_args("none") == ["-an"]
+    assert video_resize.audio_codec_args("aac") == ["-c:a", "aac"]
+
+def test_resize_maps_probed_video_stream(tmp_path, monkeypatch):
+    commands = []
+    def fake_run(command, **kwargs):
+        commands.append(command)
+        with open(command[-1], "wb") as f:
+            f.write(b"resized")
+    monkeypatch.setattr(video_resize.ffmpeg_runner, "run_ffmpeg", fake_run)
+    monkeypatch.setattr(video_resize, "probe_duration", lambda path: None)
+    source = tmp_path / "in.mp4"
+    source.write_bytes(b"source")
+
+    # 输出与输入相同时经临时文件替换
+    video_resize.resize_video(str(source), str(source), 1280, 720, audio="copy", video_index=1)
+    command = commands[0]
+    assert command[command.index("-map") + 1] == "0:1"
+    assert command[-3:-1] == ["-c:a", "copy"] and command[-1] != str(source)
+    assert source.read_bytes() == b"resized"
+    assert [p.name for p in tmp_path.iterdir()] == ["in.mp4"]
+
+    video_resize.resize_video(str(source), str(tmp_path / "out.mp4"), 1280, 720)
+    assert commands[1][commands[1].index("-map") + 1] == "0:v:0"
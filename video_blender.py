@@ -1,31 +1,353 @@
 import subprocess
 import argparse
 import os
+import sys
+import re
+import json
 import glob
+import time
+import tempfile
+import threading
 
-def combine_video_with_subtitles(args):
-    # 将字典转换为 argparse.Namespace 对象
-    args = argparse.Namespace(**args)
-    
+import pysrt
+
+import ffmpeg_runner
+from build_manifest import stale_reason, record_build
+from job_queue import enqueue_invocation
+from chunked_encode import plan_chunks, encode_in_chunks, concat_input, chunk_workers, probe_duration
+
+CPU_FALLBACK_CODEC = "libx264"
+
+def probe_video_size(video_path):
+    """用 ffprobe 读取第一个视频流的宽高"""
+    result = subprocess.run([
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=width,height",
+        "-of", "csv=p=0:s=x",
+        video_path
+    ], check=True, stdout=subprocess.PIPE, text=True)
+    width, height = result.stdout.strip().splitlines()[0].split("x")[:2]
+    return int(width), int(height)
+
+def ffmpeg_head(args):
+    """ffmpeg 全局参数：滤镜线程数按分配的线程预算设置；并行任务时只输出错误信息"""
+    threads = str(getattr(args, "threads", None) or os.cpu_count() or 1)
+    head = ["ffmpeg", "-y"]
+    if getattr(args, "quiet", False):
+        head += ["-hide_banner", "-loglevel", "error"]
+    return head + ["-filter_complex_threads", threads, "-filter_threads", threads]
+
+def encoder_args(args, codec=None):
+    """视频编码参数（codec 指定时覆盖默认编码器，用于多码率输出）"""
+    if args.hwaccel == "nvenc":
+        # --codec 已指定 NVENC 编码器（如 resize_blend --device nvenc 的 h264_nvenc）时沿用，否则默认 HEVC
+        codec = codec or (args.codec if (args.codec or "").endswith("_nvenc") else "hevc_nvenc")
+        return [
+            "-c:v", codec,  # 使用 NVIDIA 编码器
+            "-preset", "fast",  # 设置编码预设为 fast
+            "-tune", "hq",  # 调整编码参数以获得高质量输出
+            "-rc-lookahead", "32",  # 启用码率控制前瞻
+        ]
+    codec = codec or args.codec
+    if codec.endswith("_nvenc"):
+        # 调度到 CPU 槽的任务（或未启用 NVENC 时）不能使用 NVENC 编码器，改用 CPU 编码
+        codec = CPU_FALLBACK_CODEC
+    threads = str(getattr(args, "threads", None) or os.cpu_count() or 1)
+    return ["-c:v", codec, "-threads", threads, "-rc-lookahead", "32"]
+
+def parse_renditions(value):
+    """解析多码率输出列表 "宽x高[:编码器],..."，如 1920x1080,1280x720:libx264"""
+    renditions = []
+    for item in value.split(","):
+        size, _, codec = item.strip().partition(":")
+        width, height = map(int, size.split("x"))
+        renditions.append((width, height, codec or None))
+    return renditions
+
+def rendition_output(output, height):
+    base, ext = os.path.splitext(output)
+    return f"{base}_{height}p{ext}"
+
+def output_args(args, audio_args, gpu_frames=None):
+    """输出部分：返回 (追加滤镜, 输出参数)
+
+    指定多码率输出时，合成后的画面只 split 一次，每个分支单独缩放并编码到各自的文件，
+    解码与叠加只做一次。
+    gpu_frames 表示 [final] 是否为显存帧（默认与 --hwaccel nvenc 一致；ass 字幕渲染在CPU上，合成结果为系统内存帧）。
+    """
+    renditions = getattr(args, "renditions", None)
+    if not renditions:
+        return [], ["-map", "[final]", *audio_args, *encoder_args(args), args.output]
+
+    nvenc = args.hwaccel == "nvenc" if gpu_frames is None else gpu_frames
+    count = len(renditions)
+    filters = [f"[final]split={count}" + "".join(f"[s{i}]" for i in range(count))]
+    if "[aout]" in audio_args:
+        # 滤镜输出的音频只能映射一次，按输出数复制
+        filters.append(f"[aout]asplit={count}" + "".join(f"[a{i}]" for i in range(count)))
+    tail = []
+    for i, (width, height, codec) in enumerate(renditions):
+        chain = f"scale{'_cuda' if nvenc else ''}={width}:{height}"
+        encoder = encoder_args(args, codec)
+        if args.hwaccel == "nvenc" and codec and not codec.endswith("_nvenc"):
+            # CPU 编码的分支：使用 CPU 编码参数；GPU 合成时缩放后下载到系统内存
+            if nvenc:
+                chain += ",hwdownload,format=nv12"
+            encoder = encoder_args(argparse.Namespace(**{**vars(args), "hwaccel": None}), codec)
+        filters.append(f"[s{i}]{chain}[r{i}]")
+        rendition_audio = [f"[a{i}]" if arg == "[aout]" else arg for arg in audio_args]
+        tail += ["-map", f"[r{i}]", *rendition_audio, *encoder, rendition_output(args.output, height)]
+    return filters, tail
+
+def input_args(args):
+    """分段编码时每路视频输入前的定位参数（输入端 -ss/-to，所有输入同步截取同一时间段）"""
+    segment = getattr(args, "segment", None)
+    if not segment:
+        return []
+    start, end = segment
+    return ["-ss", f"{start:.3f}"] + (["-to", f"{end:.3f}"] if end is not None else [])
+
+def has_audio_stream(video_path):
+    result = subprocess.run([
+        "ffprobe", "-v", "error",
+        "-select_streams", "a",
+        "-show_entries", "stream=index",
+        "-of", "csv=p=0",
+        video_path
+    ], check=True, stdout=subprocess.PIPE, text=True)
+    return bool(result.stdout.strip())
+
+def audio_options(args, input_index, main_index=0):
+    """音频部分：返回 (额外输入, 音频滤镜, 输出参数)
+
+    未指定 TTS 音频时保留主视频原音轨；track 模式将 TTS 作为第二条音轨（原音轨直接复制），
+    duck 模式在 TTS 发声时压低原音并与 TTS 混为一条音轨。
+    分段编码的各段不含音频，音频在拼接时统一处理。
+    """
+    if getattr(args, "segment", None):
+        return [], [], ["-an"]
+    tts_audio = getattr(args, "tts_audio", None)
+    if not tts_audio:
+        return [], [], ["-map", f"{main_index}:a?", "-c:a", "copy"]
+
+    inputs = ["-i", tts_audio]
+    original = has_audio_stream(args.main_video)
+    if args.tts_mode == "duck" and original:
+        filters = [
+            f"[{input_index}:a]asplit=2[tts][sidechain]",
+            f"[{main_index}:a][sidechain]sidechaincompress=threshold={args.duck_threshold}:ratio={args.duck_ratio}:attack=20:release=400[ducked]",
+            "[ducked][tts]amix=inputs=2:duration=first:normalize=0[aout]",
+        ]
+        return inputs, filters, ["-map", "[aout]", "-c:a", "aac", "-b:a", "192k"]
+
+    output_args = ["-map", f"{main_index}:a?"] if original else []
+    output_args += ["-map", f"{input_index}:a", "-c:a", "copy"]
+    tts_stream = 1 if original else 0
+    output_args += [f"-metadata:s:a:{tts_stream}", f"language={args.tts_language}",
+                    f"-metadata:s:a:{tts_stream}", "title=TTS"]
+    return inputs, [], output_args
+
+def build_mux_command(args):
+    """只混入TTS音轨、不叠加字幕：视频流直接复制，不重新编码"""
+    inputs, filters, output_args = audio_options(args, 1)
+    ffmpeg_cmd = [*ffmpeg_head(args), "-i", args.main_video, *inputs]
+    if filters:
+        ffmpeg_cmd += ["-filter_complex", ";".join(filters)]
+    ffmpeg_cmd += ["-map", "0:v", "-c:v", "copy", *output_args, args.output]
+    return ffmpeg_cmd
+
+def parse_band(value):
+    """解析手动指定的字幕带 "y:h"（字幕视频原始像素坐标）"""
+    y, h = value.split(":")
+    return int(y), int(h)
+
+def detect_subtitle_band(video_path, padding=4, sample_fps=4):
+    """用 cropdetect 探测字幕视频中实际有内容（非黑）的水平带，返回 (y, h)
+
+    按固定帧率采样（fps 滤镜，默认每秒 4 帧）：只看关键帧时，落在两个关键帧之间的短字幕会被漏掉。
+    reset=0 使检测区域累积为所有采样帧的并集。未检测到内容时返回 None（按整帧叠加）。
+    """
+    result = ffmpeg_runner.run_ffmpeg([
+        "ffmpeg", "-hide_banner",
+        "-i", video_path,
+        "-an",
+        "-vf", f"fps={sample_fps},cropdetect=limit=24:round=2:reset=0",
+        "-f", "null", "-"
+    ], step="cropdetect", text=True, check=False)
+    matches = re.findall(r"crop=(\d+):(\d+):(\d+):(\d+)", result.stderr)
+    if not matches:
+        return None
+    _, h, _, y = map(int, matches[-1])
+    if h <= 0:
+        return None
+    _, height = probe_video_size(video_path)
+    top = max(0, y - padding) // 2 * 2
+    bottom = min(height, y + h + padding)
+    return top, (bottom - top) // 2 * 2
+
+def resolve_band_geometry(args):
+    """确定两路字幕视频的字幕带几何信息；--list_dir 下首个文件计算后所有文件复用"""
+    if getattr(args, "band_geometry", None):
+        return args.band_geometry
+    geometry = {}
+    for key, path, manual in (("band1", args.subtitle1, args.band1), ("band2", args.subtitle2, args.band2)):
+        width, height = probe_video_size(path)
+        band = parse_band(manual) if manual else detect_subtitle_band(path)
+        if band is None:
+            band = (0, height)
+        geometry[key] = {"y": band[0], "h": band[1], "width": width, "height": height}
+        print(f"字幕带 {key}: y={band[0]} h={band[1]}（原始尺寸 {width}x{height}）")
+    args.band_geometry = geometry
+    return geometry
+
+def build_band_overlay_command(args, geometry):
+    """只裁剪并叠加字幕所在的水平带，滤镜开销与字幕带面积成正比而不是整帧"""
+    target = tuple(map(int, args.size.split('x'))) if args.size else None
+    nvenc = args.hwaccel == "nvenc"
+
+    ffmpeg_cmd = ffmpeg_head(args)
+    if nvenc:
+        ffmpeg_cmd += ["-hwaccel", "cuda", "-hwaccel_output_format", "cuda", "-c:v", "h264_cuvid"]
+    ffmpeg_cmd += [*input_args(args), "-i", args.main_video]
+
+    filters = [f"[0:v]scale{'_cuda' if nvenc else ''}={target[0]}:{target[1]}[v0]" if target else "[0:v]null[v0]"]
+    positions = {}
+    for index, key in ((1, "band1"), (2, "band2")):
+        band = geometry[key]
+        # 主画面按 --size 非等比缩放到 宽x高，字幕带的垂直位置与高度按高度比例换算
+        factor = target[1] / band["height"] if target else 1
+        band_w = target[0] if target else band["width"]
+        band_h = round(band["h"] * factor) // 2 * 2
+        positions[key] = round(band["y"] * factor)
+        if nvenc:
+            # NVDEC 解码器直接裁剪（上x下x左x右），裁掉的区域不会进入显存帧
+            crop = f"{band['y']}x{band['height'] - band['y'] - band['h']}x0x0"
+            ffmpeg_cmd += ["-hwaccel", "cuda", "-hwaccel_output_format", "cuda", "-c:v", "h264_cuvid", "-crop", crop]
+            chain = f"scale_cuda={band_w}:{band_h}" if target else "null"
+        else:
+            chain = f"crop=iw:{band['h']}:0:{band['y']}"
+            if target:
+                chain += f",scale={band_w}:{band_h}"
+        ffmpeg_cmd += [*input_args(args), "-i", getattr(args, f"subtitle{index}")]
+        filters.append(f"[{index}:v]{chain}[b{index}]")
+
+    overlay = "overlay_cuda" if nvenc else "overlay"
+    filters.append(f"[v0][b1]{overlay}=x={args.sub1_x}:y={args.sub1_y + positions['band1']}[v1]")
+    filters.append(f"[v1][b2]{overlay}=x={args.sub2_x}:y={args.sub2_y + positions['band2']}[final]")
+
+    audio_inputs, audio_filters, audio_args = audio_options(args, 3)
+    output_filters, tail = output_args(args, audio_args)
+    ffmpeg_cmd += audio_inputs
+    ffmpeg_cmd += ["-filter_complex", ";".join(filters + audio_filters + output_filters), *tail]
+    return ffmpeg_cmd
+
+def escape_filter_value(value):
+    """滤镜参数值的两级转义（滤镜选项 + 滤镜图），用于文件路径等"""
+    value = re.sub(r"([\\':])", r"\\\1", value)
+    return re.sub(r"([\\'\[\],;])", r"\\\1", value)
+
+def ass_time(t):
+    """pysrt 时间 -> ASS 时间（H:MM:SS.cc）"""
+    centis = t.ordinal // 10
+    return f"{centis // 360000}:{centis // 6000 % 60:02d}:{centis // 100 % 60:02d}.{centis % 100:02d}"
+
+def ass_text(text):
+    text = re.sub(r"<[^>]+>", "", text.strip())  # 去掉 SRT 中的 <i> 等标签
+    return text.replace("{", "(").replace("}", ")").replace("\n", "\\N")
+
+def build_bilingual_ass(subtitle1, subtitle2, ass_path, width, height, args):
+    """将两份 SRT 合并为一个 ASS 脚本，两种样式分别对应字幕1/字幕2
+
+    PlayRes 与输出视频尺寸一致，边距和字号即为像素值。
+    """
+    styles = []
+    for name, margin, fontsize, color in (
+            ("Sub1", args.sub1_margin, args.sub1_fontsize or round(height / 27), args.sub1_color),
+            ("Sub2", args.sub2_margin, args.sub2_fontsize or round(height / 22), args.sub2_color)):
+        styles.append(
+            f"Style: {name},{args.font},{fontsize},{color},&H000000FF,&H00000000,&H80000000,"
+            f"0,0,0,0,100,100,0,0,1,{args.outline},0,2,20,20,{margin},1"
+        )
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {width}",
+        f"PlayResY: {height}",
+        "WrapStyle: 0",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+        "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+        "Alignment, MarginL, MarginR, MarginV, Encoding",
+        *styles,
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+    for style, path in (("Sub1", subtitle1), ("Sub2", subtitle2)):
+        for item in pysrt.open(path, encoding="utf-8"):
+            lines.append(f"Dialogue: 0,{ass_time(item.start)},{ass_time(item.end)},{style},,0,0,0,,{ass_text(item.text)}")
+    with open(ass_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+def build_burn_in_command(args, ass_path):
+    """单次滤镜直接渲染 SRT 字幕：只解码主视频一路，ass 滤镜在缩放后的画面上绘制双语字幕"""
+    filters = []
+    segment = getattr(args, "segment", None)
+    if segment:
+        # 分段输入的时间戳从 0 开始，渲染字幕前恢复原始时间，之后再归零
+        filters.append(f"setpts=PTS+{segment[0]:.3f}/TB")
+    if args.size:
+        filters.append(f"scale={args.size.replace('x', ':')}")
+    filters.append(f"ass={escape_filter_value(ass_path)}")
+    if segment:
+        filters.append("setpts=PTS-STARTPTS")
+
+    ffmpeg_cmd = ffmpeg_head(args)
+    if args.hwaccel == "nvenc":
+        # ass 滤镜在CPU上运行：GPU解码后帧回到系统内存，再交给 NVENC 编码
+        ffmpeg_cmd += ["-hwaccel", "cuda"]
+    audio_inputs, audio_filters, audio_args = audio_options(args, 1)
+    output_filters, tail = output_args(args, audio_args, gpu_frames=False)
+    ffmpeg_cmd += [
+        *input_args(args),
+        "-i", args.main_video,
+        *audio_inputs,
+        "-filter_complex", ";".join([f"[0:v]{','.join(filters)}[final]"] + audio_filters + output_filters),
+        *tail,
+    ]
+    return ffmpeg_cmd
+
+def build_overlay_command(args):
+    """整帧叠加预渲染的字幕视频"""
     # 新增size参数处理逻辑
     size = args.size.replace('x', ':') if args.size else None
 
+    # TTS 音轨作为第4路输入，与视频在同一次编码中写出
+    audio_inputs, audio_filters, audio_args = audio_options(args, 3)
+    output_filters, tail = output_args(args, audio_args)
+    audio_filter = "".join(f";{f}" for f in audio_filters + output_filters)
+
     # 根据 hwaccel 参数设置 FFmpeg 命令
     if args.hwaccel == "nvenc":
         ffmpeg_cmd = [
-            "ffmpeg", "-y", 
-            "-filter_complex_threads", "32",
-            "-filter_threads", "32",
+            *ffmpeg_head(args),
             "-hwaccel", "cuda",
             "-hwaccel_output_format", "cuda",
             "-c:v", "h264_cuvid",
+            *input_args(args),
             "-i", args.main_video,
             "-hwaccel", "cuda",
             "-hwaccel_output_format", "cuda",
+            *input_args(args),
             "-i", args.subtitle1,
             "-hwaccel", "cuda",
             "-hwaccel_output_format", "cuda",
+            *input_args(args),
             "-i", args.subtitle2,
+            *audio_inputs,
             "-filter_complex",
             # 添加缩放滤镜
             f"[0:v]scale_cuda={size}[v0];" 
@@ -33,23 +355,23 @@ def combine_video_with_subtitles(args):
             f"[2:v]scale_cuda={size}[v2];"
             f"[v0][v1]overlay_cuda=x={args.sub1_x}:y={args.sub1_y}[v1_combined];"
             f"[v1_combined][v2]overlay_cuda=x={args.sub2_x}:y={args.sub2_y}[final]"
+            + audio_filter
             if args.size else
             f"[0:v][1:v]overlay_cuda=x={args.sub1_x}:y={args.sub1_y}[v1];"
-            f"[v1][2:v]overlay_cuda=x={args.sub2_x}:y={args.sub2_y}[final]",
-            "-map", "[final]",
-            "-map", "0:a?",
-            "-c:v", "hevc_nvenc",  # 使用 NVIDIA HEVC 编码器
-            "-preset", "fast",  # 设置编码预设为 fast
-            "-tune", "hq",  # 调整编码参数以获得高质量输出
-            "-rc-lookahead", "32",  # 启用码率控制前瞻
-            args.output
+            f"[v1][2:v]overlay_cuda=x={args.sub2_x}:y={args.sub2_y}[final]"
+            + audio_filter,
+            *tail
         ]
     else:
         ffmpeg_cmd = [
-            "ffmpeg", "-y",
+            *ffmpeg_head(args),
+            *input_args(args),
             "-i", args.main_video,
+            *input_args(args),
             "-i", args.subtitle1,
+            *input_args(args),
             "-i", args.subtitle2,
+            *audio_inputs,
             "-filter_complex",
             # 添加缩放滤镜
             f"[0:v]scale={size}[v0];"
@@ -57,33 +379,330 @@ def combine_video_with_subtitles(args):
             f"[2:v]scale={size}[v2];"
             f"[v0][v1]overlay=x={args.sub1_x}:y={args.sub1_y}[v1_combined];"
             f"[v1_combined][v2]overlay=x={args.sub2_x}:y={args.sub2_y}[final]"
+            + audio_filter
             if args.size else
             f"[0:v][1:v]overlay=x={args.sub1_x}:y={args.sub1_y}[v1];"
-            f"[v1][2:v]overlay=x={args.sub2_x}:y={args.sub2_y}[final]",
-            "-map", "[final]",
-            "-map", "0:a?",
-            "-c:v", args.codec,
-            "-rc-lookahead", "32",  # 启用码率控制前瞻
-            args.output
+            f"[v1][2:v]overlay=x={args.sub2_x}:y={args.sub2_y}[final]"
+            + audio_filter,
+            *tail
         ]
+    return ffmpeg_cmd
+
+def combine_video_with_subtitles(args):
+    # 将字典转换为 argparse.Namespace 对象
+    if isinstance(args, dict):
+        args = argparse.Namespace(**args)
+
+    if getattr(args, "audio_only", False):
+        return run_ffmpeg(build_mux_command(args), args.output, step="mux", source=args.main_video)
+
+    ass_path = None
+    if args.srt:
+        # SRT 模式：生成临时 ASS 脚本，由 ass 滤镜在同一次编码中渲染
+        for f in (args.subtitle1, args.subtitle2):
+            if not os.path.exists(f):
+                print(f"\n❌ 合成失败: 字幕文件不存在 - {f}")
+                return False
+        if args.size:
+            width, height = map(int, args.size.split('x'))
+        else:
+            width, height = probe_video_size(args.main_video)
+        fd, ass_path = tempfile.mkstemp(suffix=".ass", prefix=".blend_", dir=os.path.dirname(os.path.abspath(args.output)))
+        os.close(fd)
+        build_bilingual_ass(args.subtitle1, args.subtitle2, ass_path, width, height, args)
+        build_command = lambda job: build_burn_in_command(job, ass_path)
+    elif args.crop_band or args.band1 or args.band2:
+        geometry = resolve_band_geometry(args)
+        build_command = lambda job: build_band_overlay_command(job, geometry)
+    else:
+        build_command = build_overlay_command
 
     try:
-        subprocess.run(ffmpeg_cmd, check=True)
+        if (getattr(args, "chunks", 0) or 0) > 1 and getattr(args, "renditions", None):
+            print("多码率输出不支持分段编码，忽略 --chunks")
+        elif (getattr(args, "chunks", 0) or 0) > 1:
+            return combine_in_chunks(args, build_command)
+        return run_ffmpeg(build_command(args), args.output, source=args.main_video)
+    finally:
+        if ass_path:
+            os.remove(ass_path)
+
+def combine_in_chunks(args, build_command):
+    """分段并行编码：各段只编码视频，拼接时复制视频流并统一处理音频"""
+    chunks = plan_chunks(args.main_video, args.chunks)
+    workers = chunk_workers(getattr(args, "chunk_workers", None))
+    threads = max(1, (getattr(args, "threads", None) or os.cpu_count() or 1) // min(len(chunks), workers))
+
+    def build_chunk_command(start, end, chunk_path):
+        job = argparse.Namespace(**vars(args))
+        job.segment = (start, end)
+        job.output = chunk_path
+        job.threads = threads
+        job.quiet = True
+        return build_command(job)
+
+    def build_concat_command(list_path, output_path):
+        audio_inputs, audio_filters, audio_args = audio_options(args, 2, main_index=1)
+        ffmpeg_cmd = [*ffmpeg_head(args), *concat_input(list_path), "-i", args.main_video, *audio_inputs]
+        if audio_filters:
+            ffmpeg_cmd += ["-filter_complex", ";".join(audio_filters)]
+        ffmpeg_cmd += ["-map", "0:v", "-c:v", "copy", *audio_args, output_path]
+        return ffmpeg_cmd
+
+    try:
+        encode_in_chunks(args.main_video, args.output, chunks, build_chunk_command, build_concat_command, workers)
         print(f"\n✅ 合成成功 -> {args.output}")
         return True
-    except subprocess.CalledProcessError as e:
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ffmpeg_runner.FfmpegCancelled) as e:
         print(f"\n❌ 合成失败: {e}")
         return False
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="视频字幕合成工具")
-    parser.add_argument("-m", "--main-video", required=False, help="主视频文件路径")
-    parser.add_argument("-s1", "--subtitle1", default="_en.mp4", help="第一个字幕文件路径（默认: 主文件名_en.mp4）")
-    parser.add_argument("-s2", "--subtitle2", default="_cn.mp4", help="第二个字幕文件路径（默认: 主文件名_cn.mp4）")
+def run_ffmpeg(ffmpeg_cmd, output, step="blend", source=None):
+    try:
+        ffmpeg_runner.run_ffmpeg(ffmpeg_cmd, step=step, source=source, output=output,
+                                 duration=probe_duration(source) if source else None)
+        print(f"\n✅ 合成成功 -> {output}")
+        return True
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ffmpeg_runner.FfmpegCancelled) as e:
+        print(f"\n❌ 合成失败: {e}")
+        return False
+
+# 影响合成结果的参数（构建清单用）；并行度、线程数、日志等不影响输出的参数不在其中
+BLEND_PARAM_KEYS = ("codec", "hwaccel", "size", "sub1_x", "sub1_y", "sub2_x", "sub2_y", "srt",
+                    "sub1_margin", "sub2_margin", "sub1_fontsize", "sub2_fontsize", "sub1_color", "sub2_color",
+                    "font", "outline", "crop_band", "band1", "band2", "tts_mode", "tts_language",
+                    "duck_threshold", "duck_ratio", "audio_only", "renditions")
+
+def blend_outputs(args):
+    if getattr(args, "renditions", None):
+        return [rendition_output(args.output, height) for _, height, _ in args.renditions]
+    return [args.output]
+
+def blend_inputs(args):
+    inputs = [args.main_video]
+    if not getattr(args, "audio_only", False):
+        inputs += [args.subtitle1, args.subtitle2]
+    return inputs + [getattr(args, "tts_audio", None)]
+
+def blend_params(args):
+    return {key: getattr(args, key, None) for key in BLEND_PARAM_KEYS}
+
+def blend_stale_reason(args):
+    """所有输出都为最新时返回 None，否则返回需要重新合成的原因"""
+    for output in blend_outputs(args):
+        reason = stale_reason(output, blend_inputs(args), blend_params(args))
+        if reason:
+            return reason
+    return None
+
+def record_blend(args):
+    for output in blend_outputs(args):
+        record_build(output, blend_inputs(args), blend_params(args))
+
+# 工具生成的视频后缀：字幕视频、合成输出、缩放输出、resize_blend 替换模式的临时输出
+OUTPUT_SUFFIXES = ("_en", "_cn", "_blended", "_resized")
+REPLACE_TEMP_SUFFIX = ".resize_blend_tmp"
+
+def is_output_video(path, suffixes=()):
+    """是否为工具生成的视频（含多码率输出 <名称><后缀>_<高>p.mp4），目录模式不把它们当作主视频
+
+    suffixes 为额外的输出后缀（如 resize_blend -s 指定的后缀）。
+    """
+    base = os.path.splitext(os.path.basename(path))[0]
+    known = "|".join(re.escape(suffix) for suffix in OUTPUT_SUFFIXES + tuple(s for s in suffixes if s))
+    return base.endswith(REPLACE_TEMP_SUFFIX) or re.search(rf"(?:{known})(?:_\d+p)?$", base) is not None
+
+def list_main_videos(args, directory, suffixes=()):
+    """目录中的主视频文件（排除字幕视频以及已合成、缩放、多码率输出的视频）"""
+    return [f for f in glob.glob(os.path.join(directory, '*.mp4'))
+            if not f.endswith((args.subtitle1, args.subtitle2)) and not is_output_video(f, suffixes)]
+
+def prepare_list_job(args, video_file, suffix="_blended"):
+    """为目录模式中的单个主视频构造处理参数；输出已存在或缺少输入时返回 None"""
+    # 创建一个新的字典来保存当前文件的处理参数
+    local_args = args.__dict__.copy()
+    
+    # 修改主视频文件路径
+    local_args['main_video'] = video_file
+    
+    # 构造字幕文件路径，去除主视频后缀
+    main_base = os.path.splitext(os.path.basename(video_file))[0]
+    if args.main_suffix:
+        main_base = main_base.replace(args.main_suffix, "")
+    main_dir = os.path.dirname(video_file)
+
+    local_args['subtitle1'] = os.path.join(main_dir, f"{main_base}{args.subtitle1}")
+    local_args['subtitle2'] = os.path.join(main_dir, f"{main_base}{args.subtitle2}")
+    if args.tts_audio:
+        local_args['tts_audio'] = os.path.join(main_dir, f"{main_base}{args.tts_audio}")
+        if not os.path.exists(local_args['tts_audio']):
+            print(f"跳过缺少TTS音频的文件: {video_file}")
+            return None
+
+    # 修改输出文件名构造逻辑，添加 _blended 后缀
+    base_name = os.path.basename(video_file)
+    base, ext = os.path.splitext(base_name)
+    output_filename = f"{base}{suffix}{ext}"
+    local_args['output'] = os.path.join(os.path.dirname(video_file), output_filename)
+
+    # 输出为最新（输入内容与合成参数均未变化，多码率输出时检查所有码率）时跳过
+    job = argparse.Namespace(**local_args)
+    reason = blend_stale_reason(job)
+    if reason is None:
+        print(f"跳过已是最新的文件: {job.output}")
+        return None
+    if os.path.exists(job.output):
+        print(f"重新合成（{reason}）: {job.output}")
+    return job
+
+def default_slots(hwaccel):
+    """默认并发槽位：CPU 编码每约 8 核一路（x264 单路超过该线程数后收益有限），NVENC 两路会话"""
+    cores = os.cpu_count() or 1
+    if hwaccel == "nvenc":
+        return 0, 2
+    return max(1, cores // 8), 0
+
+def resolve_slots(args):
+    cpu_slots, hw_slots = default_slots(args.hwaccel)
+    if args.cpu_slots is not None:
+        cpu_slots = args.cpu_slots
+    if args.hw_slots is not None:
+        hw_slots = args.hw_slots
+    return cpu_slots, hw_slots
+
+def share_band_geometry(args, jobs):
+    """字幕带几何信息只计算一次，所有文件复用"""
+    if jobs and not args.srt and (args.crop_band or args.band1 or args.band2):
+        args.band_geometry = resolve_band_geometry(jobs[0])
+        for job in jobs:
+            job.band_geometry = args.band_geometry
+
+def schedule_jobs(jobs, cpu_slots, hw_slots, summary_path=None):
+    """并行执行合成任务：CPU 编码槽和硬件编码槽分别限流，大文件优先，结束后输出吞吐统计
+
+    每个槽位一个工作线程，从按文件大小降序排列的队列中取任务；
+    线程预算按核心数平均分配给所有槽位。
+    """
+    total_slots = cpu_slots + hw_slots
+    if total_slots < 1:
+        raise ValueError("cpu_slots 与 hw_slots 至少需要一个大于 0")
+    threads = max(1, (os.cpu_count() or 1) // total_slots)
+    pending = sorted(jobs, key=lambda job: os.path.getsize(job.main_video), reverse=True)
+    lock = threading.Lock()
+    results = []
+
+    def worker(slot_kind):
+        while True:
+            with lock:
+                if not pending:
+                    return
+                job = pending.pop(0)
+            job.hwaccel = slot_kind
+            job.threads = threads
+            job.quiet = total_slots > 1
+            print(f"正在处理文件: {job.main_video}（{'NVENC' if slot_kind == 'nvenc' else 'CPU'} 槽，{threads} 线程）")
+            start = time.monotonic()
+            ok = combine_video_with_subtitles(job)
+            if ok:
+                record_blend(job)
+            elapsed = time.monotonic() - start
+            duration = probe_duration(job.main_video)
+            size_mb = os.path.getsize(job.main_video) / (1024 * 1024)
+            with lock:
+                results.append({
+                    "file": os.path.basename(job.main_video),
+                    "output": job.output,
+                    "slot": "nvenc" if slot_kind == "nvenc" else "cpu",
+                    "ok": bool(ok),
+                    "seconds": round(elapsed, 2),
+                    "size_mb": round(size_mb, 1),
+                    "speed": round(duration / elapsed, 2) if duration and elapsed > 0 else None,
+                    "mb_per_second": round(size_mb / elapsed, 2) if elapsed > 0 else None,
+                })
+                print(f"已处理 {len(results)}/{len(jobs)} 个文件")
+
+    slot_kinds = ["nvenc"] * hw_slots + [None] * cpu_slots
+    workers = [threading.Thread(target=worker, args=(kind,)) for kind in slot_kinds]
+    wall_start = time.monotonic()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    wall = time.monotonic() - wall_start
+
+    print(f"\n{'文件':<40} {'槽位':<6} {'耗时(秒)':>9} {'倍速':>6} {'MB/s':>7}")
+    for item in results:
+        speed = f"{item['speed']:.2f}x" if item['speed'] else "-"
+        rate = f"{item['mb_per_second']:.1f}" if item['mb_per_second'] is not None else "-"
+        status = "" if item['ok'] else " ❌"
+        print(f"{item['file']:<40} {item['slot']:<6} {item['seconds']:>9.1f} {speed:>6} {rate:>7}{status}")
+    print(f"总耗时 {wall:.1f} 秒，成功 {sum(1 for item in results if item['ok'])}/{len(results)} 个文件")
+
+    if summary_path:
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump({"wall_seconds": round(wall, 2), "cpu_slots": cpu_slots, "hw_slots": hw_slots,
+                       "threads_per_job": threads, "files": results}, f, ensure_ascii=False, indent=2)
+    return results
+
+def add_blend_arguments(parser):
+    """字幕合成相关参数（video_blender 与 resize_blend 共用）"""
+    parser.add_argument("-s1", "--subtitle1", default=None, help="第一个字幕文件后缀（默认: _en.mp4，--srt 模式下为 _en.srt）")
+    parser.add_argument("-s2", "--subtitle2", default=None, help="第二个字幕文件后缀（默认: _cn.mp4，--srt 模式下为 _cn.srt）")
     parser.add_argument("--sub1-x", type=int, default=0, help="字幕1 X轴偏移 (默认: 0)")
     parser.add_argument("--sub1-y", type=int, default=-10, help="字幕1 Y轴偏移 (默认: -10)")
     parser.add_argument("--sub2-x", type=int, default=0, help="字幕2 X轴偏移 (默认: 0)")
     parser.add_argument("--sub2-y", type=int, default=-65, help="字幕2 Y轴偏移 (默认: -65)")
+    # 新增 --main-suffix 参数
+    parser.add_argument("--main-suffix", default="", help="主视频文件后缀（默认为空）")
+    # 新增 SRT 直接渲染模式，替代预渲染字幕视频叠加
+    parser.add_argument("--srt", action="store_true", help="直接从 _en.srt/_cn.srt 渲染字幕（单路解码，不需要预渲染字幕视频）")
+    parser.add_argument("--sub1-margin", type=int, default=10, help="--srt 模式下字幕1 距底部像素 (默认: 10)")
+    parser.add_argument("--sub2-margin", type=int, default=65, help="--srt 模式下字幕2 距底部像素 (默认: 65)")
+    parser.add_argument("--sub1-fontsize", type=int, default=None, help="--srt 模式下字幕1 字号（默认: 视频高度/27）")
+    parser.add_argument("--sub2-fontsize", type=int, default=None, help="--srt 模式下字幕2 字号（默认: 视频高度/22）")
+    parser.add_argument("--sub1-color", default="&H00FFFFFF", help="--srt 模式下字幕1 颜色，ASS格式 &HAABBGGRR (默认: 白色)")
+    parser.add_argument("--sub2-color", default="&H0000FFFF", help="--srt 模式下字幕2 颜色，ASS格式 &HAABBGGRR (默认: 黄色)")
+    parser.add_argument("--font", default="Noto Sans CJK SC", help="--srt 模式下字幕字体 (默认: Noto Sans CJK SC)")
+    parser.add_argument("--outline", type=int, default=2, help="--srt 模式下字幕描边宽度 (默认: 2)")
+    # 新增字幕带裁剪叠加，只处理字幕所在的水平带
+    parser.add_argument("--crop-band", action="store_true", help="自动探测字幕视频中的字幕带，仅裁剪叠加该区域")
+    parser.add_argument("--band1", default=None, help="手动指定字幕1 所在水平带 y:h（字幕视频原始像素，如 980:100）")
+    parser.add_argument("--band2", default=None, help="手动指定字幕2 所在水平带 y:h（字幕视频原始像素）")
+    # 新增 TTS 音轨混入，与字幕合成同一次编码完成
+    parser.add_argument("--tts-audio", default=None, help="TTS 音频文件后缀（如 _cn.m4a，由 srt_tts.py 生成），默认不混入")
+    parser.add_argument("--tts-mode", default="track", choices=["track", "duck"],
+                        help="track: 作为额外音轨；duck: TTS 发声时压低原音并混为一条音轨（默认: track）")
+    parser.add_argument("--tts-language", default="chi", help="TTS 音轨语言标记（默认: chi）")
+    parser.add_argument("--duck-threshold", type=float, default=0.05, help="duck 模式压低原音的触发阈值（默认: 0.05）")
+    parser.add_argument("--duck-ratio", type=float, default=8, help="duck 模式压缩比（默认: 8）")
+    parser.add_argument("--audio-only", action="store_true", help="只混入 TTS 音轨，不叠加字幕，视频流直接复制")
+    # 新增目录模式并行调度
+    parser.add_argument("--cpu-slots", type=int, default=None, help="--list_dir 并行 CPU 编码任务数（默认: 核心数/8，nvenc 模式为 0）")
+    parser.add_argument("--hw-slots", type=int, default=None, help="--list_dir 并行 NVENC 编码会话数（默认: nvenc 模式为 2）")
+    parser.add_argument("--threads", type=int, default=None, help="单个任务的线程数（默认: 单文件为核心数，目录模式按槽位平均分配）")
+    parser.add_argument("--summary", default=None, help="--list_dir 吞吐统计输出路径（默认: 目录下 blend_summary.json）")
+    # 新增分段并行编码
+    parser.add_argument("--chunks", type=int, default=0, help="按关键帧切分为 N 段并行编码后无损拼接（默认: 0 不分段）")
+    parser.add_argument("--chunk-workers", type=int, default=None, help="分段编码并行进程数（默认: 核心数）")
+    # 新增多码率输出，一次解码与叠加输出多个分辨率
+    parser.add_argument("--renditions", type=parse_renditions, default=None,
+                        help="多码率输出，格式: 宽x高[:编码器],...（如 1920x1080,1280x720,854x480），输出文件名追加 _<高>p")
+    # 新增 ffmpeg 运行指标
+    parser.add_argument("--metrics-log", default=None, help="ffmpeg 运行指标日志路径（JSON Lines，记录耗时、CPU、内存、fps）")
+    parser.add_argument("--ffmpeg-timeout", type=float, default=None, help="单次 ffmpeg 调用超时（秒，默认: 不限制）")
+    # 新增任务队列
+    parser.add_argument("--enqueue", default=None, help="只把任务写入指定的队列数据库，由 job_queue.py --worker 执行（目录模式按视频拆分）")
+
+def resolve_subtitle_suffixes(args):
+    """按模式补全字幕文件后缀默认值"""
+    if args.subtitle1 is None:
+        args.subtitle1 = "_en.srt" if args.srt else "_en.mp4"
+    if args.subtitle2 is None:
+        args.subtitle2 = "_cn.srt" if args.srt else "_cn.mp4"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="视频字幕合成工具")
+    parser.add_argument("-m", "--main-video", required=False, help="主视频文件路径")
     parser.add_argument("-o", "--output", default=None, help="输出文件路径 (默认: 主文件名+_blended.mp4)")
     # 新增 --codec 参数
     parser.add_argument("--codec", default="libx264", help="输出视频编码器（默认: libx264）")
@@ -91,58 +710,44 @@ if __name__ == "__main__":
     parser.add_argument("--list_dir", action='store_true', help="处理指定目录下的所有主视频文件")
     # 新增 --hwaccel 参数
     parser.add_argument("--hwaccel", default=None, choices=["None", "nvenc"], help="硬件加速选项，默认为None（CPU编码），可选nvenc（NVIDIA硬件加速）")
-    # 新增 --main-suffix 参数
-    parser.add_argument("--main-suffix", default="", help="主视频文件后缀（默认为空）")
     # 新增 --size 参数
     parser.add_argument("--size", default=None, help="强制调整所有视频尺寸（格式: 宽x高，如1920x1080）")
+    add_blend_arguments(parser)
 
     args = parser.parse_args()
 
+    resolve_subtitle_suffixes(args)
+    ffmpeg_runner.configure(args.metrics_log, args.ffmpeg_timeout)
+
+    # 只入队：目录模式每个主视频一个任务，输出路径与目录模式一致
+    if args.enqueue:
+        if not args.list_dir:
+            enqueue_invocation(args.enqueue, "blend", __file__, sys.argv[1:])
+            exit(0)
+        for video_file in list_main_videos(args, args.main_video):
+            base, ext = os.path.splitext(os.path.basename(video_file))
+            output = os.path.join(os.path.dirname(video_file), f"{base}_blended{ext}")
+            enqueue_invocation(args.enqueue, "blend", __file__, sys.argv[1:], remove=("--list_dir",),
+                               extra=["-m", os.path.abspath(video_file), "-o", os.path.abspath(output)])
+        exit(0)
+
     # 处理目录模式
     if args.list_dir:
-        # 获取目录下所有主视频文件（排除以 _en.mp4 或 _cn.mp4 结尾的文件）
-        video_files = [f for f in glob.glob(os.path.join(args.main_video, '*.mp4')) 
-                       if not (f.endswith(args.subtitle1) or f.endswith(args.subtitle2))]
+        # 获取目录下所有主视频文件（排除字幕视频以及已合成的 _blended.mp4）
+        video_files = list_main_videos(args, args.main_video)
         
         if not video_files:
             print(f"目录中未找到符合条件的主视频文件: {args.main_video}")
             exit(1)
 
-        total_files = len(video_files)
-        processed_files = 0
-
-        for video_file in video_files:
-            # 创建一个新的字典来保存当前文件的处理参数
-            local_args = args.__dict__.copy()
-            
-            # 修改主视频文件路径
-            local_args['main_video'] = video_file
-            
-            # 构造字幕文件路径，去除主视频后缀
-            main_base = os.path.splitext(os.path.basename(video_file))[0]
-            if args.main_suffix:
-                main_base = main_base.replace(args.main_suffix, "")
-            main_dir = os.path.dirname(video_file)
-            ext = os.path.splitext(video_file)[1]
-
-            local_args['subtitle1'] = os.path.join(main_dir, f"{main_base}{args.subtitle1}")
-            local_args['subtitle2'] = os.path.join(main_dir, f"{main_base}{args.subtitle2}")
-
-            # 修改输出文件名构造逻辑，添加 _blended 后缀
-            base_name = os.path.basename(video_file)
-            base, ext = os.path.splitext(base_name)
-            output_filename = f"{base}_blended{ext}"
-            local_args['output'] = os.path.join(os.path.dirname(video_file), output_filename)
-
-            # 检查输出文件是否已存在
-            if os.path.exists(local_args['output']):
-                print(f"跳过已存在的文件: {local_args['output']}")
-                continue
-
-            print(f"正在处理文件: {video_file}")
-            combine_video_with_subtitles(local_args)  # 使用 local_args 调用函数
-            processed_files += 1
-            print(f"已处理 {processed_files}/{total_files} 个文件")
+        jobs = [job for job in (prepare_list_job(args, video_file) for video_file in video_files) if job]
+        if not jobs:
+            exit(0)
+
+        share_band_geometry(args, jobs)
+        cpu_slots, hw_slots = resolve_slots(args)
+        summary_path = args.summary or os.path.join(args.main_video, "blend_summary.json")
+        schedule_jobs(jobs, cpu_slots, hw_slots, summary_path)
 
     else:
         # 自动生成字幕文件路径，去除主视频后缀
@@ -154,21 +759,32 @@ if __name__ == "__main__":
         
         args.subtitle1 = os.path.join(main_dir, f"{main_base}{args.subtitle1}")
         args.subtitle2 = os.path.join(main_dir, f"{main_base}{args.subtitle2}")
+        if args.tts_audio:
+            args.tts_audio = os.path.join(main_dir, f"{main_base}{args.tts_audio}")
 
         # 生成输出路径
         if args.output is None:
             output_dir = os.path.dirname(args.main_video)
             args.output = os.path.join(output_dir, f"{main_base}_blended.mp4")
 
-        # 检查输出文件是否已存在
-        if os.path.exists(args.output):
-            print(f"跳过已存在的文件: {args.output}")
+        # 检查输出文件是否已是最新
+        reason = blend_stale_reason(args)
+        if reason is None:
+            print(f"跳过已是最新的文件: {args.output}")
             exit(0)
+        if os.path.exists(args.output):
+            print(f"重新合成（{reason}）: {args.output}")
 
         # 验证文件存在
-        for f in [args.main_video, args.subtitle1, args.subtitle2]:
+        required = [args.main_video] if args.audio_only else [args.main_video, args.subtitle1, args.subtitle2]
+        if args.tts_audio:
+            required.append(args.tts_audio)
+        for f in required:
             if not os.path.exists(f):
                 print(f"错误：文件不存在 - {f}")
                 exit(1)
 
-        combine_video_with_subtitles(args)
+        if combine_video_with_subtitles(args):
+            record_blend(args)
+        else:
+            exit(1)
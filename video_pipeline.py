@@ -0,0 +1,332 @@
+# 单视频流水线编排：
+# 1. 每个视频是一个小的依赖图：translate（翻译字幕）→ tts（配音）→ blend（字幕与配音合成），cover（封面提取）独立运行
+# 2. 每个阶段有独立的工作线程数限制，阶段之间通过队列衔接：
+#    第 N+1 个视频翻译时，第 N 个视频在配音，第 N-1 个视频在编码，LLM、TTS 服务和编码器同时工作
+# 3. 各阶段调用现有命令行工具（srt_translator.py / srt_tts.py / video_blender.py），输出写入每个视频的阶段日志；
+#    封面在进程内调用 cover_extractor.extract_cover()
+# 4. 各工具按构建清单（build_manifest.py）判断产物是否过期：只重建输入内容或参数变化的阶段，
+#    例如修改一个视频的译文只会重新配音、重新合成该视频；某阶段失败时，该视频的后续阶段标记为 blocked
+# 5. 运行期间定期打印所有视频的阶段状态，并把状态写入 JSON 文件，便于在其他终端查看
+# 6. --enqueue 时不在本机执行，而是把每个视频的每个阶段作为带依赖的任务写入 job_queue 队列，由多台主机上的 worker 执行
+#
+# 文件命名约定（与各工具一致）：
+#   <名称>.mp4 + <名称>.srt（或 <名称>_en.srt）
+#   -> <名称>_en.srt / <名称>_cn.srt -> <名称>_cn.<音频格式> -> <名称>_blended.mp4，封面 <名称>.jpg
+
+import os
+import sys
+import glob
+import json
+import time
+import queue
+import shlex
+import argparse
+import datetime
+import subprocess
+import threading
+
+import ffmpeg_runner
+from build_manifest import stale_reason, record_build, invalidate, copy_artifact
+from cover_extractor import extract_cover
+from job_queue import JobQueue, strip_enqueue
+from video_blender import is_output_video
+
+STAGES = ("translate", "tts", "blend", "cover")
+CHAIN = ("translate", "tts", "blend")
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class VideoJob:
+    def __init__(self, video_path, audio_format="m4a", cover_dir=None):
+        self.video = video_path
+        self.directory = os.path.dirname(os.path.abspath(video_path))
+        self.base = os.path.splitext(os.path.basename(video_path))[0]
+        self.en_srt = self.path("_en.srt")
+        self.cn_srt = self.path("_cn.srt")
+        self.audio = self.path(f"_cn.{audio_format}")
+        self.audio_suffix = f"_cn.{audio_format}"
+        self.blended = self.path("_blended.mp4")
+        self.cover = os.path.join(cover_dir or self.directory, f"{self.base}.jpg")
+        self.status = {stage: "pending" for stage in STAGES}
+        self.seconds = {}
+        self.errors = {}
+
+    def path(self, suffix):
+        return os.path.join(self.directory, f"{self.base}{suffix}")
+
+    @property
+    def source_srt(self):
+        """翻译输入：优先原始 <名称>.srt，其次已备份的 <名称>_en.srt"""
+        original = self.path(".srt")
+        return original if os.path.exists(original) else self.en_srt
+
+    def output(self, stage):
+        return {"translate": self.cn_srt, "tts": self.audio, "blend": self.blended, "cover": self.cover}[stage]
+
+def list_videos(directory, exclude_suffixes=()):
+    """目录中的主视频（与 video_blender 目录模式相同的排除规则：字幕视频、合成/缩放/多码率输出、临时文件）"""
+    return sorted(f for f in glob.glob(os.path.join(directory, "*.mp4")) if not is_output_video(f, exclude_suffixes))
+
+class Pipeline:
+    def __init__(self, jobs, stages, limits, options):
+        self.jobs = jobs
+        self.stages = [stage for stage in STAGES if stage in stages]
+        self.limits = limits
+        self.options = options
+        self.queues = {stage: queue.Queue() for stage in self.stages}
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.start = None
+
+    def next_stage(self, stage):
+        chain = [s for s in CHAIN if s in self.stages]
+        position = chain.index(stage)
+        return chain[position + 1] if position + 1 < len(chain) else None
+
+    def run(self):
+        self.start = time.monotonic()
+        chain = [stage for stage in CHAIN if stage in self.stages]
+        threads = {stage: [threading.Thread(target=self.worker, args=(stage,), daemon=True)
+                           for _ in range(max(1, self.limits[stage]))] for stage in self.stages}
+        for stage_threads in threads.values():
+            for thread in stage_threads:
+                thread.start()
+        reporter = threading.Thread(target=self.report_loop, daemon=True)
+        reporter.start()
+
+        # 链首阶段与封面阶段的任务一次性入队；后续阶段由上游完成时入队
+        for stage in ([chain[0]] if chain else []) + (["cover"] if "cover" in self.stages else []):
+            for job in self.jobs:
+                self.queues[stage].put(job)
+            self.stop_stage(stage)
+        try:
+            for stage in chain:
+                for thread in threads[stage]:
+                    thread.join()
+                following = self.next_stage(stage)
+                if following:
+                    self.stop_stage(following)
+            for thread in threads.get("cover", []):
+                thread.join()
+        finally:
+            self.done.set()
+            reporter.join()
+            self.print_status()
+            self.write_status()
+        return self.jobs
+
+    def stop_stage(self, stage):
+        for _ in range(max(1, self.limits[stage])):
+            self.queues[stage].put(None)
+
+    def worker(self, stage):
+        while True:
+            job = self.queues[stage].get()
+            if job is None:
+                return
+            ok = self.run_stage(stage, job)
+            following = self.next_stage(stage) if stage != "cover" else None
+            if ok and following:
+                self.queues[following].put(job)
+            elif not ok and following:
+                with self.lock:
+                    while following:
+                        job.status[following] = "blocked"
+                        following = self.next_stage(following)
+                self.write_status()
+
+    def set_status(self, job, stage, status, seconds=None, error=None):
+        with self.lock:
+            job.status[stage] = status
+            if seconds is not None:
+                job.seconds[stage] = round(seconds, 1)
+            if error:
+                job.errors[stage] = error
+            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            elapsed = f"（{seconds:.1f} 秒）" if seconds is not None else ""
+            print(f"[{__name__}] [{current_time}] >> {job.base} {stage}: {status}{elapsed}{f' - {error}' if error else ''}")
+        self.write_status()
+
+    def run_stage(self, stage, job):
+        missing = [path for path in self.stage_inputs(stage, job) if not os.path.exists(path)]
+        if missing:
+            self.set_status(job, stage, "failed", error=f"缺少输入 {', '.join(os.path.basename(p) for p in missing)}")
+            return False
+
+        output = job.output(stage)
+        if self.options.force and os.path.exists(output):
+            invalidate(output)
+        before = self.output_stamp(output)
+        self.set_status(job, stage, "running")
+        start = time.monotonic()
+        try:
+            getattr(self, f"run_{stage}")(job)
+            if not os.path.exists(output):
+                raise RuntimeError(f"未生成输出 {os.path.basename(output)}，详见日志 {self.log_path(job, stage)}")
+        except Exception as e:
+            self.set_status(job, stage, "failed", time.monotonic() - start, str(e))
+            return False
+        # 工具判断产物已是最新而未重建时，输出文件不变
+        status = "skipped" if before and self.output_stamp(output) == before else "done"
+        self.set_status(job, stage, status, time.monotonic() - start)
+        return True
+
+    @staticmethod
+    def output_stamp(path):
+        try:
+            stat = os.stat(path)
+            return stat.st_size, stat.st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def stage_inputs(self, stage, job):
+        if stage == "translate":
+            return [job.source_srt]
+        if stage == "tts":
+            return [job.cn_srt]
+        if stage == "blend":
+            return [job.video, job.en_srt, job.cn_srt] + ([job.audio] if "tts" in self.stages else [])
+        return [job.video]
+
+    def log_path(self, job, stage):
+        log_dir = os.path.join(job.directory, ".pipeline_logs")
+        os.makedirs(log_dir, exist_ok=True)
+        return os.path.join(log_dir, f"{job.base}.{stage}.log")
+
+    def run_tool(self, job, stage, command):
+        with open(self.log_path(job, stage), "w", encoding="utf-8") as log:
+            result = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+        if result.returncode != 0:
+            raise RuntimeError(f"退出码 {result.returncode}，详见日志 {self.log_path(job, stage)}")
+
+    def run_translate(self, job):
+        source = job.source_srt
+        if source != job.en_srt:
+            copy_artifact(source, job.en_srt)  # 与 srt_translator --list_dir 一致，原始字幕备份随原文内容更新
+        self.run_tool(job, "translate", [sys.executable, os.path.join(SCRIPT_DIR, "srt_translator.py"),
+                                         "-i", source, "-o", job.cn_srt, *self.options.translate_args])
+
+    def run_tts(self, job):
+        self.run_tool(job, "tts", [sys.executable, os.path.join(SCRIPT_DIR, "srt_tts.py"),
+                                   "--srt_file", job.cn_srt, "-o", job.directory,
+                                   "--audio_format", self.options.audio_format, *self.options.tts_args])
+
+    def run_blend(self, job):
+        command = [sys.executable, os.path.join(SCRIPT_DIR, "video_blender.py"), "-m", job.video, "--srt"]
+        if os.path.exists(job.audio):
+            command += ["--tts-audio", job.audio_suffix]
+        self.run_tool(job, "blend", command + self.options.blend_args)
+
+    def run_cover(self, job):
+        params = {"resize": self.options.cover_resize, "min_size": self.options.cover_min_size}
+        if stale_reason(job.cover, [job.video], params) is None:
+            return
+        os.makedirs(os.path.dirname(job.cover), exist_ok=True)
+        if not extract_cover(job.video, job.cover, detect_map=True, resize=self.options.cover_resize,
+                             min_size=self.options.cover_min_size):
+            raise RuntimeError("封面提取失败")
+        record_build(job.cover, [job.video], params)
+
+    def report_loop(self):
+        while not self.done.wait(self.options.status_interval):
+            self.print_status()
+
+    def print_status(self):
+        with self.lock:
+            rows = [(job.base, dict(job.status)) for job in self.jobs]
+        counts = {}
+        for _, status in rows:
+            for stage in self.stages:
+                counts[status[stage]] = counts.get(status[stage], 0) + 1
+        elapsed = time.monotonic() - self.start
+        print(f"\n流水线状态（已运行 {elapsed:.0f} 秒）：" + "，".join(f"{k} {v}" for k, v in sorted(counts.items())))
+        print(f"{'视频':<40}" + "".join(f"{stage:<11}" for stage in self.stages))
+        for base, status in rows:
+            print(f"{base[:39]:<40}" + "".join(f"{status[stage]:<11}" for stage in self.stages))
+
+    def write_status(self):
+        with self.lock:
+            data = {
+                "updated": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "stages": self.stages,
+                "limits": {stage: self.limits[stage] for stage in self.stages},
+                "videos": [{"video": job.video, "status": dict(job.status), "seconds": dict(job.seconds),
+                            "errors": dict(job.errors)} for job in self.jobs],
+            }
+            temp_path = self.options.status_file + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.options.status_file)
+
+def enqueue_stages(db_path, videos, stages, argv):
+    """每个视频的每个阶段一个任务：tts 依赖 translate，blend 依赖 tts，cover 无依赖"""
+    queue = JobQueue(db_path)
+    base_args = strip_enqueue(argv)
+    for video in videos:
+        previous = None
+        for stage in [stage for stage in STAGES if stage in stages]:
+            depends_on = [previous] if previous and stage in CHAIN else []
+            job_id = queue.enqueue(stage, os.path.abspath(__file__),
+                                   base_args + ["--video", os.path.abspath(video), "--stages", stage],
+                                   depends_on=depends_on)
+            if stage in CHAIN:
+                previous = job_id
+            print(f"已加入队列 #{job_id} [{stage}] {os.path.basename(video)}"
+                  f"{f'（依赖 #{depends_on[0]}）' if depends_on else ''}")
+
+def parse_stages(value):
+    stages = [stage.strip() for stage in value.split(",") if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"未知阶段: {', '.join(unknown)}（可选: {', '.join(STAGES)}）")
+    return stages
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="按视频编排 翻译 → 配音 → 合成（及封面提取）流水线，各阶段并行重叠执行")
+    parser.add_argument("-d", "--directory", required=True, help="包含主视频与原始字幕的目录")
+    parser.add_argument("--stages", type=parse_stages, default=list(STAGES), help="执行的阶段，逗号分隔（默认: translate,tts,blend,cover）")
+    parser.add_argument("--translate-workers", type=int, default=1, help="同时翻译的视频数（默认: 1）")
+    parser.add_argument("--tts-workers", type=int, default=1, help="同时配音的视频数（默认: 1）")
+    parser.add_argument("--blend-workers", type=int, default=1, help="同时合成的视频数（默认: 1）")
+    parser.add_argument("--cover-workers", type=int, default=2, help="同时提取封面的视频数（默认: 2）")
+    parser.add_argument("--translate-args", type=shlex.split, default=[], help="传给 srt_translator.py 的额外参数（如 \"--api_vendor deepseek\"）")
+    parser.add_argument("--tts-args", type=shlex.split, default=[], help="传给 srt_tts.py 的额外参数（如 \"--clone_role 角色名\"）")
+    parser.add_argument("--blend-args", type=shlex.split, default=[], help="传给 video_blender.py 的额外参数（如 \"--hwaccel nvenc\"）")
+    parser.add_argument("--audio_format", default="m4a", help="配音音频格式（默认: m4a）")
+    parser.add_argument("--cover-dir", default=None, help="封面输出目录（默认: 视频所在目录）")
+    parser.add_argument("--cover-resize", action="store_true", help="封面小于最小尺寸时放大")
+    parser.add_argument("--cover-min-size", default="1920x1080", help="封面最小尺寸（格式: 宽x高，默认: 1920x1080）")
+    parser.add_argument("--force", action="store_true", help="忽略构建记录，重新执行所有选中的阶段")
+    parser.add_argument("--status-interval", type=float, default=60, help="状态表打印间隔（秒，默认: 60）")
+    parser.add_argument("--status-file", default=None, help="状态 JSON 路径（默认: 目录下 pipeline_status.json）")
+    parser.add_argument("--metrics-log", default=None, help="ffmpeg 运行指标日志路径（各阶段工具共用）")
+    parser.add_argument("--exclude-suffix", action="append", default=[],
+                        help="额外排除的输出视频后缀（如 resize_blend -s _small 的输出），可重复指定")
+    parser.add_argument("--video", default=None, help="只处理目录中的指定视频（队列任务使用）")
+    parser.add_argument("--enqueue", default=None, help="只把各视频的阶段任务写入指定的队列数据库，由 job_queue.py --worker 执行")
+    args = parser.parse_args()
+
+    try:
+        args.cover_min_size = tuple(map(int, args.cover_min_size.lower().split("x")))
+    except ValueError:
+        parser.error(f"无效的尺寸格式 - {args.cover_min_size}")
+    ffmpeg_runner.configure(args.metrics_log)
+
+    videos = [args.video] if args.video else list_videos(args.directory, args.exclude_suffix)
+    if not videos:
+        print(f"目录中未找到主视频文件: {args.directory}")
+        sys.exit(1)
+    if args.enqueue:
+        enqueue_stages(args.enqueue, videos, args.stages, sys.argv[1:])
+        sys.exit(0)
+    if args.video and not args.status_file:
+        # 单个视频（队列任务）的状态单独保存，避免多台 worker 覆盖同一个状态文件
+        status_dir = os.path.join(os.path.dirname(os.path.abspath(args.video)), ".pipeline_logs")
+        os.makedirs(status_dir, exist_ok=True)
+        args.status_file = os.path.join(status_dir, f"{os.path.splitext(os.path.basename(args.video))[0]}.status.json")
+    args.status_file = args.status_file or os.path.join(args.directory, "pipeline_status.json")
+    jobs = [VideoJob(video, args.audio_format, args.cover_dir) for video in videos]
+    limits = {"translate": args.translate_workers, "tts": args.tts_workers,
+              "blend": args.blend_workers, "cover": args.cover_workers}
+    Pipeline(jobs, args.stages, limits, args).run()
+    failed = [job for job in jobs if any(status in ("failed", "blocked") for status in job.status.values())]
+    sys.exit(1 if failed else 0)
@@ -1,48 +1,163 @@
 import os
+import json
+import tempfile
 import subprocess
 import argparse
 
-def resize_video(input_file, output_file, width, height, device='cpu'):
-    """使用FFMPEG调整视频尺寸，并支持指定设备加速"""
-    command = [
-        'ffmpeg',
-        '-i', input_file,
-        '-vf', f'scale={width}:{height}'
-    ]
-    # 根据设备选择编码器
+import ffmpeg_runner
+from chunked_encode import plan_chunks, encode_in_chunks, concat_input, chunk_workers, probe_duration
+
+def video_encoder_args(device):
+    """根据设备选择编码器"""
     if device == 'nvenc':
-        command.extend(['-c:v', 'h264_nvenc'])
+        return ['-c:v', 'h264_nvenc']
     elif device == 'qsv':
-        command.extend(['-c:v', 'h264_qsv'])
+        return ['-c:v', 'h264_qsv']
     elif device == 'amf':
-        command.extend(['-c:v', 'h264_amf'])
+        return ['-c:v', 'h264_amf']
     elif device == 'cpu':
-        command.extend(['-c:v', 'libx264'])
+        return ['-c:v', 'libx264']
     else:
         raise ValueError(f"Unsupported device: {device}")
-    
+
+# MP4 容器可直接复制的音频编码，其余重新编码为 AAC
+COPY_AUDIO_CODECS = {'aac', 'mp3', 'ac3', 'eac3', 'alac'}
+
+def probe_streams(input_file):
+    """用 ffprobe 一次读取所有流信息（JSON，只读容器头）"""
+    result = subprocess.run([
+        'ffprobe', '-v', 'error',
+        '-show_streams',
+        '-of', 'json',
+        input_file
+    ], check=True, stdout=subprocess.PIPE, text=True)
+    return json.loads(result.stdout).get('streams', [])
+
+def plan_resize(input_file, output_file, width, height, replace=False):
+    """根据流信息决定处理方式：skip（已是目标尺寸或输出已存在）/ transcode，并决定音频复制还是重新编码"""
+    plan = {'input': input_file, 'output': output_file, 'action': 'transcode', 'audio': 'none', 'video_index': None, 'reason': ''}
+    if not replace and os.path.exists(output_file):
+        plan.update(action='skip', reason='输出已存在')
+        return plan
+    try:
+        streams = probe_streams(input_file)
+    except subprocess.CalledProcessError:
+        plan.update(action='skip', reason='无法读取流信息')
+        return plan
+
+    video = next((s for s in streams if s.get('codec_type') == 'video'
+                  and not s.get('disposition', {}).get('attached_pic')), None)
+    audio = [s for s in streams if s.get('codec_type') == 'audio']
+    if video is None:
+        plan.update(action='skip', reason='没有视频流')
+        return plan
+    if (video.get('width'), video.get('height')) == (width, height):
+        plan.update(action='skip', reason=f'已是 {width}x{height}')
+        return plan
+    # 输出映射全部音轨：每条音轨都能直接放入MP4时才复制，否则统一重新编码
+    if audio:
+        plan['audio'] = 'copy' if all(s.get('codec_name') in COPY_AUDIO_CODECS for s in audio) else 'aac'
+    plan['video_index'] = video.get('index')
+    plan['reason'] = f"{video.get('width')}x{video.get('height')} -> {width}x{height}"
+    return plan
+
+def print_plan(plans):
+    print(f"{'文件':<40} {'操作':<10} {'音频':<6} 说明")
+    for plan in plans:
+        audio = plan['audio'] if plan['action'] == 'transcode' else '-'
+        print(f"{os.path.basename(plan['input']):<40} {plan['action']:<10} {audio:<6} {plan['reason']}")
+    counts = {action: sum(1 for plan in plans if plan['action'] == action) for action in ('skip', 'transcode')}
+    print(f"共 {len(plans)} 个文件：转码 {counts['transcode']}，跳过 {counts['skip']}")
+
+def audio_codec_args(audio):
+    if audio == 'copy':
+        return ['-c:a', 'copy']
+    if audio == 'none':
+        return ['-an']
     # 明确指定音频编码器
-    command.extend(['-c:a', 'aac'])
-    
-    command.append(output_file)
-    subprocess.run(command, check=True)
+    return ['-c:a', 'aac']
 
-def process_directory(directory, width, height, replace=False, suffix='_resized', device='cpu'):
-    """遍历目录，调整所有MP4文件的尺寸"""
-    for filename in os.listdir(directory):
-        if filename.endswith('.mp4'):
+def video_map(video_index):
+    """映射探测时选中的视频流（跳过封面等 attached_pic 流）；未探测时取第一条视频流"""
+    return f'0:{video_index}' if video_index is not None else '0:v:0'
+
+def resize_video(input_file, output_file, width, height, device='cpu', chunks=0, workers=None, audio='aac', video_index=None):
+    """使用FFMPEG调整视频尺寸，并支持指定设备加速；chunks > 1 时分段并行编码
+
+    输出先写入同目录的临时文件，成功后原子替换，输出路径与输入相同时也不会读写同一个文件。
+    """
+    if chunks > 1:
+        return resize_video_chunked(input_file, output_file, width, height, device, chunks, workers, audio, video_index)
+
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    fd, temp_file = tempfile.mkstemp(suffix=os.path.splitext(output_file)[1] or '.mp4', prefix='.resize_', dir=output_dir)
+    os.close(fd)
+    command = [
+        'ffmpeg', '-y',
+        '-i', input_file,
+        '-map', video_map(video_index), '-map', '0:a?',
+        '-vf', f'scale={width}:{height}'
+    ]
+    command.extend(video_encoder_args(device))
+    command.extend(audio_codec_args(audio))
+    command.append(temp_file)
+    try:
+        ffmpeg_runner.run_ffmpeg(command, step="resize", output=output_file, duration=probe_duration(input_file))
+        os.replace(temp_file, output_file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+def resize_video_chunked(input_file, output_file, width, height, device='cpu', chunks=4, workers=None, audio='aac', video_index=None):
+    """按关键帧分段，各段并行缩放编码（仅视频），拼接时复制视频流并对整个文件编码一次音频"""
+    segments = plan_chunks(input_file, chunks)
+    threads = max(1, (os.cpu_count() or 1) // min(len(segments), chunk_workers(workers)))
+
+    def build_chunk_command(start, end, chunk_path):
+        command = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', '-ss', f'{start:.3f}']
+        if end is not None:
+            command += ['-to', f'{end:.3f}']
+        command += ['-i', input_file, '-map', video_map(video_index), '-vf', f'scale={width}:{height}', '-an']
+        command += video_encoder_args(device)
+        if device == 'cpu':
+            command += ['-threads', str(threads)]
+        command.append(chunk_path)
+        return command
+
+    def build_concat_command(list_path, temp_output):
+        return ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+                *concat_input(list_path), '-i', input_file,
+                '-map', '0:v', '-map', '1:a?', '-c:v', 'copy', *audio_codec_args(audio),
+                temp_output]
+
+    encode_in_chunks(input_file, output_file, segments, build_chunk_command, build_concat_command, workers)
+
+def process_directory(directory, width, height, replace=False, suffix='_resized', device='cpu', chunks=0, workers=None):
+    """遍历目录，先探测并打印处理计划，再调整需要转码的MP4文件的尺寸"""
+    plans = []
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith('.mp4') and not filename.startswith('.'):
             input_file = os.path.join(directory, filename)
             if replace:
-                output_file = input_file  # 直接覆盖原始文件
+                output_file = input_file  # 直接覆盖原始文件（经临时文件原子替换）
             else:
                 # 使用可配置的后缀
                 base_name, ext = os.path.splitext(filename)
+                if suffix and base_name.endswith(suffix):
+                    continue  # 上次运行的输出
                 output_file = os.path.join(directory, f'{base_name}{suffix}{ext}')
-            try:
-                resize_video(input_file, output_file, width, height, device)
-                print(f'Processed: {filename}')
-            except subprocess.CalledProcessError as e:
-                print(f'Error processing {filename}: {e}')
+            plans.append(plan_resize(input_file, output_file, width, height, replace))
+
+    print_plan(plans)
+    for plan in plans:
+        if plan['action'] != 'transcode':
+            continue
+        filename = os.path.basename(plan['input'])
+        try:
+            resize_video(plan['input'], plan['output'], width, height, device, chunks, workers, plan['audio'], plan['video_index'])
+            print(f'Processed: {filename}')
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ffmpeg_runner.FfmpegCancelled) as e:
+            print(f'Error processing {filename}: {e}')
 
 if __name__ == '__main__':
     # 使用argparse设置命令行参数
@@ -55,11 +170,19 @@ if __name__ == '__main__':
     parser.add_argument('-s', '--suffix', default='_resized', help='新文件的自定义后缀（默认: _resized）')
     # 更新--device参数，增加对Intel和AMD加速的支持
     parser.add_argument('--device', choices=['cpu', 'nvenc', 'qsv', 'amf'], default='cpu', help='指定加速设备（cpu/nvenc/qsv/amf，默认: cpu）')
+    # 新增分段并行编码
+    parser.add_argument('--chunks', type=int, default=0, help='按关键帧切分为 N 段并行编码后无损拼接（默认: 0 不分段）')
+    parser.add_argument('--chunk-workers', type=int, default=None, help='分段编码并行进程数（默认: 核心数）')
+    # 新增 ffmpeg 运行指标
+    parser.add_argument('--metrics-log', default=None, help='ffmpeg 运行指标日志路径（JSON Lines，记录耗时、CPU、内存、fps）')
+    parser.add_argument('--ffmpeg-timeout', type=float, default=None, help='单次 ffmpeg 调用超时（秒，默认: 不限制）')
     
     args = parser.parse_args()
+    ffmpeg_runner.configure(args.metrics_log, args.ffmpeg_timeout)
     
     # 检查必填参数是否缺失
     if not args.directory or not args.width or not args.height:
         parser.error("Missing required arguments. Please provide --directory, --width, and --height.")
     
-    process_directory(args.directory, args.width, args.height, args.replace, args.suffix, args.device)  # 传递device参数
\ No newline at end of file
+    process_directory(args.directory, args.width, args.height, args.replace, args.suffix, args.device,
+                      args.chunks, args.chunk_workers)  # 传递device参数
\ No newline at end of file